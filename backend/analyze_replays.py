@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+牌谱批量决策分析脚本
+对已存储牌谱中玩家0的每次弃牌，比较实际弃牌与分析器推荐，
+逐局结果写入 ndjson 文件，汇总结果写入同名 .summary.json 文件。
+
+示例:
+    python analyze_replays.py --start 2025-06-01 --workers 8
+    python analyze_replays.py --player 小明 --output xiaoming_decisions.ndjson
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime
+
+from app.models.game_record import ReplayExportFilter
+from app.services.redis_service import RedisService
+from app.services.replay_service import ReplayService
+from app.services.replay_batch_analyzer import ReplayBatchAnalyzer
+
+
+def parse_time(value: str) -> datetime:
+    """解析命令行时间参数(支持日期或ISO时间)"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的时间格式: {value}")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="血战麻将牌谱批量决策分析工具")
+    parser.add_argument("--start", type=parse_time, help="开始时间下限，如 2025-06-11")
+    parser.add_argument("--end", type=parse_time, help="开始时间上限")
+    parser.add_argument("--player", help="只分析包含该玩家的牌谱")
+    parser.add_argument("--mode", help="只分析该游戏模式的牌谱")
+    parser.add_argument("--limit", type=int, help="最多分析的牌谱数量")
+    parser.add_argument("--workers", type=int, help="工作进程数量(默认为CPU核数)")
+    parser.add_argument("--output", help="逐局结果输出文件路径")
+    return parser.parse_args()
+
+
+async def run_analysis(args):
+    """执行批量分析"""
+    replay_service = ReplayService(RedisService())
+    analyzer = ReplayBatchAnalyzer(replay_service, workers=args.workers)
+
+    query = ReplayExportFilter(
+        start_time=args.start,
+        end_time=args.end,
+        player_name=args.player,
+        game_mode=args.mode,
+        limit=args.limit
+    )
+
+    output = args.output or f"decisions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson"
+    print(f"🧮 使用 {analyzer.workers} 个进程分析牌谱，逐局结果写入: {output}")
+
+    started = time.time()
+    summary = await analyzer.run(query, output)
+    elapsed = time.time() - started
+    summary["elapsed_seconds"] = round(elapsed, 2)
+    summary["games_per_hour"] = round(summary["games"] / elapsed * 3600) if elapsed > 0 else None
+
+    summary_path = output.rsplit(".", 1)[0] + ".summary.json"
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ 分析完成: {summary['games']} 局, {summary['decisions']} 次决策")
+    if summary["agreement_rate"] is not None:
+        print(f"📊 与推荐一致率: {summary['agreement_rate']:.1%}")
+    print(f"📁 汇总结果: {summary_path}")
+
+
+def main():
+    """主函数"""
+    print("🀄 血战麻将牌谱批量决策分析工具 🀄")
+    print("=" * 50)
+
+    args = parse_args()
+    try:
+        asyncio.run(run_analysis(args))
+    except KeyboardInterrupt:
+        print("\n👋 用户取消操作")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ 分析失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
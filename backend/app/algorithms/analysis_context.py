@@ -0,0 +1,171 @@
+"""
+增量分析上下文
+
+随牌的移动增量维护一名玩家的分析状态，不必每次从完整的 GameState 重新分析:
+- hand       手牌计数向量(副露不计入)
+- remaining  从该玩家视角每种牌的剩余数量(4 - 自己手牌 - 可见牌)
+- 每种花色当前的拆分结果，以及由此组合出的向听数
+
+摸牌、打牌只改变一种花色，只需重新取该花色的拆分(按花色计数缓存)再组合，
+进张和各弃牌的计算也只替换受影响花色的拆分。
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .shanten import (
+    TILE_KINDS, SuitOption, code_to_index, combine_shanten, index_to_code, suit_options
+)
+
+_SUIT_BASE = {"wan": 0, "tiao": 10, "tong": 20}
+
+
+def _tile_code(tile: Dict[str, Any]) -> int:
+    return _SUIT_BASE[tile["type"]] + tile["value"]
+
+
+def counts_from_state(state: Dict[str, Any], player_id: int = 0) -> Tuple[List[int], List[int]]:
+    """从游戏状态字典统计玩家手牌计数和其视角下已用掉的牌(与 GameState.calculate_remaining_tiles_by_type 一致)"""
+    hand = [0] * TILE_KINDS
+    used = [0] * TILE_KINDS
+    player_key = str(player_id)
+
+    for key, player_hand in state.get("player_hands", {}).items():
+        if key == player_key:
+            for tile in player_hand.get("tiles") or []:
+                hand[code_to_index(_tile_code(tile))] += 1
+        for meld in player_hand.get("melds", []):
+            if meld.get("type") == "gang" and meld.get("gang_type") == "an_gang" and key != player_key:
+                continue
+            for tile in meld.get("tiles", []):
+                used[code_to_index(_tile_code(tile))] += 1
+
+    for tile in state.get("discarded_tiles", []):
+        used[code_to_index(_tile_code(tile))] += 1
+
+    for index in range(TILE_KINDS):
+        used[index] += hand[index]
+    return hand, used
+
+
+class AnalysisContext:
+    """一名玩家的增量分析状态"""
+
+    def __init__(self, hand: Optional[Sequence[int]] = None, remaining: Optional[Sequence[int]] = None):
+        self.hand = list(hand) if hand is not None else [0] * TILE_KINDS
+        self.remaining = list(remaining) if remaining is not None else [4] * TILE_KINDS
+        self.tile_count = sum(self.hand)
+        self._suits: List[Tuple[SuitOption, ...]] = [suit_options(self._suit_counts(suit)) for suit in range(3)]
+        self._shanten: Optional[int] = None
+        # 重新拆分花色的次数，用于观察增量更新的效果
+        self.suit_updates = 0
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], player_id: int = 0) -> "AnalysisContext":
+        """从游戏状态字典创建"""
+        hand, used = counts_from_state(state, player_id)
+        return cls(hand, [max(0, 4 - count) for count in used])
+
+    def _suit_counts(self, suit: int, changes: Optional[Dict[int, int]] = None) -> Tuple[int, ...]:
+        counts = self.hand[suit * 9:suit * 9 + 9]
+        if changes:
+            for index, delta in changes.items():
+                if index // 9 == suit:
+                    counts[index % 9] += delta
+        return tuple(counts)
+
+    def _refresh_suit(self, suit: int):
+        self._suits[suit] = suit_options(self._suit_counts(suit))
+        self._shanten = None
+        self.suit_updates += 1
+
+    # ---- 牌的移动 ----
+
+    def draw(self, code: int):
+        """摸牌(或其他方式加入手牌): 手牌加一，剩余减一"""
+        index = code_to_index(code)
+        self.hand[index] += 1
+        self.remaining[index] = max(0, self.remaining[index] - 1)
+        self.tile_count += 1
+        self._refresh_suit(index // 9)
+
+    def discard(self, code: int):
+        """打出手牌: 牌仍然可见，剩余数量不变"""
+        index = code_to_index(code)
+        if self.hand[index] <= 0:
+            raise ValueError(f"手牌中没有 {code}")
+        self.hand[index] -= 1
+        self.tile_count -= 1
+        self._refresh_suit(index // 9)
+
+    def observe(self, code: int, count: int = 1):
+        """其他玩家的牌变为可见(弃牌、碰杠): 剩余减少"""
+        index = code_to_index(code)
+        self.remaining[index] = max(0, self.remaining[index] - count)
+
+    def sync(self, hand: Sequence[int], used: Sequence[int]) -> int:
+        """按新的手牌计数和已用牌数更新，只重新拆分手牌有变化的花色，返回更新的花色数"""
+        changed_suits = {index // 9 for index in range(TILE_KINDS) if hand[index] != self.hand[index]}
+        self.hand = list(hand)
+        self.tile_count = sum(self.hand)
+        self.remaining = [max(0, 4 - count) for count in used]
+        for suit in changed_suits:
+            self._refresh_suit(suit)
+        return len(changed_suits)
+
+    def sync_state(self, state: Dict[str, Any], player_id: int = 0) -> int:
+        """按游戏状态字典更新"""
+        return self.sync(*counts_from_state(state, player_id))
+
+    # ---- 分析 ----
+
+    @property
+    def shanten(self) -> int:
+        """当前手牌的向听数"""
+        if self._shanten is None:
+            self._shanten = combine_shanten(self._suits, self.tile_count)
+        return self._shanten
+
+    def _shanten_with(self, changes: Dict[int, int]) -> int:
+        """手牌按 changes(下标 -> 增减)变化后的向听数，只重新拆分受影响的花色"""
+        suits = list(self._suits)
+        for suit in {index // 9 for index in changes}:
+            suits[suit] = suit_options(self._suit_counts(suit, changes))
+        return combine_shanten(suits, self.tile_count + sum(changes.values()))
+
+    def ukeire(self, changes: Optional[Dict[int, int]] = None) -> Tuple[int, Dict[int, int]]:
+        """3n+1 张手牌(可先按 changes 变化)的向听数和进张(牌编码 -> 剩余张数)"""
+        changes = changes or {}
+        shanten = self._shanten_with(changes) if changes else self.shanten
+        tiles: Dict[int, int] = {}
+        for index in range(TILE_KINDS):
+            if self.remaining[index] <= 0 or self.hand[index] + changes.get(index, 0) >= 4:
+                continue
+            drawn = dict(changes)
+            drawn[index] = drawn.get(index, 0) + 1
+            if self._shanten_with(drawn) < shanten:
+                tiles[index_to_code(index)] = self.remaining[index]
+        return shanten, tiles
+
+    def discard_options(self) -> Dict[int, Dict[str, Any]]:
+        """3n+2 张手牌打出每种牌后的向听数和进张"""
+        options = {}
+        for index in range(TILE_KINDS):
+            if not self.hand[index]:
+                continue
+            shanten, tiles = self.ukeire({index: -1})
+            options[index_to_code(index)] = {
+                "shanten": shanten,
+                "ukeire": sum(tiles.values()),
+                "ukeire_tiles": tiles
+            }
+        return options
+
+    def efficiency(self) -> Dict[str, Any]:
+        """向听数和进张: 3n+2 张时按每种弃牌分别计算，3n+1 张时计算当前手牌"""
+        if self.tile_count % 3 != 2:
+            shanten, tiles = self.ukeire()
+            return {"shanten": shanten, "ukeire": sum(tiles.values()), "ukeire_tiles": tiles}
+
+        options = self.discard_options()
+        best = min(options, key=lambda code: (options[code]["shanten"], -options[code]["ukeire"]))
+        return {"shanten": self.shanten, "recommended_discard": best, "discards": options}
@@ -1,9 +1,26 @@
+import math
 import random
-from typing import List, Dict, Tuple, Set
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Set
 from collections import Counter, defaultdict
 import itertools
 
 from ..models.mahjong import Tile, GameState, AnalysisResult, TileType, Meld, MeldType
+from .analysis_context import AnalysisContext
+from .shanten import TILE_KINDS, calculate_shanten, code_to_index, counts_from_codes, index_to_code
+
+# 蒙特卡洛模拟参与比较的弃牌数量(按向听数和进张排序后的前几名)
+SIMULATION_CANDIDATES = 5
+# 每轮模拟每个候选弃牌的次数
+SIMULATION_BATCH_SIZE = 100
+# 胜率估计的标准误差低于该值时停止模拟
+SIMULATION_TARGET_ERROR = 0.01
+# 模拟的最大摸牌轮数
+SIMULATION_MAX_TURNS = 18
+# 有时间预算时的最大模拟次数(通常先到达截止时间或目标误差)
+ANYTIME_MAX_ROLLOUTS = 20000
+# 模拟次数达到该值后才以模拟结果替换向听数和进张的推荐
+ANYTIME_MIN_ROLLOUTS = 100
 
 
 class MahjongAnalyzer:
@@ -12,28 +29,91 @@ class MahjongAnalyzer:
     def __init__(self):
         self.simulation_count = 1000  # 蒙特卡洛模拟次数
     
-    def analyze_game_state(self, game_state: GameState, player_id: int) -> AnalysisResult:
-        """分析游戏状态并给出建议"""
-        if player_id not in game_state.player_hands:
-            return AnalysisResult(message="玩家不存在")
-        
-        hand = game_state.player_hands[player_id]
-        remaining_tiles = game_state.calculate_remaining_tiles()
-        
+    def analyze_game_state(self, game_state: GameState, player_id: int,
+                           deadline_ms: Optional[int] = None) -> AnalysisResult:
+        """分析游戏状态并给出建议，指定 deadline_ms 时在时间预算内逐步加深分析"""
+        hand = game_state.player_hands.get(str(player_id))
+        if hand is None or not hand.tiles:
+            return AnalysisResult(suggestions=["玩家不存在或没有已知手牌"])
+        
+        remaining_tiles = game_state.calculate_remaining_tiles_by_code()
+        if deadline_ms is None:
+            return self.analyze_hand(hand.tiles, remaining_tiles)
+        
+        turns = min(SIMULATION_MAX_TURNS, game_state.calculate_remaining_tiles() // 4)
+        return self.analyze_hand_anytime(hand.tiles, remaining_tiles, deadline_ms, turns)
+    
+    def analyze_hand_anytime(self, tiles: List[Tile], remaining_tiles: Dict[int, int],
+                             deadline_ms: int, turns: int) -> AnalysisResult:
+        """在时间预算内分析手牌，返回截止时最好的结果
+        
+        先完成启发式分析，时间允许时依次计算向听数和进张、蒙特卡洛模拟，
+        推荐弃牌取已完成的最深一层的结果，完成的工作量记录在 work 中。
+        """
+        start = time.monotonic()
+        deadline = start + deadline_ms / 1000
+        result = self.analyze_hand(tiles, remaining_tiles)
+        heuristic_discard = result.recommended_discard
+        stages = ["heuristic"]
+        rollouts = 0
+        candidates = 0
+        
+        if time.monotonic() < deadline:
+            efficiency = self.calculate_efficiency(tiles, remaining_tiles)
+            stages.append("efficiency")
+            result.shanten = efficiency["shanten"]
+            if efficiency.get("recommended_discard") is not None:
+                result.recommended_discard = Tile.from_code(efficiency["recommended_discard"])
+            
+            estimate = None
+            if time.monotonic() < deadline:
+                for estimate in self.iter_simulation(tiles, remaining_tiles, efficiency, turns,
+                                                     deadline=deadline, max_rollouts=ANYTIME_MAX_ROLLOUTS):
+                    pass
+            if estimate is not None:
+                stages.append("monte_carlo")
+                rollouts = estimate["rollouts"]
+                candidates = len(estimate["estimates"])
+                best = estimate["recommended_discard"]
+                if rollouts < ANYTIME_MIN_ROLLOUTS and result.recommended_discard is not None:
+                    # 模拟次数太少时结果不可靠，保留向听数和进张的推荐
+                    best = efficiency.get("recommended_discard", best)
+                result.simulated_win_rate = estimate["estimates"].get(best, {}).get("win_rate")
+                if best is not None:
+                    result.recommended_discard = Tile.from_code(best)
+        
+        if result.recommended_discard is not None and (
+                heuristic_discard is None or result.recommended_discard.to_code() != heuristic_discard.to_code()):
+            result.suggestions.append(f"综合向听数和模拟结果，建议弃牌：{result.recommended_discard}")
+        
+        elapsed = time.monotonic() - start
+        result.work = {
+            "deadline_ms": deadline_ms,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "deadline_reached": elapsed * 1000 >= deadline_ms,
+            "stages": stages,
+            "rollouts": rollouts,
+            "candidates": candidates,
+            "turns": turns
+        }
+        return result
+    
+    def analyze_hand(self, tiles: List[Tile], remaining_tiles: Dict[int, int]) -> AnalysisResult:
+        """分析手牌并给出建议(remaining_tiles 以牌编码为键)"""
         # 检测听牌
-        listen_tiles = self.detect_listen_tiles(hand.tiles)
+        listen_tiles = self.detect_listen_tiles(tiles)
         
         # 计算每张牌的弃牌分数
-        discard_scores = self.calculate_discard_scores(hand.tiles, remaining_tiles, listen_tiles)
+        discard_scores = self.calculate_discard_scores(tiles, remaining_tiles, listen_tiles)
         
         # 推荐弃牌
-        recommended_discard = self.get_recommended_discard(hand.tiles, discard_scores)
+        recommended_discard = self.get_recommended_discard(tiles, discard_scores)
         
         # 计算胡牌概率
-        win_probability = self.calculate_win_probability(hand.tiles, remaining_tiles, listen_tiles)
+        win_probability = self.calculate_win_probability(tiles, remaining_tiles, listen_tiles)
         
         # 生成建议
-        suggestions = self.generate_suggestions(hand.tiles, listen_tiles, discard_scores)
+        suggestions = self.generate_suggestions(tiles, listen_tiles, discard_scores)
         
         return AnalysisResult(
             recommended_discard=recommended_discard,
@@ -44,14 +124,150 @@ class MahjongAnalyzer:
             suggestions=suggestions
         )
     
+    def analyze_hand_compact(self, tiles: List[Tile], remaining_tiles: Dict[int, int]) -> Dict[str, Any]:
+        """analyze_hand 的推荐、弃牌分数、听牌和胡牌概率，牌均以牌编码表示"""
+        result = self.analyze_hand(tiles, remaining_tiles)
+        # 分数以牌名为键，转换为牌码
+        code_by_name = {str(tile): tile.to_code() for tile in tiles}
+        return {
+            "recommended_discard": result.recommended_discard.to_code() if result.recommended_discard else None,
+            "discard_scores": {code_by_name[name]: score for name, score in result.discard_scores.items()},
+            "listen_tiles": [tile.to_code() for tile in result.listen_tiles],
+            "win_probability": result.win_probability
+        }
+    
+    def iter_progressive_analysis(self, game_state: GameState, player_id: int) -> Iterator[Dict[str, Any]]:
+        """逐步细化的分析，每个阶段产出一份结果(牌均为牌编码):
+        
+        1. heuristic    启发式弃牌分数，计算量最小
+        2. efficiency   向听数和进张
+        3. monte_carlo  蒙特卡洛模拟胜率，每轮模拟后产出一次，误差足够小或达到模拟次数后结束
+        """
+        hand = game_state.player_hands.get(str(player_id))
+        if hand is None or not hand.tiles:
+            return
+        
+        tiles = hand.tiles
+        remaining_tiles = game_state.calculate_remaining_tiles_by_code()
+        
+        yield {"stage": "heuristic", **self.analyze_hand_compact(tiles, remaining_tiles)}
+        
+        efficiency = self.calculate_efficiency(tiles, remaining_tiles)
+        yield {"stage": "efficiency", **efficiency}
+        
+        turns = min(SIMULATION_MAX_TURNS, game_state.calculate_remaining_tiles() // 4)
+        for estimate in self.iter_simulation(tiles, remaining_tiles, efficiency, turns):
+            yield {"stage": "monte_carlo", **estimate}
+    
+    def calculate_efficiency(self, tiles: List[Tile], remaining_tiles: Dict[int, int]) -> Dict[str, Any]:
+        """计算向听数和进张: 3n+2 张时按每种弃牌分别计算，3n+1 张时计算当前手牌"""
+        counts = counts_from_codes(tile.to_code() for tile in tiles)
+        remaining = [remaining_tiles.get(index_to_code(index), 0) for index in range(TILE_KINDS)]
+        return AnalysisContext(counts, remaining).efficiency()
+    
+    def iter_simulation(self, tiles: List[Tile], remaining_tiles: Dict[int, int],
+                        efficiency: Dict[str, Any], turns: int,
+                        rng: Optional[random.Random] = None, deadline: Optional[float] = None,
+                        max_rollouts: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """蒙特卡洛模拟: 从剩余牌中随机摸牌，按向听数贪心弃牌，统计 turns 轮内胡牌的比例
+        
+        3n+2 张时比较向听数和进张最好的几种弃牌，3n+1 张时模拟当前手牌(候选键为 None)。
+        每轮模拟后产出当前估计，直到标准误差低于目标、达到 max_rollouts 次
+        (默认 simulation_count)或到达截止时间 deadline(time.monotonic() 时间)。
+        """
+        rng = rng or random.Random()
+        counts = counts_from_codes(tile.to_code() for tile in tiles)
+        wall = [
+            index
+            for index in range(TILE_KINDS)
+            for _ in range(remaining_tiles.get(index_to_code(index), 0))
+        ]
+        turns = min(turns, len(wall))
+        
+        if "discards" in efficiency:
+            options = efficiency["discards"]
+            ranked = sorted(options, key=lambda code: (options[code]["shanten"], -options[code]["ukeire"]))
+            candidates: List[Optional[int]] = ranked[:SIMULATION_CANDIDATES]
+        else:
+            candidates = [None]
+        
+        hands = {}
+        for candidate in candidates:
+            hand = list(counts)
+            if candidate is not None:
+                hand[code_to_index(candidate)] -= 1
+            hands[candidate] = hand
+        
+        max_rollouts = max_rollouts or self.simulation_count
+        wins = {candidate: 0 for candidate in candidates}
+        rollouts = 0
+        while rollouts < max_rollouts:
+            # 各候选轮流模拟，截止时各候选的模拟次数相同
+            expired = False
+            batch_end = min(rollouts + SIMULATION_BATCH_SIZE, max_rollouts)
+            while rollouts < batch_end:
+                if deadline is not None and time.monotonic() >= deadline:
+                    expired = True
+                    break
+                for candidate in candidates:
+                    if self._rollout(hands[candidate], wall, turns, rng):
+                        wins[candidate] += 1
+                rollouts += 1
+            if not rollouts:
+                break
+            
+            estimates = {}
+            max_error = 0.0
+            for candidate in candidates:
+                rate = wins[candidate] / rollouts
+                error = math.sqrt(rate * (1 - rate) / rollouts)
+                max_error = max(max_error, error)
+                estimates[candidate] = {"win_rate": rate, "stderr": error}
+            
+            finished = expired or max_error < SIMULATION_TARGET_ERROR or rollouts >= max_rollouts
+            yield {
+                "rollouts": rollouts,
+                "turns": turns,
+                "recommended_discard": max(candidates, key=lambda candidate: wins[candidate]),
+                "estimates": estimates,
+                "final": finished
+            }
+            if finished:
+                break
+    
+    def _rollout(self, counts: Sequence[int], wall: List[int], turns: int, rng: random.Random) -> bool:
+        """模拟一次: 3n+1 张手牌在 turns 次摸牌内是否胡牌"""
+        if not turns:
+            return False
+        hand = list(counts)
+        shanten = calculate_shanten(hand)
+        for drawn in rng.sample(wall, turns):
+            hand[drawn] += 1
+            new_shanten = calculate_shanten(hand)
+            if new_shanten < 0:
+                return True
+            if new_shanten >= shanten:
+                # 摸到的牌没有改善手牌，直接打出
+                hand[drawn] -= 1
+                continue
+            
+            # 打出一张不影响改善后向听数的牌
+            for index in range(TILE_KINDS):
+                if hand[index] and index != drawn:
+                    hand[index] -= 1
+                    if calculate_shanten(hand) == new_shanten:
+                        break
+                    hand[index] += 1
+            shanten = new_shanten
+        return False
+    
     def detect_listen_tiles(self, tiles: List[Tile]) -> List[Tile]:
         """检测听牌"""
         listen_tiles = []
         
         # 检查每种可能的牌，看是否能组成胡牌
         for tile_type in TileType:
-            max_value = 7 if tile_type == TileType.ZI else 9
-            for value in range(1, max_value + 1):
+            for value in range(1, 10):
                 test_tile = Tile(type=tile_type, value=value)
                 test_hand = tiles + [test_tile]
                 
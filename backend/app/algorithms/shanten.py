@@ -0,0 +1,112 @@
+"""
+向听数与进张计算
+
+手牌以长度27的计数向量表示，下标为 花色序号*9 + 点数-1(万、条、筒)。
+每种花色独立拆分为面子、搭子和雀头，拆分结果按该花色的计数缓存，
+整手牌的向听数只需组合三种花色的拆分结果。
+
+向听数: -1 为已胡牌，0 为听牌。只计算标准牌型(n组面子 + 1对雀头)，
+与 MahjongAnalyzer.is_winning_hand 的判定一致。
+"""
+
+from functools import lru_cache
+from typing import Iterable, List, Sequence, Tuple
+
+# (面子数, 搭子数, 是否含雀头)
+SuitOption = Tuple[int, int, int]
+
+TILE_KINDS = 27
+
+
+def code_to_index(code: int) -> int:
+    """牌编码(万1-9、条11-19、筒21-29)转换为计数向量下标"""
+    return (code // 10) * 9 + code % 10 - 1
+
+
+def index_to_code(index: int) -> int:
+    """计数向量下标转换为牌编码"""
+    return (index // 9) * 10 + index % 9 + 1
+
+
+def counts_from_codes(codes: Iterable[int]) -> List[int]:
+    """由牌编码列表生成计数向量"""
+    counts = [0] * TILE_KINDS
+    for code in codes:
+        counts[code_to_index(code)] += 1
+    return counts
+
+
+def _prune(options: Iterable[SuitOption]) -> Tuple[SuitOption, ...]:
+    """去掉被其他拆分完全优于的拆分"""
+    unique = set(options)
+    return tuple(sorted(
+        option for option in unique
+        if not any(
+            other != option and other[0] >= option[0] and other[0] + other[1] >= option[0] + option[1]
+            and other[1] >= option[1] and other[2] >= option[2]
+            for other in unique
+        )
+    ))
+
+
+@lru_cache(maxsize=None)
+def suit_options(counts: Tuple[int, ...]) -> Tuple[SuitOption, ...]:
+    """单一花色(9种牌的计数)的全部非劣拆分"""
+    start = next((i for i, count in enumerate(counts) if count), None)
+    if start is None:
+        return ((0, 0, 0),)
+
+    options = []
+    rest = list(counts)
+
+    def recurse(removed: Sequence[int], melds: int, partials: int, pair: int):
+        for index in removed:
+            rest[index] -= 1
+        for m, t, p in suit_options(tuple(rest)):
+            if not (pair and p):
+                options.append((m + melds, t + partials, p | pair))
+        for index in removed:
+            rest[index] += 1
+
+    i = start
+    if counts[i] >= 3:
+        recurse((i, i, i), 1, 0, 0)
+    if i <= 6 and counts[i + 1] and counts[i + 2]:
+        recurse((i, i + 1, i + 2), 1, 0, 0)
+    if counts[i] >= 2:
+        recurse((i, i), 0, 0, 1)
+        recurse((i, i), 0, 1, 0)
+    if i <= 7 and counts[i + 1]:
+        recurse((i, i + 1), 0, 1, 0)
+    if i <= 6 and counts[i + 2]:
+        recurse((i, i + 2), 0, 1, 0)
+    # 作为孤张
+    recurse((i,), 0, 0, 0)
+    return _prune(options)
+
+
+def combine_shanten(suits: Sequence[Tuple[SuitOption, ...]], tile_count: int) -> int:
+    """组合三种花色的拆分结果计算向听数"""
+    sets_needed = tile_count // 3
+    best = 2 * sets_needed
+
+    for m1, t1, p1 in suits[0]:
+        for m2, t2, p2 in suits[1]:
+            if p1 and p2:
+                continue
+            for m3, t3, p3 in suits[2]:
+                pair = p1 + p2 + p3
+                if pair > 1:
+                    continue
+                melds = m1 + m2 + m3
+                partials = min(t1 + t2 + t3, sets_needed - melds) if melds < sets_needed else 0
+                shanten = 2 * (sets_needed - min(melds, sets_needed)) - partials - pair
+                if shanten < best:
+                    best = shanten
+    return best
+
+
+def calculate_shanten(counts: Sequence[int]) -> int:
+    """计算向听数(手牌张数为 3n+1 或 3n+2，副露已从手牌中去除)"""
+    suits = [suit_options(tuple(counts[suit * 9:suit * 9 + 9])) for suit in range(3)]
+    return combine_shanten(suits, sum(counts))
@@ -1,30 +1,94 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Literal, Optional
+import asyncio
 import json
+import uuid
 from datetime import datetime
 
 from ..models.mahjong import (
     GameRequest, GameResponse, GameState, Tile, TileType, 
     TileOperationRequest, GameOperationResponse, GameStateRequest, 
-    ResetGameResponse, GangType
+    ResetGameResponse, GangType, BatchOperationRequest, BatchOperationResponse,
+    BatchOperationResult, BatchAnalysisRequest
 )
 from ..algorithms.mahjong_analyzer import MahjongAnalyzer
-# from ..services.game_manager import GameManager  # WebSocket已移除
+from ..services.game_manager import GameManager
+from ..services.game_event_bridge import GameEventBridge
+from ..services.redis_service import redis_service
+from ..core.config import settings
 from ..services.mahjong_game_service import MahjongGameService
+from ..services.state_sync import patch_message, snapshot_message
+from ..services.frame_codec import negotiate_format, decode_frame
+from ..services.position_analysis import PositionBatchAnalyzer
+from ..services.analysis_coalescer import SingleFlight, analysis_key
+from ..services.speculative_analysis import SpeculativeAnalyzer
 
 router = APIRouter(tags=["mahjong"])
 
 # 创建全局实例
 analyzer = MahjongAnalyzer()
-# game_manager = GameManager()  # WebSocket已移除
+game_manager = GameManager()
 game_service = MahjongGameService()
+position_analyzer = PositionBatchAnalyzer(
+    workers=settings.ANALYSIS_POOL_WORKERS or None,
+    chunk_size=settings.ANALYSIS_BATCH_CHUNK_SIZE
+)
+analysis_flight = SingleFlight()
+speculative_analyzer = SpeculativeAnalyzer(
+    MahjongAnalyzer(), player_id=0, deadline_ms=settings.ANALYSIS_SPECULATIVE_DEADLINE_MS or None
+)
+
+# 每次保存状态后将增量推送给订阅该局的客户端
+game_service.sync.add_listener(game_manager.publish_state_change)
+# 轮到玩家0出牌时在后台预先分析
+if settings.ANALYSIS_SPECULATIVE_ENABLED:
+    game_service.sync.add_listener(
+        lambda game_id, version, ops: speculative_analyzer.on_state_change(version, game_service.sync.snapshot)
+    )
+# 发送积压的客户端改为接收最新快照
+game_manager.set_resync_provider(
+    lambda game_id: snapshot_message(game_service.get_state_version(), game_service.get_game_state())
+)
+
+
+def _on_remote_messages(game_id: str, messages: List[dict]):
+    """其他工作进程的状态变更: 同步本进程的游戏状态并转发给本地客户端"""
+    for message in messages:
+        if message.get("type") == "patch" and not game_service.apply_remote_change(message["version"], message["ops"]):
+            # 版本不连续，已从Redis重新加载，本地客户端改为接收快照
+            game_manager.relay_remote(game_id, [
+                snapshot_message(game_service.get_state_version(), game_service.get_game_state())
+            ])
+            return
+    game_manager.relay_remote(game_id, messages)
+
+
+# 多工作进程部署时经Redis转发状态变更(在应用启动时启动)
+event_bridge = GameEventBridge(redis_service, _on_remote_messages, settings.WS_PUBSUB_BATCH_WINDOW)
+game_manager.set_bridge(event_bridge)
 
 
 @router.post("/analyze", response_model=GameResponse)
 async def analyze_game(request: GameRequest):
     """分析游戏状态并返回建议"""
     try:
-        analysis = analyzer.analyze_game_state(request.game_state, request.target_player)
+        # 后台已按相同时间预算(包括不指定预算的快速分析)分析过该局面时直接返回
+        if (request.target_player == speculative_analyzer.player_id
+                and speculative_analyzer.covers(request.deadline_ms)):
+            analysis = speculative_analyzer.lookup(
+                analysis_key(request.game_state, request.target_player, request.deadline_ms)
+            )
+            if analysis is not None:
+                return GameResponse(success=True, analysis=analysis, message="分析完成")
+        
+        # 相同局面的并发请求共享一次分析
+        analysis = await analysis_flight.do(
+            analysis_key(request.game_state, request.target_player, request.deadline_ms),
+            lambda: asyncio.to_thread(
+                analyzer.analyze_game_state, request.game_state, request.target_player, request.deadline_ms
+            )
+        )
         
         return GameResponse(
             success=True,
@@ -35,6 +99,77 @@ async def analyze_game(request: GameRequest):
         raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
 
 
+@router.get("/analyze/metrics")
+async def get_analyze_metrics():
+    """获取分析请求合并和后台分析统计"""
+    return {
+        "success": True,
+        "metrics": analysis_flight.get_metrics(),
+        "speculative": speculative_analyzer.get_metrics()
+    }
+
+
+@router.get("/analyze/current")
+async def analyze_current():
+    """当前游戏中玩家0的向听数和进张(由增量分析状态直接给出)"""
+    try:
+        context = game_service.analysis_context
+        return {
+            "success": True,
+            "version": game_service.get_state_version(),
+            "tile_count": context.tile_count,
+            **context.efficiency()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
+
+
+@router.post("/analyze/stream")
+async def analyze_game_stream(request: GameRequest, http_request: Request):
+    """逐步细化的分析结果(Server-Sent Events)
+    
+    依次推送 heuristic、efficiency 和多次 monte_carlo 事件，最后推送 done。
+    每个阶段在线程中计算，阶段之间检查客户端是否已断开，断开后停止计算。
+    """
+    stages = analyzer.iter_progressive_analysis(request.game_state, request.target_player)
+    
+    async def event_stream():
+        try:
+            while True:
+                try:
+                    result = await asyncio.to_thread(next, stages, None)
+                except Exception as e:
+                    yield f"event: error\ndata: {json.dumps({'detail': f'分析失败: {str(e)}'}, ensure_ascii=False)}\n\n"
+                    return
+                if result is None:
+                    break
+                yield f"event: {result['stage']}\ndata: {json.dumps(result, ensure_ascii=False)}\n\n"
+                if await http_request.is_disconnected():
+                    return
+            yield "event: done\ndata: {}\n\n"
+        finally:
+            try:
+                stages.close()
+            except ValueError:
+                # 阶段仍在线程中计算，完成后随生成器一起释放
+                pass
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/analyze/batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """批量分析紧凑局面，每个局面一行结果(NDJSON，按完成顺序流式输出)"""
+    return StreamingResponse(
+        position_analyzer.stream(request.positions),
+        media_type="application/x-ndjson"
+    )
+
+
 @router.post("/create-tile")
 async def create_tile(tile_type: str, value: int):
     """创建麻将牌"""
@@ -71,18 +206,49 @@ async def get_tile_codes():
 
 # ============ 游戏操作 API ============
 
+class StateProjection:
+    """变更接口的状态投影(state 查询参数)
+    
+    - full:  返回完整 game_state(默认，兼容旧客户端)
+    - none:  只返回版本号
+    - delta: 返回本次请求前后的增量(patch)，变更日志不足时退回完整状态
+    """
+    
+    def __init__(
+        self,
+        state: Literal["full", "none", "delta"] = Query("full", description="响应中包含的游戏状态: full/none/delta")
+    ):
+        self.mode = state
+        # 依赖在接口执行前解析，记录变更前的版本
+        self.base_version = game_service.get_state_version()
+    
+    def fields(self) -> Dict:
+        """生成响应中的状态字段"""
+        version = game_service.get_state_version()
+        if self.mode == "none":
+            return {"version": version}
+        if self.mode == "delta":
+            changes = game_service.sync.changes_since(self.base_version)
+            if changes is not None:
+                return {
+                    "version": version,
+                    "base_version": self.base_version,
+                    "patch": [op for _, ops in changes for op in ops]
+                }
+        return {"game_state": game_service.get_game_state(), "version": version}
+
+
 @router.post("/operation", response_model=GameOperationResponse)
-async def perform_tile_operation(request: TileOperationRequest):
+async def perform_tile_operation(request: TileOperationRequest, projection: StateProjection = Depends()):
     """执行麻将牌操作（添加手牌、弃牌、碰牌、杠牌等）"""
     try:
         success, message = game_service.process_operation(request)
         
         if success:
-            current_state = game_service.get_game_state()
             return GameOperationResponse(
                 success=True,
                 message=message,
-                game_state=current_state
+                **projection.fields()
             )
         else:
             return GameOperationResponse(
@@ -94,22 +260,88 @@ async def perform_tile_operation(request: TileOperationRequest):
         raise HTTPException(status_code=500, detail=f"操作失败: {str(e)}")
 
 
+def _state_etag(version: int, analysis_ready: bool = False) -> str:
+    """状态的ETag(游戏ID + 版本号，后台分析已完成时加 :a)，分析完成后条件请求能拿到分析结果"""
+    suffix = ":a" if analysis_ready else ""
+    return f'"{game_service.get_game_state().get("game_id")}:{version}{suffix}"'
+
+
+@router.post("/operations/batch", response_model=BatchOperationResponse)
+async def perform_batch_operations(request: BatchOperationRequest, projection: StateProjection = Depends()):
+    """按顺序批量执行牌操作，全部操作完成后只保存和推送一次
+    
+    atomic=true(默认)时任一操作失败则整批回滚。适用于发牌等连续操作，一次请求代替逐张调用。
+    """
+    try:
+        all_success, results = game_service.process_operations(request.operations, request.atomic)
+        succeeded = sum(1 for success, _ in results if success)
+        
+        if all_success:
+            message = f"批量操作成功，共{len(results)}项"
+        elif request.atomic:
+            message = "批量操作失败，已回滚全部操作"
+        else:
+            message = f"批量操作部分成功: {succeeded}/{len(results)}项"
+        
+        return BatchOperationResponse(
+            success=all_success,
+            message=message,
+            results=[
+                BatchOperationResult(index=i, success=success, message=item_message)
+                for i, (success, item_message) in enumerate(results)
+            ],
+            **projection.fields()
+        )
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批量操作失败: {str(e)}")
+
+
 @router.get("/game-state", response_model=GameOperationResponse)
-async def get_current_game_state():
-    """获取当前游戏状态"""
+async def get_current_game_state(
+    request: Request,
+    response: Response,
+    since_version: Optional[int] = Query(None, ge=0, description="只返回该版本之后的增量")
+):
+    """获取当前游戏状态
+    
+    支持 If-None-Match 条件请求，状态未变化且后台分析结果没有新完成时返回304。
+    携带 since_version 时返回该版本之后的增量(patch)，变更日志不足时返回完整状态。
+    """
     try:
+        version = game_service.get_state_version()
+        analysis = speculative_analyzer.result_for_version(version)
+        etag = _state_etag(version, analysis is not None)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        
+        if since_version is not None:
+            changes = game_service.sync.changes_since(since_version)
+            if changes is not None:
+                return GameOperationResponse(
+                    success=True,
+                    message="获取状态增量成功",
+                    version=version,
+                    base_version=since_version,
+                    patch=[op for _, ops in changes for op in ops],
+                    analysis=analysis
+                )
+        
         current_state = game_service.get_game_state()
         return GameOperationResponse(
             success=True,
             message="获取游戏状态成功",
-            game_state=current_state
+            game_state=current_state,
+            version=version,
+            analysis=analysis
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取游戏状态失败: {str(e)}")
 
 
 @router.post("/set-game-state", response_model=GameOperationResponse)
-async def set_game_state(request: GameStateRequest):
+async def set_game_state(request: GameStateRequest, projection: StateProjection = Depends()):
     """设置游戏状态"""
     try:
         success = game_service.set_game_state(request.game_state)
@@ -118,7 +350,7 @@ async def set_game_state(request: GameStateRequest):
             return GameOperationResponse(
                 success=True,
                 message="设置游戏状态成功",
-                game_state=game_service.get_game_state()
+                **projection.fields()
             )
         else:
             return GameOperationResponse(
@@ -131,18 +363,15 @@ async def set_game_state(request: GameStateRequest):
 
 
 @router.post("/reset")
-async def reset_game():
+async def reset_game(projection: StateProjection = Depends()):
     """重置游戏状态"""
     try:
         game_service.reset_game()
-        current_state = game_service.get_game_state()
-        
-        # 游戏状态已更新，前端可通过API获取
         
         return {
             "success": True,
             "message": "游戏重置成功",
-            "game_state": current_state
+            **projection.fields()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"重置游戏失败: {str(e)}")
@@ -155,7 +384,8 @@ async def reset_game():
 async def discard_tile(
     player_id: int,
     tile_type: str,
-    tile_value: int
+    tile_value: int,
+    projection: StateProjection = Depends()
 ):
     """弃牌操作"""
     try:
@@ -173,15 +403,10 @@ async def discard_tile(
         success, message = game_service.process_operation(request)
         
         if success:
-            # 获取更新后的游戏状态
-            current_state = game_service.get_game_state()
-            
-            # 游戏状态已更新，前端可通过API获取
-            
             return {
                 "success": True,
                 "message": message,
-                "game_state": current_state
+                **projection.fields()
             }
         else:
             return {
@@ -397,8 +622,7 @@ async def get_api_info():
 async def get_connections():
     """获取所有已连接的客户端和游戏信息"""
     try:
-        # WebSocket已移除，返回空的客户端列表
-        clients = []
+        clients = game_manager.get_connected_clients()
         
         # 获取所有活跃的游戏
         games = []
@@ -450,7 +674,8 @@ async def set_test_mode(enabled: bool = True):
 @router.post("/set-missing-suit")
 async def set_missing_suit(
     player_id: int,
-    missing_suit: str
+    missing_suit: str,
+    projection: StateProjection = Depends()
 ):
     """设置玩家定缺花色"""
     try:
@@ -482,22 +707,12 @@ async def set_missing_suit(
         success = game_service.set_game_state_dict(current_state)
         
         if success:
-            # WebSocket已移除，不再广播
-            # await game_manager.broadcast({
-            #     "type": "missing_suit_update",
-            #     "data": {
-            #         "player_id": player_id,
-            #         "missing_suit": missing_suit,
-            #         "game_state": current_state
-            #     }
-            # })
-            
             return {
                 "success": True,
                 "message": f"玩家{player_id}定缺设置成功: {missing_suit}",
                 "player_id": player_id,
                 "missing_suit": missing_suit,
-                "game_state": current_state
+                **projection.fields()
             }
         else:
             return {
@@ -530,7 +745,7 @@ async def get_missing_suits():
 
 
 @router.post("/reset-missing-suits")
-async def reset_missing_suits():
+async def reset_missing_suits(projection: StateProjection = Depends()):
     """重置所有玩家的定缺"""
     try:
         current_state = game_service.get_game_state()
@@ -548,7 +763,7 @@ async def reset_missing_suits():
             return {
                 "success": True,
                 "message": "所有玩家定缺已重置",
-                "game_state": current_state
+                **projection.fields()
             }
         else:
             return {
@@ -626,7 +841,7 @@ async def export_game_record():
 
 
 @router.post("/import-game-record")
-async def import_game_record(request: dict):
+async def import_game_record(request: dict, projection: StateProjection = Depends()):
     """导入游戏牌谱"""
     try:
         game_record = request.get("game_record")
@@ -671,7 +886,7 @@ async def import_game_record(request: dict):
         return {
             "success": True,
             "message": f"牌谱导入成功，共导入{len(actions)}个操作",
-            "game_state": game_service.get_game_state()
+            **projection.fields()
         }
         
     except Exception as e:
@@ -681,7 +896,7 @@ async def import_game_record(request: dict):
 # ============ 游戏流程控制 API ============
 
 @router.post("/set-current-player")
-async def set_current_player(player_id: int):
+async def set_current_player(player_id: int, projection: StateProjection = Depends()):
     """设置当前轮到操作的玩家"""
     try:
         if player_id < 0 or player_id > 3:
@@ -707,7 +922,7 @@ async def set_current_player(player_id: int):
                 "success": True,
                 "message": f"当前玩家已切换为: {player_names[player_id]}",
                 "current_player": player_id,
-                "game_state": current_state
+                **projection.fields()
             }
         else:
             return {
@@ -720,7 +935,7 @@ async def set_current_player(player_id: int):
 
 
 @router.post("/next-player")
-async def next_player():
+async def next_player(projection: StateProjection = Depends()):
     """切换到下一个玩家"""
     try:
         # 获取当前游戏状态
@@ -743,7 +958,7 @@ async def next_player():
                 "message": f"轮到下一个玩家: {player_names[next_player_id]}",
                 "previous_player": current_player,
                 "current_player": next_player_id,
-                "game_state": current_state
+                **projection.fields()
             }
         else:
             return {
@@ -761,7 +976,8 @@ async def player_win(
     win_type: str,  # "zimo" 或 "dianpao"
     win_tile_type: Optional[str] = None,
     win_tile_value: Optional[int] = None,
-    dianpao_player_id: Optional[int] = None
+    dianpao_player_id: Optional[int] = None,
+    projection: StateProjection = Depends()
 ):
     """玩家胡牌（自摸或点炮）"""
     try:
@@ -801,7 +1017,7 @@ async def player_win(
         return {
             "success": True,
             "message": f"{player_names[player_id]}胜利标识设置成功",
-            "game_state": current_state
+            **projection.fields()
         }
         
     except Exception as e:
@@ -809,7 +1025,7 @@ async def player_win(
 
 
 @router.post("/reveal-all-hands")
-async def reveal_all_hands():
+async def reveal_all_hands(projection: StateProjection = Depends()):
     """牌局结束后显示所有玩家手牌"""
     try:
         current_state = game_service.get_game_state()
@@ -825,12 +1041,70 @@ async def reveal_all_hands():
         return {
             "success": True,
             "message": "已显示所有玩家手牌",
-            "game_state": current_state
+            **projection.fields()
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"显示所有手牌失败: {str(e)}")
 
 
-# ============ HTTP API 连接 ============
-# WebSocket 功能已移除，现在只使用 HTTP API
\ No newline at end of file
+# ============ 状态推送 WebSocket ============
+
+async def _send_state_sync(client_id: str, version: Optional[int]):
+    """向客户端补发 version 之后的增量，无法补发时下发完整快照"""
+    changes = game_service.sync.changes_since(version) if version is not None else None
+    if changes is None:
+        await game_manager.send_to_client(
+            client_id, snapshot_message(game_service.get_state_version(), game_service.get_game_state())
+        )
+        return
+    
+    game_id = game_service.get_game_state().get("game_id")
+    for change_version, ops in changes:
+        await game_manager.send_to_client(client_id, patch_message(game_id, change_version, ops))
+
+
+@router.websocket("/game/{game_id}")
+async def game_state_channel(
+    websocket: WebSocket,
+    game_id: str,
+    version: Optional[int] = None,
+    frame_format: Optional[str] = Query(None, alias="format")
+):
+    """游戏状态推送通道
+    
+    连接后下发完整快照(携带 version 参数时只补发之后的增量)，之后每次状态变更推送增量。
+    game_id 可以为 current 表示当前游戏。format=msgpack 时使用二进制帧(见 frame_codec)，
+    服务端未安装 msgpack 时仍使用JSON文本帧。客户端消息(文本或二进制帧):
+    - {"type": "resume", "version": n}  从版本n重新同步(发现版本不连续时使用)
+    - {"type": "ping"}                  保活
+    服务端消息为 snapshot、patch，或其他工作进程合并转发的 batch(messages 为按序的 patch 列表)。
+    """
+    current_game_id = game_service.get_game_state().get("game_id")
+    if game_id not in ("current", current_game_id):
+        await websocket.close(code=4404)
+        return
+    
+    await websocket.accept()
+    client_id = str(uuid.uuid4())
+    await game_manager.add_client(client_id, websocket, negotiate_format(frame_format))
+    game_manager.join_room(current_game_id, client_id)
+    
+    try:
+        await _send_state_sync(client_id, version)
+        while True:
+            received = await websocket.receive()
+            if received["type"] == "websocket.disconnect":
+                break
+            message = decode_frame(received.get("bytes") if received.get("bytes") is not None else received.get("text"))
+            message_type = message.get("type")
+            if message_type == "resume":
+                await _send_state_sync(client_id, message.get("version"))
+            elif message_type == "ping":
+                await game_manager.send_to_client(client_id, {"type": "pong", "version": game_service.get_state_version()})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"客户端 {client_id} 状态通道异常: {e}")
+    finally:
+        game_manager.remove_client(client_id)
\ No newline at end of file
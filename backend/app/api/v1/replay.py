@@ -1,19 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
 from fastapi.responses import StreamingResponse
 from typing import List, Optional
-import io
+from datetime import datetime
 
-from app.models.game_record import GameRecord, GameReplay
+from app.models.game_record import (
+    GameRecord, GameReplay, ReplayBatchExportRequest, ReplayExportFilter, ReplayQuery
+)
 from app.models.response import ApiResponse
 from app.services.replay_service import ReplayService
-from app.services.redis_service import RedisService
+from app.services.share_service import ShareService
 
 router = APIRouter()
 
-async def get_replay_service():
-    """获取牌谱服务实例"""
-    redis_service = RedisService()
-    return ReplayService(redis_service)
+async def get_replay_service(request: Request) -> ReplayService:
+    """获取应用启动时创建的共享牌谱服务实例"""
+    return request.app.state.replay_service
+
+async def get_share_service(request: Request) -> ShareService:
+    """获取应用启动时创建的共享分享服务实例"""
+    return request.app.state.share_service
+
+# 需在 /{game_id} 之前注册，否则 "list" 会被当作游戏ID
+@router.get("/list")
+async def list_recent_games(
+    limit: int = Query(20, ge=1, le=100, description="返回记录数量"),
+    replay_service: ReplayService = Depends(get_replay_service)
+):
+    """获取最近的游戏记录列表"""
+    try:
+        summaries = await replay_service.list_recent_summaries(limit)
+        recent_games = [summary.to_list_item() for summary in summaries]
+        
+        return ApiResponse(
+            success=True,
+            data=recent_games,
+            message=f"获取到 {len(recent_games)} 条游戏记录"
+        )
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取游戏列表失败: {str(e)}")
 
 @router.get("/{game_id}", response_model=ApiResponse[GameReplay])
 async def get_game_replay(
@@ -35,20 +60,77 @@ async def get_game_replay(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取牌谱失败: {str(e)}")
 
+@router.get("/{game_id}/state")
+async def get_replay_state(
+    game_id: str,
+    seq: int = Query(..., ge=0, description="操作序号，0表示起手状态"),
+    replay_service: ReplayService = Depends(get_replay_service)
+):
+    """获取回放到指定操作序号时的牌局状态"""
+    try:
+        state = await replay_service.get_replay_state(game_id, seq)
+
+        return ApiResponse(
+            success=True,
+            data=state,
+            message="获取回放状态成功"
+        )
+
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取回放状态失败: {str(e)}")
+
 @router.get("/{game_id}/export/json")
 async def export_replay_json(
     game_id: str,
     replay_service: ReplayService = Depends(get_replay_service)
 ):
-    """导出JSON格式牌谱"""
+    """导出JSON格式牌谱(流式输出)"""
+    replay = await replay_service.get_game_replay(game_id)
+    if not replay:
+        raise HTTPException(status_code=404, detail=f"牌谱 {game_id} 不存在")
+    
+    return StreamingResponse(
+        replay_service.stream_replay_json(replay),
+        media_type="application/json",
+        headers={
+            "Content-Disposition": f"attachment; filename=replay_{game_id}.json"
+        }
+    )
+
+@router.get("/{game_id}/export/zip")
+async def export_replay_zip(
+    game_id: str,
+    replay_service: ReplayService = Depends(get_replay_service)
+):
+    """导出ZIP格式牌谱(流式输出)"""
+    replay = await replay_service.get_game_replay(game_id)
+    if not replay:
+        raise HTTPException(status_code=404, detail=f"牌谱 {game_id} 不存在")
+    
+    return StreamingResponse(
+        replay_service.stream_replay_zip(replay),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename=replay_{game_id}.zip"
+        }
+    )
+
+@router.get("/{game_id}/export/binary")
+async def export_replay_binary(
+    game_id: str,
+    replay_service: ReplayService = Depends(get_replay_service)
+):
+    """导出紧凑二进制格式牌谱(用于长期归档)"""
     try:
-        json_data = await replay_service.export_replay_json(game_id)
+        binary_data = await replay_service.export_replay_file(game_id, format="binary")
         
         return Response(
-            content=json_data,
-            media_type="application/json",
+            content=binary_data,
+            media_type="application/octet-stream",
             headers={
-                "Content-Disposition": f"attachment; filename=replay_{game_id}.json"
+                "Content-Disposition": f"attachment; filename=replay_{game_id}.xzr"
             }
         )
     
@@ -57,27 +139,63 @@ async def export_replay_json(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
-@router.get("/{game_id}/export/zip")
-async def export_replay_zip(
-    game_id: str,
+@router.post("/export/zip")
+async def export_replays_zip(
+    request: ReplayBatchExportRequest,
     replay_service: ReplayService = Depends(get_replay_service)
 ):
-    """导出ZIP格式牌谱"""
+    """将多局牌谱导出到同一个ZIP压缩包(流式输出)"""
+    filename = f"replays_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    
+    return StreamingResponse(
+        replay_service.stream_replays_zip(request.game_ids),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}"
+        }
+    )
+
+@router.post("/export/bulk")
+async def export_replays_bulk(
+    query: ReplayExportFilter,
+    replay_service: ReplayService = Depends(get_replay_service)
+):
+    """按时间范围、玩家、模式批量导出牌谱(流式输出 zip 或 ndjson)"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if query.format == "ndjson":
+        media_type = "application/x-ndjson"
+        filename = f"replays_{timestamp}.ndjson"
+    else:
+        media_type = "application/zip"
+        filename = f"replays_{timestamp}.zip"
+    
+    return StreamingResponse(
+        replay_service.stream_bulk_export(query),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}"
+        }
+    )
+
+@router.post("/search")
+async def search_replays(
+    query: ReplayQuery,
+    replay_service: ReplayService = Depends(get_replay_service)
+):
+    """按牌型、事件和操作次数检索牌谱，返回按开始时间倒序的游戏ID"""
     try:
-        zip_data = await replay_service.export_replay_file(game_id, format="zip")
+        result = await replay_service.search_replays(query)
         
-        return StreamingResponse(
-            io.BytesIO(zip_data),
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename=replay_{game_id}.zip"
-            }
+        return ApiResponse(
+            success=True,
+            data=result,
+            message=f"找到 {result['total']} 局牌谱"
         )
     
     except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"检索牌谱失败: {str(e)}")
 
 @router.get("/player/{player_name}/history", response_model=ApiResponse[List[GameRecord]])
 async def get_player_history(
@@ -98,94 +216,92 @@ async def get_player_history(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取历史记录失败: {str(e)}")
 
-@router.get("/list")
-async def list_recent_games(
-    limit: int = Query(20, ge=1, le=100, description="返回记录数量"),
+@router.get("/player/{player_name}/stats")
+async def get_player_stats(
+    player_name: str,
     replay_service: ReplayService = Depends(get_replay_service)
 ):
-    """获取最近的游戏记录列表"""
+    """获取玩家生涯统计"""
     try:
-        # 从Redis获取所有游戏记录的键
-        game_keys = await replay_service.redis.client.keys("game_record:*")
-        recent_games = []
+        stats = await replay_service.analytics.get_player_stats(player_name)
+        if not stats:
+            raise HTTPException(status_code=404, detail="玩家统计不存在")
         
-        for key in game_keys[-limit:]:  # 获取最近的记录
-            try:
-                game_data = await replay_service.redis.client.get(key)
-                if game_data:
-                    game_record = GameRecord.parse_raw(game_data)
-                    # 只返回基本信息，不包含详细操作
-                    summary = {
-                        "game_id": game_record.game_id,
-                        "start_time": game_record.start_time,
-                        "end_time": game_record.end_time,
-                        "duration": game_record.duration,
-                        "players": [p.player_name for p in game_record.players],
-                        "winners": [p.player_name for p in game_record.players if p.is_winner],
-                        "total_actions": game_record.total_actions
-                    }
-                    recent_games.append(summary)
-            except:
-                continue
-        
-        # 按开始时间排序
-        recent_games.sort(key=lambda x: x["start_time"], reverse=True)
+        return ApiResponse(
+            success=True,
+            data=stats,
+            message="获取玩家统计成功"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取玩家统计失败: {str(e)}")
+
+@router.get("/players/leaderboard")
+async def get_player_leaderboard(
+    metric: str = Query("win_rate", description="排行指标: games/wins/total_score/win_rate/avg_score/deal_in_rate"),
+    limit: int = Query(20, ge=1, le=100, description="返回玩家数量"),
+    min_games: int = Query(1, ge=1, description="最少局数"),
+    replay_service: ReplayService = Depends(get_replay_service)
+):
+    """获取玩家排行榜"""
+    try:
+        leaderboard = await replay_service.analytics.get_leaderboard(metric, limit, min_games)
         
         return ApiResponse(
             success=True,
-            data=recent_games,
-            message=f"获取到 {len(recent_games)} 条游戏记录"
+            data=leaderboard,
+            message=f"获取到 {len(leaderboard)} 名玩家"
         )
     
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取游戏列表失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取排行榜失败: {str(e)}")
 
 @router.post("/{game_id}/share")
 async def create_share_link(
     game_id: str,
-    replay_service: ReplayService = Depends(get_replay_service)
+    share_service: ShareService = Depends(get_share_service)
 ):
     """创建牌谱分享链接"""
     try:
-        # 验证牌谱是否存在
-        replay = await replay_service.get_game_replay(game_id)
-        if not replay:
-            raise HTTPException(status_code=404, detail="牌谱不存在")
-        
-        # 创建分享链接 (这里可以实现短链接服务)
-        share_link = f"/replay/{game_id}"
-        
-        # 可以记录分享信息到Redis
-        share_key = f"share:{game_id}"
-        share_data = {
-            "game_id": game_id,
-            "created_at": replay.replay_metadata.get("generated_at"),
-            "share_count": 0
-        }
-        
-        await replay_service.redis.client.set(
-            share_key,
-            str(share_data),
-            ex=30*24*3600  # 30天过期
-        )
+        share = await share_service.create_share(game_id)
         
         return ApiResponse(
             success=True,
             data={
-                "share_link": share_link,
+                "token": share["token"],
+                "share_link": f"/api/v1/replay/shared/{share['token']}",
                 "qr_code": f"/api/v1/replay/{game_id}/qr",  # 二维码接口
-                "expires_at": "30天后"
+                "expires_at": share["expires_at"]
             },
             message="分享链接创建成功"
         )
     
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"创建分享链接失败: {str(e)}")
 
+@router.get("/shared/{token}")
+async def get_shared_replay(
+    token: str,
+    share_service: ShareService = Depends(get_share_service)
+):
+    """通过分享令牌查看牌谱(返回缓存的导出JSON)"""
+    export = await share_service.resolve(token)
+    if export is None:
+        raise HTTPException(status_code=404, detail="分享链接不存在或已过期")
+    
+    return Response(content=export, media_type="application/json")
+
 @router.delete("/{game_id}")
 async def delete_game_replay(
     game_id: str,
-    replay_service: ReplayService = Depends(get_replay_service)
+    replay_service: ReplayService = Depends(get_replay_service),
+    share_service: ShareService = Depends(get_share_service)
 ):
     """删除游戏牌谱"""
     try:
@@ -194,13 +310,11 @@ async def delete_game_replay(
         if not replay:
             raise HTTPException(status_code=404, detail="牌谱不存在")
         
-        # 删除Redis中的记录
-        key = f"game_record:{game_id}"
-        await replay_service.redis.client.delete(key)
+        # 删除记录、统计、索引和磁盘归档
+        await replay_service.delete_game(game_id)
         
-        # 删除分享记录
-        share_key = f"share:{game_id}"
-        await replay_service.redis.client.delete(share_key)
+        # 删除分享令牌和缓存
+        await share_service.revoke_game(game_id)
         
         return ApiResponse(
             success=True,
@@ -218,62 +332,10 @@ async def get_game_statistics(
 ):
     """获取游戏统计信息"""
     try:
-        replay = await replay_service.get_game_replay(game_id)
-        if not replay:
+        statistics = await replay_service.get_game_statistics(game_id)
+        if not statistics:
             raise HTTPException(status_code=404, detail="牌谱不存在")
         
-        game_record = replay.game_record
-        
-        # 计算统计信息
-        statistics = {
-            "basic_info": {
-                "game_id": game_record.game_id,
-                "duration": game_record.duration,
-                "total_actions": game_record.total_actions,
-                "winner_count": game_record.winner_count
-            },
-            "player_stats": [
-                {
-                    "player_name": p.player_name,
-                    "position": p.position,
-                    "final_score": p.final_score,
-                    "is_winner": p.is_winner,
-                    "actions": {
-                        "draw": p.draw_count,
-                        "discard": p.discard_count, 
-                        "peng": p.peng_count,
-                        "gang": p.gang_count
-                    }
-                }
-                for p in game_record.players
-            ],
-            "action_distribution": {},
-            "timeline": []
-        }
-        
-        # 统计操作分布
-        action_counts = {}
-        for action in game_record.actions:
-            action_type = action.action_type
-            action_counts[action_type] = action_counts.get(action_type, 0) + 1
-        
-        statistics["action_distribution"] = action_counts
-        
-        # 构建时间线 (关键操作)
-        key_actions = [action for action in game_record.actions 
-                      if action.action_type in ['peng', 'gang', 'hu', 'missing_suit']]
-        
-        statistics["timeline"] = [
-            {
-                "sequence": action.sequence,
-                "timestamp": action.timestamp.isoformat(),
-                "player_id": action.player_id,
-                "action_type": action.action_type,
-                "description": f"玩家{action.player_id+1} {action.action_type}"
-            }
-            for action in key_actions
-        ]
-        
         return ApiResponse(
             success=True,
             data=statistics,
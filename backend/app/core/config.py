@@ -11,7 +11,28 @@ class Settings(BaseSettings):
     REDIS_PASSWORD: Optional[str] = None
     REDIS_RETRY_COUNT: int = 3
     REDIS_RETRY_DELAY: int = 1  # 秒
-    
+    REDIS_MAX_CONNECTIONS: int = 50  # 异步连接池最大连接数
+
+    # 牌谱配置
+    REPLAY_KEYFRAME_INTERVAL: int = 16  # 每隔多少个操作保存一个回放关键帧
+    REPLAY_ARCHIVE_ENABLED: bool = True  # 是否将结束的牌谱归档到本地磁盘
+    REPLAY_ARCHIVE_DIR: str = "data/replay_archive"  # 牌谱归档目录
+    SHARE_LINK_TTL: int = 30 * 24 * 3600  # 分享链接有效期(秒)
+    SHARE_SWEEP_INTERVAL: int = 300  # 过期分享链接清理间隔(秒)
+
+    # 实时推送配置
+    WS_SEND_QUEUE_SIZE: int = 256  # 每个客户端的发送队列长度
+    WS_SEND_TIMEOUT: float = 5.0  # 单条消息发送超时(秒)
+    WS_SLOW_CLIENT_POLICY: str = "resync"  # 发送积压时: drop 断开连接, resync 改发最新快照
+    WS_PUBSUB_ENABLED: bool = True  # 是否通过Redis发布/订阅在多个工作进程间转发状态变更
+    WS_PUBSUB_BATCH_WINDOW: float = 0.02  # 合并发布的时间窗口(秒)
+
+    # 分析配置
+    ANALYSIS_POOL_WORKERS: int = 0  # 批量分析进程数，0 为CPU核数
+    ANALYSIS_BATCH_CHUNK_SIZE: int = 32  # 批量分析每次发送到工作进程的局面数
+    ANALYSIS_SPECULATIVE_ENABLED: bool = True  # 轮到玩家0出牌时是否在后台预先分析
+    ANALYSIS_SPECULATIVE_DEADLINE_MS: int = 200  # 后台分析的时间预算(毫秒)，0 为只做快速分析
+
     # API配置
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
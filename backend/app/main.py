@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+import asyncio
 import os
 
 # 创建FastAPI应用
@@ -18,6 +19,10 @@ app.add_middleware(
 # 导入路由
 from .api import mahjong
 from .api.v1 import replay
+from .services.redis_service import redis_service
+from .services.replay_service import ReplayService
+from .services.share_service import ShareService
+from .core.config import settings
 
 # 注册路由
 app.include_router(mahjong.router, prefix="/api/mahjong", tags=["mahjong"])
@@ -54,6 +59,26 @@ async def health_check():
 @app.on_event("startup")
 async def startup_event():
     """应用启动时的初始化"""
+    # 所有请求共享同一个牌谱服务和Redis连接池
+    app.state.replay_service = ReplayService(redis_service)
+    app.state.share_service = ShareService(
+        redis_service, app.state.replay_service, settings.SHARE_LINK_TTL
+    )
+    app.state.share_sweeper = asyncio.create_task(
+        app.state.share_service.run_sweeper(settings.SHARE_SWEEP_INTERVAL)
+    )
+    try:
+        await redis_service.client.ping()
+    except Exception as e:
+        print(f"⚠️ 异步Redis连接失败: {e}")
+    
+    # 多工作进程间转发实时状态变更
+    if settings.WS_PUBSUB_ENABLED:
+        try:
+            await mahjong.event_bridge.start()
+        except Exception as e:
+            print(f"⚠️ 游戏事件转发启动失败: {e}")
+    
     print("🀄 欢乐麻将辅助工具 API 已启动")
     print("📚 API文档地址: http://localhost:8000/docs")
 
@@ -61,6 +86,18 @@ async def startup_event():
 @app.on_event("shutdown") 
 async def shutdown_event():
     """应用关闭时的清理"""
+    share_sweeper = getattr(app.state, "share_sweeper", None)
+    if share_sweeper:
+        share_sweeper.cancel()
+    
+    await mahjong.event_bridge.stop()
+    mahjong.position_analyzer.shutdown()
+    mahjong.speculative_analyzer.shutdown()
+    
+    replay_service = getattr(app.state, "replay_service", None)
+    if replay_service and replay_service.archive:
+        replay_service.archive.close()
+    await redis_service.close()
     print("🀄 欢乐麻将辅助工具 API 已关闭")
 
 
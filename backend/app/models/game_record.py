@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Union
-from datetime import datetime
+import json
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import List, Optional, Dict, Union, Iterator, Literal
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 
 class ActionType(str, Enum):
@@ -19,6 +20,11 @@ class GangType(str, Enum):
     AN_GANG = "an_gang"         # 暗杠
     JIA_GANG = "jia_gang"       # 加杠
 
+# 花色顺序，牌种索引 = 花色序号 * 9 + (牌面值 - 1)，范围 0-26
+CARD_SUITS = ["wan", "tiao", "tong"]
+CARD_SUIT_NAMES = {"wan": "万", "tiao": "条", "tong": "筒"}
+
+
 class MahjongCard(BaseModel):
     """麻将牌"""
     id: int = Field(..., description="牌的ID")
@@ -26,8 +32,34 @@ class MahjongCard(BaseModel):
     value: int = Field(..., ge=1, le=9, description="牌面值1-9")
     
     def __str__(self):
-        suit_names = {"wan": "万", "tiao": "条", "tong": "筒"}
-        return f"{self.value}{suit_names.get(self.suit, self.suit)}"
+        return f"{self.value}{CARD_SUIT_NAMES.get(self.suit, self.suit)}"
+    
+    def to_index(self) -> int:
+        """转换为牌种索引(0-26)"""
+        return CARD_SUITS.index(self.suit) * 9 + self.value - 1
+    
+    @classmethod
+    def from_index(cls, index: int, card_id: Optional[int] = None) -> "MahjongCard":
+        """从牌种索引创建麻将牌"""
+        if not 0 <= index < 27:
+            raise ValueError(f"无效的牌种索引: {index}")
+        suit = CARD_SUITS[index // 9]
+        value = index % 9 + 1
+        return cls(
+            id=card_id if card_id is not None else canonical_card_id(index),
+            suit=suit,
+            value=value
+        )
+
+
+def canonical_card_id(index: int) -> int:
+    """牌种索引对应的默认牌ID: 万1-9、条11-19、筒21-29"""
+    return (index // 9) * 10 + index % 9 + 1
+
+
+def card_index_name(index: int) -> str:
+    """牌种索引转换为显示名称，如 0 -> 1万"""
+    return f"{index % 9 + 1}{CARD_SUIT_NAMES[CARD_SUITS[index // 9]]}"
 
 class GameAction(BaseModel):
     """游戏操作记录"""
@@ -79,6 +111,7 @@ class PlayerGameRecord(BaseModel):
     discard_count: int = Field(0, description="弃牌次数")
     peng_count: int = Field(0, description="碰牌次数")
     gang_count: int = Field(0, description="杠牌次数")
+    deal_in_count: int = Field(0, description="点炮次数")
 
 class GameRecord(BaseModel):
     """完整游戏记录"""
@@ -100,6 +133,10 @@ class GameRecord(BaseModel):
     # 游戏状态快照(关键时刻)
     snapshots: Dict[int, Dict] = Field(default_factory=dict, description="游戏状态快照")
     
+    # 周期性关键帧(每 keyframe_interval 个操作一帧)，用于快速定位回放状态
+    keyframe_interval: int = Field(16, ge=1, description="关键帧间隔(操作数)")
+    keyframes: Dict[int, Dict] = Field(default_factory=dict, description="紧凑格式的回放关键帧")
+    
     # 统计信息
     total_actions: int = Field(0, description="总操作数")
     winner_count: int = Field(0, description="胡牌人数")
@@ -117,6 +154,42 @@ class GameRecord(BaseModel):
             }
         }
 
+class GameRecordSummaryPlayer(BaseModel):
+    """牌谱摘要中的玩家信息"""
+    player_name: str
+    is_winner: bool = False
+
+
+class GameRecordSummary(BaseModel):
+    """牌谱列表摘要
+    
+    从保存的完整牌谱JSON中只解析列表需要的字段，操作序列、快照和关键帧被直接跳过，
+    不构建也不校验。
+    """
+    game_id: str
+    start_time: datetime
+    end_time: Optional[datetime] = None
+    duration: Optional[int] = None
+    players: List[GameRecordSummaryPlayer] = []
+    total_actions: int = 0
+    
+    def to_list_item(self) -> Dict:
+        """牌谱列表中的一项"""
+        return {
+            "game_id": self.game_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration": self.duration,
+            "players": [p.player_name for p in self.players],
+            "winners": [p.player_name for p in self.players if p.is_winner],
+            "total_actions": self.total_actions
+        }
+
+
+# 一次解析多局牌谱摘要(JSON数组)，校验器只构建一次
+GAME_RECORD_SUMMARIES = TypeAdapter(List[GameRecordSummary])
+
+
 class GameReplay(BaseModel):
     """牌谱回放数据"""
     game_record: GameRecord = Field(..., description="游戏记录")
@@ -124,6 +197,50 @@ class GameReplay(BaseModel):
     
     def to_export_format(self) -> Dict:
         """转换为导出格式"""
+        return {
+            **self._export_head(),
+            "actions": [self.export_action(action) for action in self.game_record.actions],
+            "metadata": self.replay_metadata
+        }
+    
+    def iter_export_json(self) -> Iterator[str]:
+        """逐段生成导出格式的JSON文本，操作序列逐条序列化，不构建完整字符串"""
+        head = json.dumps(self._export_head(), ensure_ascii=False, separators=(",", ":"))
+        yield head[:-1] + ',"actions":['
+        
+        for i, action in enumerate(self.game_record.actions):
+            action_json = json.dumps(self.export_action(action), ensure_ascii=False, separators=(",", ":"))
+            yield action_json if i == 0 else "," + action_json
+        
+        yield '],"metadata":' + json.dumps(self.replay_metadata, ensure_ascii=False, separators=(",", ":")) + "}"
+    
+    def to_summary(self) -> Dict:
+        """牌谱摘要信息"""
+        return {
+            "game_id": self.game_record.game_id,
+            "start_time": self.game_record.start_time.isoformat(),
+            "duration": self.game_record.duration,
+            "players": [p.player_name for p in self.game_record.players],
+            "winners": [p.player_name for p in self.game_record.players if p.is_winner],
+            "total_actions": self.game_record.total_actions
+        }
+    
+    @staticmethod
+    def export_action(action: GameAction) -> Dict:
+        """单个操作的导出格式"""
+        return {
+            "sequence": action.sequence,
+            "timestamp": action.timestamp.isoformat(),
+            "player_id": action.player_id,
+            "action_type": action.action_type,
+            "card": str(action.card) if action.card else None,
+            "target_player": action.target_player,
+            "gang_type": action.gang_type,
+            "score_change": action.score_change
+        }
+    
+    def _export_head(self) -> Dict:
+        """导出格式中操作序列之前的部分"""
         return {
             "game_info": {
                 "game_id": self.game_record.game_id,
@@ -150,19 +267,403 @@ class GameReplay(BaseModel):
                     }
                 }
                 for p in self.game_record.players
-            ],
-            "actions": [
-                {
-                    "sequence": action.sequence,
-                    "timestamp": action.timestamp.isoformat(),
-                    "player_id": action.player_id,
-                    "action_type": action.action_type,
-                    "card": str(action.card) if action.card else None,
-                    "target_player": action.target_player,
-                    "gang_type": action.gang_type,
-                    "score_change": action.score_change
-                }
-                for action in self.game_record.actions
-            ],
-            "metadata": self.replay_metadata
-        } 
\ No newline at end of file
+            ]
+        }
+
+
+class ReplayBatchExportRequest(BaseModel):
+    """批量导出牌谱请求"""
+    game_ids: List[str] = Field(..., min_length=1, description="要导出的游戏ID列表")
+
+
+class ReplayExportFilter(BaseModel):
+    """批量导出牌谱的筛选条件"""
+    start_time: Optional[datetime] = Field(None, description="开始时间下限(含)")
+    end_time: Optional[datetime] = Field(None, description="开始时间上限(含)")
+    player_name: Optional[str] = Field(None, description="包含该玩家的牌谱")
+    game_mode: Optional[str] = Field(None, description="游戏模式")
+    format: Literal["zip", "ndjson"] = Field("zip", description="导出格式")
+    limit: Optional[int] = Field(None, ge=1, description="最多导出的牌谱数量")
+    
+    def matches(self, game_record: GameRecord) -> bool:
+        """判断牌谱是否满足玩家和模式条件(时间范围由索引筛选)"""
+        if self.game_mode and game_record.game_mode != self.game_mode:
+            return False
+        if self.player_name and not any(p.player_name == self.player_name for p in game_record.players):
+            return False
+        return True
+
+
+
+class ReplayQuery(BaseModel):
+    """牌谱检索条件(各条件之间为"且"关系)"""
+    terms: List[str] = Field(default_factory=list, description="检索词，如 win:0:清一色、deal_in:7条、action:gang")
+    min_counts: Dict[str, int] = Field(default_factory=dict, description="操作次数下限，如 {\"gang\": 3}")
+    offset: int = Field(0, ge=0, description="分页偏移")
+    limit: int = Field(20, ge=1, le=500, description="每页数量")
+
+# ============ 紧凑二进制牌谱格式 ============
+#
+# 用于长期归档和导出。结构(v2):
+#   魔数 b"XZRP" | 版本(1字节) | 标志(1字节, bit0: 时间为UTC)
+#   游戏信息: game_id, game_mode, 开始时间(微秒), 结束时间差, 时长, 人数, 总操作数, 胡牌人数, 关键帧间隔
+#   玩家: 起手牌每张1字节牌种索引, 定缺1字节, 得分zigzag变长整数, 统计计数变长整数
+#   操作: 序号差值和时间差值(zigzag变长整数), 玩家1字节, 操作类型1字节, 可选字段标志1字节
+#   快照: 序号 + 紧凑JSON
+# 牌: 1字节牌种索引，牌ID与默认编码不同时最高位置1并追加变长整数ID。
+# 关键帧可由操作序列重新生成，不写入二进制格式。
+# v2 的结束时间差、时长和序号差值改为zigzag编码(导入的牌谱可能乱序或结束早于开始)，
+# v1 中这些字段为无符号变长整数，仍可读取。
+
+COMPACT_MAGIC = b"XZRP"
+COMPACT_VERSION = 2
+_COMPACT_SUPPORTED_VERSIONS = (1, 2)
+
+# 编码表只能追加，不能调整顺序
+_COMPACT_ACTION_TYPES = [
+    ActionType.DRAW, ActionType.DISCARD, ActionType.PENG, ActionType.GANG,
+    ActionType.HU, ActionType.PASS, ActionType.MISSING_SUIT
+]
+_COMPACT_GANG_TYPES = [GangType.MING_GANG, GangType.AN_GANG, GangType.JIA_GANG]
+
+_FLAG_UTC = 0x01
+
+_ACTION_HAS_CARD = 0x01
+_ACTION_HAS_TARGET = 0x02
+_ACTION_HAS_GANG_TYPE = 0x04
+_ACTION_HAS_MISSING_SUIT = 0x08
+_ACTION_FAILED = 0x10
+_ACTION_HAS_SCORE = 0x20
+
+_SUIT_NONE = 0xFF
+_SUIT_CUSTOM = 0xFE
+_CARD_CUSTOM_ID = 0x80
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _zigzag_encode(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _zigzag_decode(value: int) -> int:
+    return value >> 1 if value % 2 == 0 else -((value + 1) >> 1)
+
+
+class _CompactWriter:
+    """紧凑格式写入器"""
+    
+    def __init__(self):
+        self.buffer = bytearray()
+    
+    def byte(self, value: int):
+        self.buffer.append(value)
+    
+    def varint(self, value: int):
+        if value < 0:
+            raise ValueError(f"变长整数不能为负数: {value}")
+        while value >= 0x80:
+            self.buffer.append((value & 0x7F) | 0x80)
+            value >>= 7
+        self.buffer.append(value)
+    
+    def zigzag(self, value: int):
+        self.varint(_zigzag_encode(value))
+    
+    def optional_zigzag(self, value: Optional[int]):
+        self.optional_varint(None if value is None else _zigzag_encode(value))
+    
+    def text(self, value: str):
+        data = value.encode("utf-8")
+        self.varint(len(data))
+        self.buffer += data
+    
+    def optional_text(self, value: Optional[str]):
+        if value is None:
+            self.varint(0)
+        else:
+            data = value.encode("utf-8")
+            self.varint(len(data) + 1)
+            self.buffer += data
+    
+    def optional_varint(self, value: Optional[int]):
+        self.varint(0 if value is None else value + 1)
+    
+    def suit(self, value: Optional[str]):
+        if value is None:
+            self.byte(_SUIT_NONE)
+        elif value in CARD_SUITS:
+            self.byte(CARD_SUITS.index(value))
+        else:
+            self.byte(_SUIT_CUSTOM)
+            self.text(value)
+    
+    def card(self, card: MahjongCard):
+        index = card.to_index()
+        if card.id == canonical_card_id(index):
+            self.byte(index)
+        else:
+            self.byte(index | _CARD_CUSTOM_ID)
+            self.varint(card.id)
+
+
+class _CompactReader:
+    """紧凑格式读取器"""
+    
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.position = 0
+    
+    def byte(self) -> int:
+        if self.position >= len(self.data):
+            raise ValueError("紧凑牌谱数据不完整")
+        value = self.data[self.position]
+        self.position += 1
+        return value
+    
+    def varint(self) -> int:
+        result = 0
+        shift = 0
+        while True:
+            value = self.byte()
+            result |= (value & 0x7F) << shift
+            if value < 0x80:
+                return result
+            shift += 7
+    
+    def zigzag(self) -> int:
+        return _zigzag_decode(self.varint())
+    
+    def optional_zigzag(self) -> Optional[int]:
+        value = self.optional_varint()
+        return None if value is None else _zigzag_decode(value)
+    
+    def raw(self, length: int) -> bytes:
+        if self.position + length > len(self.data):
+            raise ValueError("紧凑牌谱数据不完整")
+        value = bytes(self.data[self.position:self.position + length])
+        self.position += length
+        return value
+    
+    def text(self) -> str:
+        return self.raw(self.varint()).decode("utf-8")
+    
+    def optional_text(self) -> Optional[str]:
+        length = self.varint()
+        return None if length == 0 else self.raw(length - 1).decode("utf-8")
+    
+    def optional_varint(self) -> Optional[int]:
+        value = self.varint()
+        return None if value == 0 else value - 1
+    
+    def suit(self) -> Optional[str]:
+        value = self.byte()
+        if value == _SUIT_NONE:
+            return None
+        if value == _SUIT_CUSTOM:
+            return self.text()
+        return CARD_SUITS[value]
+    
+    def card(self) -> MahjongCard:
+        value = self.byte()
+        if value & _CARD_CUSTOM_ID:
+            return MahjongCard.from_index(value & ~_CARD_CUSTOM_ID, card_id=self.varint())
+        return MahjongCard.from_index(value)
+
+
+def _to_micros(value: datetime) -> int:
+    """时间转换为自1970年起的微秒数(带时区的时间先转换为UTC)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros: int, utc: bool) -> datetime:
+    value = _EPOCH + timedelta(microseconds=micros)
+    return value.replace(tzinfo=timezone.utc) if utc else value
+
+
+def encode_compact_record(game_record: GameRecord) -> bytes:
+    """将游戏记录编码为紧凑二进制格式"""
+    writer = _CompactWriter()
+    writer.buffer += COMPACT_MAGIC
+    writer.byte(COMPACT_VERSION)
+    utc = game_record.start_time.tzinfo is not None
+    writer.byte(_FLAG_UTC if utc else 0)
+    
+    # 游戏信息
+    start_micros = _to_micros(game_record.start_time)
+    writer.text(game_record.game_id)
+    writer.text(game_record.game_mode)
+    writer.varint(start_micros)
+    writer.optional_zigzag(
+        _to_micros(game_record.end_time) - start_micros if game_record.end_time else None
+    )
+    writer.optional_zigzag(game_record.duration)
+    writer.varint(game_record.player_count)
+    writer.varint(game_record.total_actions)
+    writer.varint(game_record.winner_count)
+    writer.varint(game_record.keyframe_interval)
+    
+    # 玩家
+    writer.varint(len(game_record.players))
+    for player in game_record.players:
+        writer.varint(player.player_id)
+        writer.text(player.player_name)
+        writer.byte(player.position)
+        writer.varint(len(player.initial_hand))
+        for card in player.initial_hand:
+            writer.card(card)
+        writer.suit(player.missing_suit)
+        writer.zigzag(player.final_score)
+        writer.byte(1 if player.is_winner else 0)
+        writer.optional_text(player.hu_type)
+        writer.optional_varint(player.hu_sequence)
+        writer.varint(player.draw_count)
+        writer.varint(player.discard_count)
+        writer.varint(player.peng_count)
+        writer.varint(player.gang_count)
+        writer.varint(player.deal_in_count)
+    
+    # 操作序列，序号和时间均为与上一操作的差值
+    writer.varint(len(game_record.actions))
+    previous_sequence = 0
+    previous_micros = start_micros
+    for action in game_record.actions:
+        micros = _to_micros(action.timestamp)
+        writer.zigzag(action.sequence - previous_sequence)
+        writer.zigzag(micros - previous_micros)
+        previous_sequence = action.sequence
+        previous_micros = micros
+        
+        writer.byte(action.player_id)
+        writer.byte(_COMPACT_ACTION_TYPES.index(action.action_type))
+        
+        flags = 0
+        if action.card is not None:
+            flags |= _ACTION_HAS_CARD
+        if action.target_player is not None:
+            flags |= _ACTION_HAS_TARGET
+        if action.gang_type is not None:
+            flags |= _ACTION_HAS_GANG_TYPE
+        if action.missing_suit is not None:
+            flags |= _ACTION_HAS_MISSING_SUIT
+        if not action.is_success:
+            flags |= _ACTION_FAILED
+        if action.score_change:
+            flags |= _ACTION_HAS_SCORE
+        writer.byte(flags)
+        
+        if action.card is not None:
+            writer.card(action.card)
+        if action.target_player is not None:
+            writer.byte(action.target_player)
+        if action.gang_type is not None:
+            writer.byte(_COMPACT_GANG_TYPES.index(action.gang_type))
+        if action.missing_suit is not None:
+            writer.suit(action.missing_suit)
+        if action.score_change:
+            writer.zigzag(action.score_change)
+    
+    # 状态快照
+    writer.varint(len(game_record.snapshots))
+    for sequence, snapshot in sorted(game_record.snapshots.items()):
+        writer.varint(sequence)
+        writer.text(json.dumps(snapshot, ensure_ascii=False, separators=(",", ":"), default=str))
+    
+    return bytes(writer.buffer)
+
+
+def decode_compact_record(data: bytes) -> GameRecord:
+    """从紧凑二进制格式解码游戏记录(不含关键帧)"""
+    reader = _CompactReader(data)
+    if reader.raw(len(COMPACT_MAGIC)) != COMPACT_MAGIC:
+        raise ValueError("不是有效的紧凑牌谱数据")
+    version = reader.byte()
+    if version not in _COMPACT_SUPPORTED_VERSIONS:
+        raise ValueError(f"不支持的紧凑牌谱版本: {version}")
+    # v1 的差值字段为无符号变长整数
+    read_delta = reader.zigzag if version >= 2 else reader.varint
+    read_optional_delta = reader.optional_zigzag if version >= 2 else reader.optional_varint
+    utc = bool(reader.byte() & _FLAG_UTC)
+    
+    # 游戏信息
+    game_id = reader.text()
+    game_mode = reader.text()
+    start_micros = reader.varint()
+    end_delta = read_optional_delta()
+    duration = read_optional_delta()
+    player_count = reader.varint()
+    total_actions = reader.varint()
+    winner_count = reader.varint()
+    keyframe_interval = reader.varint()
+    
+    # 玩家
+    players = []
+    for _ in range(reader.varint()):
+        player_id = reader.varint()
+        player_name = reader.text()
+        position = reader.byte()
+        initial_hand = [reader.card() for _ in range(reader.varint())]
+        players.append(PlayerGameRecord(
+            player_id=player_id,
+            player_name=player_name,
+            position=position,
+            initial_hand=initial_hand,
+            missing_suit=reader.suit(),
+            final_score=reader.zigzag(),
+            is_winner=bool(reader.byte()),
+            hu_type=reader.optional_text(),
+            hu_sequence=reader.optional_varint(),
+            draw_count=reader.varint(),
+            discard_count=reader.varint(),
+            peng_count=reader.varint(),
+            gang_count=reader.varint(),
+            deal_in_count=reader.varint()
+        ))
+    
+    # 操作序列
+    actions = []
+    sequence = 0
+    micros = start_micros
+    for _ in range(reader.varint()):
+        sequence += read_delta()
+        micros += reader.zigzag()
+        player_id = reader.byte()
+        action_type = _COMPACT_ACTION_TYPES[reader.byte()]
+        flags = reader.byte()
+        
+        actions.append(GameAction(
+            sequence=sequence,
+            timestamp=_from_micros(micros, utc),
+            player_id=player_id,
+            action_type=action_type,
+            card=reader.card() if flags & _ACTION_HAS_CARD else None,
+            target_player=reader.byte() if flags & _ACTION_HAS_TARGET else None,
+            gang_type=_COMPACT_GANG_TYPES[reader.byte()] if flags & _ACTION_HAS_GANG_TYPE else None,
+            missing_suit=reader.suit() if flags & _ACTION_HAS_MISSING_SUIT else None,
+            is_success=not flags & _ACTION_FAILED,
+            score_change=reader.zigzag() if flags & _ACTION_HAS_SCORE else 0
+        ))
+    
+    # 状态快照
+    snapshots = {}
+    for _ in range(reader.varint()):
+        sequence_key = reader.varint()
+        snapshots[sequence_key] = json.loads(reader.text())
+    
+    return GameRecord(
+        game_id=game_id,
+        start_time=_from_micros(start_micros, utc),
+        end_time=_from_micros(start_micros + end_delta, utc) if end_delta is not None else None,
+        duration=duration,
+        player_count=player_count,
+        game_mode=game_mode,
+        players=players,
+        actions=actions,
+        snapshots=snapshots,
+        total_actions=total_actions,
+        winner_count=winner_count,
+        keyframe_interval=keyframe_interval
+    )
@@ -207,6 +207,16 @@ class GameState(BaseModel):
         
         return remaining_counts
 
+    def calculate_remaining_tiles_by_code(self) -> Dict[int, int]:
+        """计算每种牌的剩余数量，以牌编码为键（基于可见牌）"""
+        remaining_by_type = self.calculate_remaining_tiles_by_type()
+        remaining_counts = {}
+        for tile_type in [TileType.WAN, TileType.TIAO, TileType.TONG]:
+            for value in range(1, 10):
+                code = Tile(type=tile_type, value=value).to_code()
+                remaining_counts[code] = remaining_by_type[f"{tile_type}-{value}"]
+        return remaining_counts
+
 
 class AnalysisResult(BaseModel):
     """分析结果"""
@@ -216,19 +226,35 @@ class AnalysisResult(BaseModel):
     win_probability: float = 0.0
     remaining_tiles_count: Dict[int, int] = {}
     suggestions: List[str] = []
+    shanten: Optional[int] = None  # 向听数(有时间预算且已完成该阶段时)
+    simulated_win_rate: Optional[float] = None  # 推荐弃牌的模拟胜率
+    work: Optional[Dict[str, Any]] = None  # 有时间预算时完成的工作量
 
 
 class GameRequest(BaseModel):
     """游戏请求"""
     game_state: GameState
     target_player: int = 0  # 目标玩家ID（通常是自己）
+    deadline_ms: Optional[int] = Field(None, ge=1, le=10000)  # 分析的时间预算(毫秒)，不指定时只做快速分析
 
 
 class GameResponse(BaseModel):
     """游戏响应"""
     success: bool
     analysis: Optional[AnalysisResult] = None
-    message: str = "" 
+    message: str = ""
+
+
+class CompactPosition(BaseModel):
+    """紧凑局面: 牌均为整数牌码(万1-9、条11-19、筒21-29)"""
+    id: Optional[str] = None  # 调用方的局面标识，原样返回
+    hand: List[int] = Field(..., min_length=1, max_length=18)  # 手牌
+    visible: List[int] = []  # 其他可见牌(弃牌、碰杠等)，用于计算剩余牌数
+
+
+class BatchAnalysisRequest(BaseModel):
+    """批量局面分析请求"""
+    positions: List[CompactPosition] = Field(..., min_length=1, max_length=5000)
 
 
 # 操作相关模型
@@ -241,11 +267,33 @@ class TileOperationRequest(BaseModel):
     game_id: Optional[str] = None  # 添加游戏ID字段
 
 
+class BatchOperationRequest(BaseModel):
+    """批量牌操作请求"""
+    operations: List[TileOperationRequest] = Field(..., min_length=1, max_length=500)
+    atomic: bool = True  # 任一操作失败时回滚全部操作
+
+
+class BatchOperationResult(BaseModel):
+    """批量操作中单项操作的结果"""
+    index: int
+    success: bool
+    message: str
+
+
 class GameOperationResponse(BaseModel):
     """游戏操作响应"""
     success: bool
     message: str
     game_state: Optional[Dict] = None
+    version: Optional[int] = None  # 状态版本号
+    base_version: Optional[int] = None  # 增量响应的起始版本
+    patch: Optional[List[Dict]] = None  # 从 base_version 到 version 的增量操作
+    analysis: Optional[AnalysisResult] = None  # 后台预先算好的玩家0分析结果
+
+
+class BatchOperationResponse(GameOperationResponse):
+    """批量牌操作响应"""
+    results: List[BatchOperationResult] = []
 
 
 class GameStateRequest(BaseModel):
@@ -0,0 +1,67 @@
+"""
+分析请求合并(single-flight)
+
+多个页面或观战者同时请求分析同一局面时，只执行一次分析，
+其余请求等待同一个计算任务并共享结果。局面按规范形式作为键:
+目标玩家手牌的牌码(排序后)、各牌剩余数量、牌墙剩余数量和时间预算，
+与牌的 id、请求中其他无关字段无关。
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.models.mahjong import GameState
+
+
+def analysis_key(game_state: GameState, player_id: int, deadline_ms: Optional[int] = None) -> Tuple:
+    """分析结果只取决于这些信息，相同键的请求可以共享结果"""
+    hand = game_state.player_hands.get(str(player_id))
+    hand_codes = tuple(sorted(tile.to_code() for tile in hand.tiles)) if hand and hand.tiles else ()
+    remaining = tuple(sorted(game_state.calculate_remaining_tiles_by_code().items()))
+    return (player_id, hand_codes, remaining, game_state.calculate_remaining_tiles(), deadline_ms)
+
+
+class SingleFlight:
+    """相同键的并发调用只执行一次
+
+    计算在独立任务中进行，等待者(包括发起者)被取消不会中断计算，
+    其他等待者仍能拿到结果。任务结束后键即被移除，之后的调用重新计算。
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.requests = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 fn 或等待相同键正在进行的计算"""
+        self.requests += 1
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # 所有等待者都已取消时也要取走异常，避免未处理异常警告
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        return {
+            "requests": self.requests,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": len(self._in_flight),
+            "coalesced_ratio": self.coalesced / self.requests if self.requests else 0.0
+        }
@@ -0,0 +1,26 @@
+"""
+分析进程池的工作进程
+
+进程池以 init_worker 作为初始化函数，每个工作进程创建一个常驻的分析器，
+在工作进程中执行的函数通过 get_worker_analyzer 获取，不必每个任务重新创建。
+"""
+
+from typing import Optional
+
+from app.algorithms.mahjong_analyzer import MahjongAnalyzer
+
+# 当前进程的分析器实例
+_worker_analyzer: Optional[MahjongAnalyzer] = None
+
+
+def init_worker():
+    """工作进程初始化"""
+    global _worker_analyzer
+    _worker_analyzer = MahjongAnalyzer()
+
+
+def get_worker_analyzer() -> MahjongAnalyzer:
+    """获取当前进程的分析器(未经 init_worker 初始化时创建)"""
+    if _worker_analyzer is None:
+        init_worker()
+    return _worker_analyzer
@@ -0,0 +1,96 @@
+"""
+实时通道消息帧编码
+
+客户端连接时协商帧格式:
+- json     文本帧，消息原样序列化(默认)
+- msgpack  二进制帧，结构为 {"v": 帧版本, "t": 消息类型, "d": 消息内容}，
+           其中的牌 {"type": "wan", "value": 5}(可带值为null的 id)编码为整数牌码(万1-9、条11-19、筒21-29)，
+           带非空 id 的牌保留完整对象
+
+msgpack 为可选依赖，未安装时协商结果回退为 json。
+"""
+
+import json
+from typing import Any, Dict, Optional, Union
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+FRAME_JSON = "json"
+FRAME_MSGPACK = "msgpack"
+
+# 二进制帧结构版本，结构变化时递增
+FRAME_VERSION = 1
+
+_SUIT_BASE = {"wan": 0, "tiao": 10, "tong": 20}
+
+Payload = Union[str, bytes]
+
+
+def negotiate_format(requested: Optional[str]) -> str:
+    """根据客户端请求确定帧格式"""
+    if requested == FRAME_MSGPACK and msgpack is not None:
+        return FRAME_MSGPACK
+    return FRAME_JSON
+
+
+def _is_plain_tile(value: Dict[str, Any]) -> bool:
+    """只有花色和点数(id 缺失或为null)的牌对象"""
+    if value.get("type") not in _SUIT_BASE or not isinstance(value.get("value"), int):
+        return False
+    if len(value) == 2:
+        return True
+    return len(value) == 3 and "id" in value and value["id"] is None
+
+
+def compact_tiles(value: Any) -> Any:
+    """将数据中的牌对象替换为整数牌码"""
+    if isinstance(value, dict):
+        if _is_plain_tile(value):
+            return _SUIT_BASE[value["type"]] + value["value"]
+        return {key: compact_tiles(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [compact_tiles(item) for item in value]
+    return value
+
+
+def encode_frame(message: Dict[str, Any], frame_format: str) -> Payload:
+    """按帧格式编码消息"""
+    if frame_format == FRAME_MSGPACK:
+        data = {key: value for key, value in message.items() if key != "type"}
+        return msgpack.packb(
+            {"v": FRAME_VERSION, "t": message.get("type"), "d": compact_tiles(data)},
+            use_bin_type=True
+        )
+    return json.dumps(message, ensure_ascii=False)
+
+
+def decode_frame(data: Payload) -> Dict[str, Any]:
+    """解码客户端发来的消息(文本为JSON，二进制为msgpack帧)"""
+    if isinstance(data, bytes):
+        if msgpack is None:
+            raise ValueError("服务端未安装 msgpack，无法解析二进制消息")
+        frame = msgpack.unpackb(data, raw=False)
+        message = dict(frame.get("d") or {})
+        message["type"] = frame.get("t")
+        return message
+    return json.loads(data)
+
+
+class EncodedMessage:
+    """同一条消息按各帧格式最多编码一次"""
+
+    __slots__ = ("message", "_payloads")
+
+    def __init__(self, message: Dict[str, Any]):
+        self.message = message
+        self._payloads: Dict[str, Payload] = {}
+
+    def get(self, frame_format: str) -> Payload:
+        payload = self._payloads.get(frame_format)
+        if payload is None:
+            payload = encode_frame(self.message, frame_format)
+            self._payloads[frame_format] = payload
+        return payload
@@ -0,0 +1,107 @@
+"""
+跨工作进程的游戏事件转发
+
+多个 uvicorn 工作进程各自持有 WebSocket 连接，本进程产生的状态增量经
+Redis 发布/订阅转发给其他进程，再由其推送给本地客户端。
+
+- 频道: mahjong:game:{game_id}，各进程按模式 mahjong:game:* 订阅
+- 消息: {"origin": 进程ID, "messages": [增量消息, ...]}
+- 发布端在 batch_window 秒内产生的同一局消息合并为一次发布
+- 收到自己发布的消息(origin 相同)时忽略，避免重复推送
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from app.services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "mahjong:game:"
+
+
+class GameEventBridge:
+    """基于 Redis 发布/订阅的游戏事件转发"""
+
+    def __init__(
+        self,
+        redis_service: RedisService,
+        on_remote_messages: Callable[[str, List[dict]], None],
+        batch_window: float = 0.02
+    ):
+        self.redis = redis_service
+        self.on_remote_messages = on_remote_messages
+        self.batch_window = batch_window
+        self.worker_id = uuid.uuid4().hex
+        self._outgoing: Dict[str, List[dict]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._listener is not None
+
+    async def start(self):
+        """订阅全部游戏频道并启动接收任务"""
+        pubsub = self.redis.client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+        self._pubsub = pubsub
+        self._listener = asyncio.create_task(self._listen())
+        logger.info(f"游戏事件转发已启动: {self.worker_id}")
+
+    async def stop(self):
+        """停止接收并发布尚未发送的消息"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+            await self._flush()
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    def publish(self, game_id: str, message: dict):
+        """将消息加入待发布批次(同步调用，批次在 batch_window 后发布)"""
+        if not self.running:
+            return
+        self._outgoing.setdefault(game_id, []).append(message)
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(
+                self.batch_window, lambda: asyncio.create_task(self._flush())
+            )
+
+    async def _flush(self):
+        """发布当前批次"""
+        self._flush_handle = None
+        outgoing, self._outgoing = self._outgoing, {}
+        for game_id, messages in outgoing.items():
+            payload = json.dumps({"origin": self.worker_id, "messages": messages}, ensure_ascii=False)
+            try:
+                await self.redis.client.publish(f"{CHANNEL_PREFIX}{game_id}", payload)
+            except Exception as e:
+                logger.warning(f"发布游戏事件失败: {e}")
+
+    async def _listen(self):
+        """接收其他进程发布的消息并交给本地处理"""
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    payload = json.loads(message["data"])
+                    if payload.get("origin") == self.worker_id:
+                        continue
+                    game_id = message["channel"][len(CHANNEL_PREFIX):]
+                    self.on_remote_messages(game_id, payload["messages"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"接收游戏事件失败: {e}")
+                await asyncio.sleep(1)
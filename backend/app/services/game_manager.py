@@ -1,18 +1,53 @@
-from typing import Dict, Optional
+from typing import Callable, Dict, Iterable, Optional, Set
 from fastapi import WebSocket
-import json
+import asyncio
+
+from .state_sync import patch_message
+from .frame_codec import FRAME_JSON, EncodedMessage
+from ..core.config import settings
+
+# 发送队列满时的处理策略
+SLOW_CLIENT_DROP = "drop"  # 断开连接，客户端重连后从版本号恢复
+SLOW_CLIENT_RESYNC = "resync"  # 丢弃积压的消息，改为发送一份最新快照
 
 
 class GameManager:
-    """游戏管理器，处理WebSocket连接和游戏状态同步"""
+    """游戏管理器，处理WebSocket连接和游戏状态同步
+    
+    消息对每种帧格式只编码一次，放入每个客户端的有界发送队列，由各自的发送任务写出，
+    广播耗时与最慢的客户端无关。队列满的客户端按 slow_client_policy 处理。
+    """
     
-    def __init__(self):
+    def __init__(
+        self,
+        queue_size: int = settings.WS_SEND_QUEUE_SIZE,
+        send_timeout: float = settings.WS_SEND_TIMEOUT,
+        slow_client_policy: str = settings.WS_SLOW_CLIENT_POLICY
+    ):
         self.active_connections: Dict[str, WebSocket] = {}
         self.game_states: Dict[str, dict] = {}
+        # 每局游戏的订阅房间: game_id -> 客户端ID集合
+        self.rooms: Dict[str, Set[str]] = {}
+        self.client_rooms: Dict[str, str] = {}
+        # 每个客户端的帧格式、发送队列和发送任务
+        self.client_formats: Dict[str, str] = {}
+        self.send_queues: Dict[str, asyncio.Queue] = {}
+        self.writers: Dict[str, asyncio.Task] = {}
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_client_policy = slow_client_policy
+        # 重新同步时生成快照消息: game_id -> 消息字典
+        self.resync_provider: Optional[Callable[[str], dict]] = None
+        # 跨工作进程转发(GameEventBridge)，未设置时只推送本进程的客户端
+        self.bridge = None
     
-    async def add_client(self, client_id: str, websocket: WebSocket):
-        """添加客户端连接"""
+    async def add_client(self, client_id: str, websocket: WebSocket, frame_format: str = FRAME_JSON):
+        """添加客户端连接并启动其发送任务"""
         self.active_connections[client_id] = websocket
+        self.client_formats[client_id] = frame_format
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.send_queues[client_id] = queue
+        self.writers[client_id] = asyncio.create_task(self._writer(client_id, websocket, queue))
         print(f"客户端 {client_id} 已连接")
     
     def remove_client(self, client_id: str):
@@ -21,35 +56,155 @@ class GameManager:
             del self.active_connections[client_id]
         if client_id in self.game_states:
             del self.game_states[client_id]
+        self.client_formats.pop(client_id, None)
+        self.send_queues.pop(client_id, None)
+        writer = self.writers.pop(client_id, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+        self.leave_room(client_id)
         print(f"客户端 {client_id} 已断开连接")
     
+    def set_resync_provider(self, provider: Callable[[str], dict]):
+        """设置慢客户端重新同步时使用的快照生成函数"""
+        self.resync_provider = provider
+    
+    def set_bridge(self, bridge):
+        """设置跨工作进程的事件转发"""
+        self.bridge = bridge
+    
+    def join_room(self, game_id: str, client_id: str):
+        """客户端订阅某局游戏的状态推送"""
+        self.leave_room(client_id)
+        self.rooms.setdefault(game_id, set()).add(client_id)
+        self.client_rooms[client_id] = game_id
+    
+    def leave_room(self, client_id: str):
+        """客户端取消订阅"""
+        game_id = self.client_rooms.pop(client_id, None)
+        if game_id is None:
+            return
+        members = self.rooms.get(game_id)
+        if members is not None:
+            members.discard(client_id)
+            if not members:
+                del self.rooms[game_id]
+    
+    def move_room(self, old_game_id: str, new_game_id: str):
+        """游戏重置后将原房间的订阅者转到新游戏"""
+        members = self.rooms.pop(old_game_id, None)
+        if not members:
+            return
+        self.rooms.setdefault(new_game_id, set()).update(members)
+        for client_id in members:
+            self.client_rooms[client_id] = new_game_id
+    
+    async def broadcast_to_room(self, game_id: str, message: dict):
+        """广播消息给订阅某局游戏的客户端"""
+        self._enqueue_many(self.rooms.get(game_id, ()), EncodedMessage(message))
+    
+    def publish_state_change(self, game_id: str, version: int, ops: list):
+        """状态变更回调: 将增量放入房间内客户端的发送队列"""
+        new_game_id = game_id
+        for op in ops:
+            if op["path"] == "/game_id":
+                new_game_id = op["value"]
+            elif op["path"] == "":
+                new_game_id = op["value"].get("game_id", game_id)
+        
+        message = patch_message(new_game_id, version, ops)
+        if new_game_id != game_id:
+            self.move_room(game_id, new_game_id)
+        
+        # 入队是同步的，增量按版本顺序进入每个客户端的队列
+        members = self.rooms.get(new_game_id)
+        if members:
+            self._enqueue_many(members, EncodedMessage(message))
+        
+        if self.bridge is not None:
+            self.bridge.publish(game_id, message)
+    
+    def relay_remote(self, game_id: str, messages: list):
+        """转发其他工作进程的消息给本地客户端，同一批次的多条消息合并为一帧"""
+        for message in messages:
+            new_game_id = message.get("game_id") or game_id
+            if new_game_id != game_id:
+                self.move_room(game_id, new_game_id)
+                game_id = new_game_id
+        
+        members = self.rooms.get(game_id)
+        if not members:
+            return
+        frame = messages[0] if len(messages) == 1 else {"type": "batch", "messages": messages}
+        self._enqueue_many(members, EncodedMessage(frame))
+    
     async def send_to_client(self, client_id: str, message: dict):
-        """发送消息给特定客户端"""
-        if client_id in self.active_connections:
-            websocket = self.active_connections[client_id]
-            try:
-                await websocket.send_text(json.dumps(message, ensure_ascii=False))
-            except Exception as e:
-                print(f"发送消息给客户端 {client_id} 失败: {e}")
-                self.remove_client(client_id)
+        """发送消息给特定客户端(放入其发送队列)"""
+        self._enqueue(client_id, EncodedMessage(message))
     
     async def broadcast(self, message: dict, exclude_client: Optional[str] = None):
         """广播消息给所有客户端"""
-        disconnected_clients = []
+        self._enqueue_many(
+            [client_id for client_id in self.active_connections if client_id != exclude_client],
+            EncodedMessage(message)
+        )
+    
+    def _enqueue_many(self, client_ids: Iterable[str], encoded: EncodedMessage):
+        for client_id in list(client_ids):
+            self._enqueue(client_id, encoded)
+    
+    def _enqueue(self, client_id: str, encoded: EncodedMessage):
+        """按客户端帧格式编码(每种格式只编码一次)后放入发送队列，队列已满时按慢客户端策略处理"""
+        queue = self.send_queues.get(client_id)
+        if queue is None:
+            return
+        frame_format = self.client_formats.get(client_id, FRAME_JSON)
+        try:
+            queue.put_nowait(encoded.get(frame_format))
+            return
+        except asyncio.QueueFull:
+            pass
         
-        for client_id, websocket in self.active_connections.items():
-            if exclude_client and client_id == exclude_client:
-                continue
-            
-            try:
-                await websocket.send_text(json.dumps(message, ensure_ascii=False))
-            except Exception as e:
-                print(f"广播消息给客户端 {client_id} 失败: {e}")
-                disconnected_clients.append(client_id)
+        game_id = self.client_rooms.get(client_id)
+        if (self.slow_client_policy == SLOW_CLIENT_RESYNC and self.resync_provider is not None
+                and game_id is not None):
+            # 积压的增量已无意义，清空后只发送一份最新快照
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(EncodedMessage(self.resync_provider(game_id)).get(frame_format))
+            print(f"客户端 {client_id} 发送积压，已改为发送快照")
+            return
         
-        # 清理断开的连接
-        for client_id in disconnected_clients:
-            self.remove_client(client_id)
+        print(f"客户端 {client_id} 发送积压，断开连接")
+        self._drop_client(client_id)
+    
+    def _drop_client(self, client_id: str):
+        """断开慢客户端"""
+        websocket = self.active_connections.get(client_id)
+        self.remove_client(client_id)
+        if websocket is not None:
+            asyncio.create_task(self._close_quietly(websocket))
+    
+    async def _close_quietly(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+    
+    async def _writer(self, client_id: str, websocket: WebSocket, queue: asyncio.Queue):
+        """依次写出客户端队列中的消息，发送失败或超时时断开连接"""
+        try:
+            while True:
+                payload = await queue.get()
+                if isinstance(payload, bytes):
+                    await asyncio.wait_for(websocket.send_bytes(payload), self.send_timeout)
+                else:
+                    await asyncio.wait_for(websocket.send_text(payload), self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"发送消息给客户端 {client_id} 失败: {e}")
+            if self.send_queues.get(client_id) is queue:
+                self._drop_client(client_id)
     
     def update_game_state(self, client_id: str, game_state: dict):
         """更新游戏状态"""
@@ -2,7 +2,9 @@ import redis
 import json
 from typing import Dict, List, Optional, Tuple, Any
 from copy import deepcopy
+from contextlib import contextmanager
 import asyncio
+import threading
 from datetime import datetime
 import uuid  # 添加 uuid 导入
 
@@ -11,7 +13,9 @@ from ..models.mahjong import (
     PlayerAction, TileOperationRequest
 )
 from ..algorithms.mahjong_analyzer import MahjongAnalyzer
+from ..algorithms.analysis_context import AnalysisContext
 from ..core.config import settings
+from .state_sync import StateSync, apply_patch
 
 
 class MahjongGameService:
@@ -33,9 +37,28 @@ class MahjongGameService:
             decode_responses=True
         )
         self.game_state_key = "mahjong:game_state"
+        # 批量操作期间推迟保存，退出批量时只保存一次
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self._batch_dirty = False
+        self.game_version_key = "mahjong:game_state:version"
+        # 状态版本和增量，用于向客户端推送变更
+        self.sync = StateSync(self._load_version())
         # 从Redis加载游戏状态，如果没有则创建新的
         self._game_state = self._load_or_create_state()
+        self.sync.load(json.dumps(self._game_state))
         self.analyzer = MahjongAnalyzer()
+        # 玩家0的增量分析状态，每次保存后只更新手牌有变化的花色
+        self.analysis_context = AnalysisContext()
+        self._sync_analysis_context()
+    
+    def _load_version(self) -> int:
+        """从Redis加载状态版本号，重启后版本号继续递增"""
+        try:
+            return int(self.redis.get(self.game_version_key) or 0)
+        except Exception as e:
+            print(f"从Redis加载状态版本失败: {e}")
+            return 0
     
     def _load_or_create_state(self) -> Dict[str, Any]:
         """从Redis加载游戏状态，如果不存在则创建新的"""
@@ -51,12 +74,63 @@ class MahjongGameService:
         return self._create_initial_state()
     
     def _save_state(self):
-        """保存游戏状态到Redis"""
+        """保存游戏状态到Redis(批量操作期间只标记，退出批量时保存)"""
+        if self._batch_depth:
+            self._batch_dirty = True
+            return
+        
         try:
             state_json = json.dumps(self._game_state)
-            self.redis.set(self.game_state_key, state_json)
+        except Exception as e:
+            print(f"序列化游戏状态失败: {e}")
+            return
+        
+        # 状态有变化时在同一事务中写入状态并分配版本号，再生成增量并推送；
+        # Redis不可用时使用本地版本号，实时同步仍然有效
+        self._sync_analysis_context()
+        self.sync.commit(state_json, lambda: self._store_state(state_json))
+    
+    def _store_state(self, state_json: str) -> Optional[int]:
+        """保存状态到Redis并以 INCR 分配新版本号(同一事务)，失败时返回None
+        
+        多个工作进程同时修改时各自得到不同的版本号，版本号最大的即Redis中最后写入的状态。
+        """
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.set(self.game_state_key, state_json)
+            pipe.incr(self.game_version_key)
+            return int(pipe.execute()[1])
         except Exception as e:
             print(f"保存状态到Redis失败: {e}")
+            return None
+    
+    def get_state_version(self) -> int:
+        """获取当前状态版本号"""
+        return self.sync.version
+    
+    def apply_remote_change(self, version: int, ops: List[Dict[str, Any]]) -> bool:
+        """应用其他工作进程推送的增量
+        
+        版本连续时直接应用增量并返回True；版本不连续时从Redis重新加载完整状态并返回False，
+        调用方应改为向客户端下发快照。
+        """
+        if version == self.sync.version + 1:
+            self._game_state = apply_patch(self._game_state, deepcopy(ops))
+            self.sync.apply_remote(version, ops, json.dumps(self._game_state))
+            self._sync_analysis_context()
+            return True
+        
+        self._game_state = self._load_or_create_state()
+        self.sync.reset(max(version, self._load_version()), json.dumps(self._game_state))
+        self._sync_analysis_context()
+        return False
+    
+    def _sync_analysis_context(self):
+        """按当前状态更新玩家0的增量分析状态"""
+        try:
+            self.analysis_context.sync_state(self._game_state, 0)
+        except Exception as e:
+            print(f"更新分析状态失败: {e}")
     
     def get_game_state(self) -> Dict[str, Any]:
         """获取当前游戏状态"""
@@ -65,7 +139,8 @@ class MahjongGameService:
     def set_game_state(self, game_state: GameState) -> bool:
         """设置游戏状态（从Pydantic模型）"""
         try:
-            self._game_state = game_state.dict()
+            # 与从Redis加载的状态一致，枚举等字段直接转换为JSON基本类型
+            self._game_state = game_state.model_dump(mode="json")
             self._save_state()
             return True
         except Exception as e:
@@ -221,6 +296,52 @@ class MahjongGameService:
         except Exception as e:
             return False, f"操作失败: {str(e)}"
     
+    @contextmanager
+    def batch(self):
+        """批量修改: 期间的多次修改在退出时只保存和推送一次(可嵌套)"""
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0 and self._batch_dirty:
+                    self._batch_dirty = False
+                    self._save_state()
+    
+    def process_operations(
+        self,
+        operations: List[TileOperationRequest],
+        atomic: bool = True
+    ) -> Tuple[bool, List[Tuple[bool, str]]]:
+        """按顺序批量处理操作，返回 (是否全部成功, 每项的结果)
+        
+        atomic 为True时任一操作失败则回滚全部修改，其后的操作不再执行；
+        为False时跳过失败的操作，保存其余修改。
+        """
+        results: List[Tuple[bool, str]] = []
+        all_success = True
+        
+        with self.batch():
+            backup = deepcopy(self._game_state) if atomic else None
+            # 嵌套在外层批量中时，外层已有的未保存修改在回滚后仍需保存
+            dirty_before = self._batch_dirty
+            for request in operations:
+                if atomic and not all_success:
+                    results.append((False, "未执行: 前序操作失败"))
+                    continue
+                success, message = self.process_operation(request)
+                results.append((success, message))
+                all_success = all_success and success
+            
+            if atomic and not all_success:
+                # 回滚到批量开始前的状态和修改标记
+                self._game_state = backup
+                self._batch_dirty = dirty_before
+                self._sync_analysis_context()
+        
+        return all_success, results
+    
     def _initialize_tile_pool(self) -> List[Dict]:
         """初始化牌库"""
         tiles = []
@@ -285,11 +406,13 @@ class MahjongGameService:
                     self._game_state["player_hands"][player_id_str]["tiles"]
                 )
                 print(f"✅ 我（玩家0）摸牌: {tile['value']}{tile['type']}")
+                self._save_state()
                 return True, "摸牌成功", tile
             else:
                 # 其他玩家：只增加手牌数量
                 self._game_state["player_hands"][player_id_str]["tile_count"] += 1
                 print(f"✅ 玩家{player_id}摸牌，手牌数量+1 (当前:{self._game_state['player_hands'][player_id_str]['tile_count']}张)")
+                self._save_state()
                 return True, "摸牌成功", None  # 不返回具体牌面
                 
         except Exception as e:
@@ -0,0 +1,159 @@
+"""
+玩家生涯统计
+
+按玩家昵称累计跨局统计(局数、胡牌率、点炮率、平均得分、碰杠频率)，
+在每局结束时增量更新，查询和排行无需扫描历史牌谱。
+
+存储结构:
+- player_stats:{name}       哈希，累计计数
+- player_rank:{metric}      有序集合，各排行指标
+- player_stats:recorded:{game_id}  已计入统计的游戏标记，防止重复累计
+"""
+
+from typing import Any, Dict, List, Optional
+
+from app.models.game_record import GameRecord
+from app.services.redis_service import RedisService
+
+# 支持排行的指标
+RANK_METRICS = ["games", "wins", "total_score", "win_rate", "avg_score", "deal_in_rate"]
+
+# 游戏计入标记保留时间，应长于牌谱可能被重复结算的时间窗口
+RECORDED_MARK_TTL = 30 * 24 * 3600
+
+# 一次调用完成整局所有玩家的累计和排行更新，保证原子性和幂等
+# KEYS[1]: 游戏计入标记  KEYS[2..7]: 排行有序集合(顺序同 RANK_METRICS)  KEYS[8..]: 玩家哈希
+# ARGV[1]: 标记过期秒数  之后每个玩家6个参数: 昵称、是否胡牌、是否点炮、得分、碰牌数、杠牌数
+_RECORD_GAME_SCRIPT = """
+if not redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+for i = 1, #KEYS - 7 do
+    local key = KEYS[7 + i]
+    local base = 1 + (i - 1) * 6
+    local name = ARGV[base + 1]
+    local games = redis.call('HINCRBY', key, 'games', 1)
+    local wins = redis.call('HINCRBY', key, 'wins', ARGV[base + 2])
+    local deal_ins = redis.call('HINCRBY', key, 'deal_ins', ARGV[base + 3])
+    local total_score = redis.call('HINCRBY', key, 'total_score', ARGV[base + 4])
+    redis.call('HINCRBY', key, 'peng', ARGV[base + 5])
+    redis.call('HINCRBY', key, 'gang', ARGV[base + 6])
+    redis.call('ZADD', KEYS[2], games, name)
+    redis.call('ZADD', KEYS[3], wins, name)
+    redis.call('ZADD', KEYS[4], total_score, name)
+    redis.call('ZADD', KEYS[5], tostring(wins / games), name)
+    redis.call('ZADD', KEYS[6], tostring(total_score / games), name)
+    redis.call('ZADD', KEYS[7], tostring(deal_ins / games), name)
+end
+return 1
+"""
+
+
+class PlayerAnalyticsService:
+    """玩家生涯统计服务"""
+
+    def __init__(self, redis_service: RedisService):
+        self.redis = redis_service
+        self._record_script = None
+
+    async def record_game(self, game_record: GameRecord) -> bool:
+        """将一局结果计入各玩家生涯统计，重复调用同一局不会重复累计"""
+        if self._record_script is None:
+            self._record_script = self.redis.client.register_script(_RECORD_GAME_SCRIPT)
+
+        keys = [f"player_stats:recorded:{game_record.game_id}"]
+        keys.extend(self._rank_key(metric) for metric in RANK_METRICS)
+        args: List[Any] = [RECORDED_MARK_TTL]
+
+        for player in game_record.players:
+            keys.append(self._stats_key(player.player_name))
+            args.extend([
+                player.player_name,
+                1 if player.is_winner else 0,
+                1 if player.deal_in_count > 0 else 0,
+                player.final_score,
+                player.peng_count,
+                player.gang_count
+            ])
+
+        result = await self._record_script(keys=keys, args=args)
+        return bool(result)
+
+    async def get_player_stats(self, player_name: str) -> Optional[Dict[str, Any]]:
+        """获取玩家生涯统计"""
+        data = await self.redis.client.hgetall(self._stats_key(player_name))
+        if not data:
+            return None
+        return self._build_stats(player_name, data)
+
+    async def get_leaderboard(
+        self,
+        metric: str,
+        limit: int = 20,
+        min_games: int = 1
+    ) -> List[Dict[str, Any]]:
+        """按指标获取排行榜，只统计局数不少于 min_games 的玩家"""
+        if metric not in RANK_METRICS:
+            raise ValueError(f"不支持的排行指标: {metric}")
+
+        rank_key = self._rank_key(metric)
+        leaderboard = []
+        offset = 0
+        page_size = max(limit, 50)
+
+        while len(leaderboard) < limit:
+            entries = await self.redis.client.zrevrange(
+                rank_key, offset, offset + page_size - 1, withscores=True
+            )
+            if not entries:
+                break
+            offset += len(entries)
+
+            pipe = self.redis.client.pipeline(transaction=False)
+            for player_name, _ in entries:
+                pipe.hgetall(self._stats_key(player_name))
+            all_stats = await pipe.execute()
+
+            for (player_name, score), data in zip(entries, all_stats):
+                if not data or int(data.get("games", 0)) < min_games:
+                    continue
+                leaderboard.append({
+                    "rank": len(leaderboard) + 1,
+                    "player_name": player_name,
+                    "score": score,
+                    "stats": self._build_stats(player_name, data)
+                })
+                if len(leaderboard) >= limit:
+                    break
+
+        return leaderboard
+
+    def _build_stats(self, player_name: str, data: Dict[str, str]) -> Dict[str, Any]:
+        """由累计计数计算比率类指标"""
+        games = int(data.get("games", 0))
+        wins = int(data.get("wins", 0))
+        deal_ins = int(data.get("deal_ins", 0))
+        total_score = int(data.get("total_score", 0))
+        peng = int(data.get("peng", 0))
+        gang = int(data.get("gang", 0))
+
+        return {
+            "player_name": player_name,
+            "games": games,
+            "wins": wins,
+            "win_rate": wins / games if games else 0.0,
+            "deal_ins": deal_ins,
+            "deal_in_rate": deal_ins / games if games else 0.0,
+            "total_score": total_score,
+            "avg_score": total_score / games if games else 0.0,
+            "peng_count": peng,
+            "gang_count": gang,
+            "peng_per_game": peng / games if games else 0.0,
+            "gang_per_game": gang / games if games else 0.0
+        }
+
+    def _stats_key(self, player_name: str) -> str:
+        return f"player_stats:{player_name}"
+
+    def _rank_key(self, metric: str) -> str:
+        return f"player_rank:{metric}"
@@ -0,0 +1,114 @@
+"""
+批量局面分析
+
+局面以紧凑形式提交: 手牌和可见牌都是整数牌码列表，不需要构造完整的 GameState。
+局面按块发送到常驻进程池中评估，每块完成后立即按行输出结果(NDJSON)，
+同时在途的块数有上限，大批量请求不会一次占满内存和工作进程。
+
+每行结果:
+{"index": 0, "id": "...", "recommended_discard": 5, "discard_scores": {"5": -1.0, ...},
+ "listen_tiles": [3, 6], "win_probability": 0.05}
+局面无效时该行为 {"index": 0, "id": "...", "error": "..."}，不影响其他局面。
+"""
+
+import asyncio
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from app.algorithms.mahjong_analyzer import MahjongAnalyzer
+from app.models.mahjong import CompactPosition, Tile
+from app.services.analysis_worker import get_worker_analyzer, init_worker
+
+# 全部牌码
+TILE_CODES = [suit * 10 + value for suit in range(3) for value in range(1, 10)]
+
+# (序号, 局面标识, 手牌, 可见牌)
+PositionTask = Tuple[int, Optional[str], List[int], List[int]]
+
+def remaining_from_codes(hand: Sequence[int], visible: Sequence[int]) -> Dict[int, int]:
+    """按手牌和可见牌计算每种牌的剩余数量(以牌编码为键)"""
+    used = Counter(hand)
+    used.update(visible)
+    return {code: max(0, 4 - used[code]) for code in TILE_CODES}
+
+
+def analyze_position(analyzer: MahjongAnalyzer, hand: Sequence[int], visible: Sequence[int]) -> Dict[str, Any]:
+    """分析单个紧凑局面，牌码无效或同种牌超过4张时抛出 ValueError"""
+    tiles = [Tile.from_code(code) for code in hand]
+    for code in visible:
+        Tile.from_code(code)
+    counts = Counter(hand)
+    counts.update(visible)
+    overused = [code for code, count in counts.items() if count > 4]
+    if overused:
+        raise ValueError(f"牌数量超过4张: {overused}")
+
+    return analyzer.analyze_hand_compact(tiles, remaining_from_codes(hand, visible))
+
+
+def evaluate_positions(tasks: List[PositionTask]) -> List[Dict[str, Any]]:
+    """评估一块局面(在工作进程中执行)"""
+    analyzer = get_worker_analyzer()
+    results = []
+    for index, position_id, hand, visible in tasks:
+        try:
+            result = {"index": index, "id": position_id, **analyze_position(analyzer, hand, visible)}
+        except ValueError as e:
+            result = {"index": index, "id": position_id, "error": str(e)}
+        results.append(result)
+    return results
+
+
+class PositionBatchAnalyzer:
+    """批量局面分析，进程池在首次使用时创建并在应用关闭前常驻"""
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = 32, max_in_flight: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight or self.workers * 2
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+        return self._pool
+
+    async def stream(self, positions: List[CompactPosition]) -> AsyncIterator[str]:
+        """按块评估局面，每块完成后输出其结果行(按完成顺序，以 index 对应请求中的位置)"""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        pending = set()
+
+        try:
+            for start in range(0, len(positions), self.chunk_size):
+                chunk = [
+                    (start + offset, position.id, position.hand, position.visible)
+                    for offset, position in enumerate(positions[start:start + self.chunk_size])
+                ]
+                pending.add(loop.run_in_executor(pool, evaluate_positions, chunk))
+
+                if len(pending) >= self.max_in_flight:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield self._format_lines(task.result())
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield self._format_lines(task.result())
+        finally:
+            # 客户端中途断开时不再等待剩余的块
+            for task in pending:
+                task.cancel()
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _format_lines(self, results: List[Dict[str, Any]]) -> str:
+        return "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in results)
@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio as aioredis
 import json
 import logging
 from typing import Any, Optional, Dict
@@ -11,6 +12,9 @@ class RedisService:
     
     def __init__(self):
         self.redis_client = None
+        # 异步客户端及其连接池，首次使用时创建，由所有异步服务共享
+        self._async_pool: Optional[aioredis.ConnectionPool] = None
+        self._async_client: Optional[aioredis.Redis] = None
         self._initialize_connection()
     
     def _initialize_connection(self):
@@ -32,6 +36,31 @@ class RedisService:
             logger.warning(f"Redis连接失败: {e}")
             self.redis_client = None
     
+    @property
+    def client(self) -> aioredis.Redis:
+        """基于连接池的异步客户端(供牌谱等异步服务使用)"""
+        if self._async_client is None:
+            self._async_pool = aioredis.ConnectionPool(
+                host=getattr(settings, 'REDIS_HOST', 'localhost'),
+                port=getattr(settings, 'REDIS_PORT', 6379),
+                db=getattr(settings, 'REDIS_DB', 0),
+                password=getattr(settings, 'REDIS_PASSWORD', None),
+                decode_responses=True,
+                socket_connect_timeout=5,
+                socket_timeout=5,
+                max_connections=getattr(settings, 'REDIS_MAX_CONNECTIONS', 50)
+            )
+            self._async_client = aioredis.Redis(connection_pool=self._async_pool)
+        return self._async_client
+    
+    async def close(self):
+        """关闭异步客户端并断开连接池中的连接"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            await self._async_pool.disconnect()
+            self._async_client = None
+            self._async_pool = None
+    
     def is_connected(self) -> bool:
         """检查Redis连接状态"""
         if not self.redis_client:
@@ -0,0 +1,309 @@
+"""
+牌谱磁盘归档
+
+已结束的游戏以紧凑二进制格式追加写入本地段文件，不受Redis过期时间限制。
+
+目录结构:
+- segment_000001.xzr   段文件，每条记录为 4字节长度 + 紧凑牌谱数据
+- index.dat            按键排序的定长索引，通过内存映射二分查找
+- index.journal        尚未合并进 index.dat 的新索引项(追加写入)
+- archive.lock         写入和重新加载索引时持有的文件锁
+
+索引项: 键(game_id 的16字节摘要) | 开始时间(微秒) | 段号 | 偏移 | 长度。
+长度为0的索引项是删除标记，合并索引时连同原索引项一起去掉。
+查找一局牌谱只需一次二分查找和一次文件读取。多个进程可以同时读写:
+写入、合并索引和重新加载索引都在文件锁内进行，写入前先读入其他进程追加的日志项，
+段文件以追加模式写入，记录的偏移取自写入后的文件大小。
+查找前比较日志大小和索引文件状态，其他进程有写入时先重新加载，不会返回已被删除的牌谱。
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from app.models.game_record import GameRecord, encode_compact_record, decode_compact_record
+
+logger = logging.getLogger(__name__)
+
+# 键(16) | 开始时间微秒(8) | 段号(4) | 偏移(8) | 长度(4)
+INDEX_ENTRY = struct.Struct(">16sqIQI")
+RECORD_HEADER = struct.Struct(">I")
+
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+COMPACT_THRESHOLD = 1024
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class ReplayArchive:
+    """基于段文件和内存映射索引的牌谱归档"""
+
+    def __init__(
+        self,
+        root_dir: str,
+        segment_max_bytes: int = SEGMENT_MAX_BYTES,
+        compact_threshold: int = COMPACT_THRESHOLD
+    ):
+        self.root_dir = root_dir
+        self.segment_max_bytes = segment_max_bytes
+        self.compact_threshold = compact_threshold
+        self.index_path = os.path.join(root_dir, "index.dat")
+        self.journal_path = os.path.join(root_dir, "index.journal")
+        self.lock_path = os.path.join(root_dir, "archive.lock")
+
+        self._lock = threading.Lock()
+        self._index_file = None
+        self._index_map: Optional[mmap.mmap] = None
+        self._index_stat: Optional[Tuple[int, int, int]] = None
+        self._journal_offset = 0
+        # 日志中尚未合并的索引项: 键 -> 索引项
+        self._pending: Dict[bytes, Tuple] = {}
+
+        os.makedirs(root_dir, exist_ok=True)
+        with self._locked():
+            self._refresh()
+
+    def append(self, game_record: GameRecord):
+        """归档一局牌谱，同一局重复归档时以最新一次为准"""
+        data = encode_compact_record(game_record)
+        key = self._key(game_record.game_id)
+        start_micros = self._to_micros(game_record.start_time)
+
+        with self._locked():
+            self._refresh()
+            segment_id, segment_size = self._find_current_segment()
+            if segment_size and segment_size + RECORD_HEADER.size + len(data) > self.segment_max_bytes:
+                segment_id += 1
+
+            with open(self._segment_path(segment_id), "ab") as f:
+                f.write(RECORD_HEADER.pack(len(data)) + data)
+                f.flush()
+                offset = os.fstat(f.fileno()).st_size - len(data)
+
+            self._append_entry((key, start_micros, segment_id, offset, len(data)))
+
+    def get(self, game_id: str) -> Optional[GameRecord]:
+        """读取归档的牌谱，不存在时返回None"""
+        entry = self._lookup(self._key(game_id))
+        if entry is None:
+            return None
+
+        _, _, segment_id, offset, length = entry
+        try:
+            with open(self._segment_path(segment_id), "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+            game_record = decode_compact_record(data)
+        except Exception as e:
+            logger.warning(f"读取归档牌谱 {game_id} 失败: {e}")
+            return None
+        # 摘要冲突时键相同但游戏ID不同
+        if game_record.game_id != game_id:
+            return None
+        return game_record
+
+    def delete(self, game_id: str):
+        """删除归档的牌谱: 写入删除标记，段文件中的数据不再可达"""
+        key = self._key(game_id)
+        with self._locked():
+            self._refresh()
+            self._append_entry((key, 0, 0, 0, 0))
+
+    def contains(self, game_id: str) -> bool:
+        """检查牌谱是否已归档"""
+        return self._lookup(self._key(game_id)) is not None
+
+    def compact(self):
+        """将日志中的索引项合并进排序索引"""
+        with self._locked():
+            self._refresh()
+            self._compact_locked()
+
+    def close(self):
+        """释放索引映射"""
+        with self._lock:
+            self._close_index()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """持有线程锁和跨进程的文件锁"""
+        with self._lock, open(self.lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _lookup(self, key: bytes) -> Optional[Tuple]:
+        """查找索引项，其他进程写入过日志(包括删除标记)或合并过索引时先重新加载"""
+        with self._lock:
+            if self._is_current():
+                return self._find(key)
+        with self._locked():
+            self._refresh()
+            return self._find(key)
+
+    def _is_current(self) -> bool:
+        """已加载的索引和日志是否与磁盘一致"""
+        journal_size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        return journal_size == self._journal_offset and self._stat(self.index_path) == self._index_stat
+
+    def _append_entry(self, entry: Tuple):
+        """追加索引项到日志(调用方需持有锁并已重新加载日志)"""
+        with open(self.journal_path, "ab") as f:
+            f.write(INDEX_ENTRY.pack(*entry))
+            f.flush()
+            self._journal_offset = os.fstat(f.fileno()).st_size
+        self._pending[entry[0]] = entry
+
+        if len(self._pending) >= self.compact_threshold:
+            self._compact_locked()
+
+    def _find(self, key: bytes) -> Optional[Tuple]:
+        """先查未合并的日志项，再在排序索引中二分查找，已删除的返回None"""
+        entry = self._pending.get(key)
+        if entry is not None:
+            return entry if entry[4] else None
+
+        if self._index_map is None:
+            return None
+
+        low, high = 0, len(self._index_map) // INDEX_ENTRY.size
+        while low < high:
+            middle = (low + high) // 2
+            position = middle * INDEX_ENTRY.size
+            middle_key = self._index_map[position:position + 16]
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return INDEX_ENTRY.unpack_from(self._index_map, position)
+        return None
+
+    def _compact_locked(self):
+        """合并索引(调用方需持有锁并已重新加载日志，否则会丢失其他进程的索引项)"""
+        if not self._pending:
+            return
+
+        entries: Dict[bytes, Tuple] = {}
+        if self._index_map is not None:
+            for position in range(0, len(self._index_map), INDEX_ENTRY.size):
+                entry = INDEX_ENTRY.unpack_from(self._index_map, position)
+                entries[entry[0]] = entry
+        for key, entry in self._pending.items():
+            if entry[4]:
+                entries[key] = entry
+            else:
+                entries.pop(key, None)
+
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            for key in sorted(entries):
+                f.write(INDEX_ENTRY.pack(*entries[key]))
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._close_index()
+        os.replace(temp_path, self.index_path)
+        self._open_index()
+
+        with open(self.journal_path, "wb"):
+            pass
+        self._journal_offset = 0
+        self._pending.clear()
+
+    def _refresh(self):
+        """重新加载被其他进程更新的索引和日志(调用方需持有锁)"""
+        journal_size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        if self._stat(self.index_path) != self._index_stat or journal_size < self._journal_offset:
+            # 索引已被重新合并，日志随之清空，从头读取日志
+            self._close_index()
+            self._open_index()
+            self._journal_offset = 0
+            self._pending.clear()
+        if journal_size > self._journal_offset:
+            self._read_journal()
+
+    def _open_index(self):
+        self._index_stat = self._stat(self.index_path)
+        if self._index_stat is None or self._index_stat[1] == 0:
+            return
+        self._index_file = open(self.index_path, "rb")
+        self._index_map = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close_index(self):
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_map = None
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+
+    def _read_journal(self):
+        """从上次读取的位置继续读取日志"""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._journal_offset)
+            data = f.read()
+
+        # 忽略写入不完整的尾部
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        for position in range(0, usable, INDEX_ENTRY.size):
+            entry = INDEX_ENTRY.unpack_from(data, position)
+            self._pending[entry[0]] = entry
+        self._journal_offset += usable
+
+    def _find_current_segment(self) -> Tuple[int, int]:
+        """找到最新的段文件及其大小"""
+        segment_ids = [
+            int(name[len("segment_"):-len(".xzr")])
+            for name in os.listdir(self.root_dir)
+            if name.startswith("segment_") and name.endswith(".xzr")
+        ]
+        if not segment_ids:
+            return 1, 0
+        segment_id = max(segment_ids)
+        return segment_id, os.path.getsize(self._segment_path(segment_id))
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.root_dir, f"segment_{segment_id:06d}.xzr")
+
+    @staticmethod
+    def _stat(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def _key(game_id: str) -> bytes:
+        return hashlib.blake2b(game_id.encode("utf-8"), digest_size=16).digest()
+
+    @staticmethod
+    def _to_micros(value: datetime) -> int:
+        if value.tzinfo is not None:
+            return int(value.timestamp() * 1_000_000)
+        return (value - _EPOCH) // timedelta(microseconds=1)
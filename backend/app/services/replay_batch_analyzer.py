@@ -0,0 +1,151 @@
+"""
+牌谱批量决策分析
+
+遍历已存储的牌谱，在玩家0每次弃牌前重建手牌和可见牌，将实际弃牌与
+MahjongAnalyzer 的推荐进行比较，输出每局和汇总的一致率。
+
+牌谱以紧凑二进制格式发送到进程池中评估，主进程只负责读取和汇总，
+同时在途的任务数有上限，内存占用与牌谱数量无关。
+"""
+
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+from app.models.game_record import (
+    ActionType, ReplayExportFilter, canonical_card_id, card_index_name,
+    encode_compact_record, decode_compact_record
+)
+from app.models.mahjong import Tile
+from app.services.analysis_worker import get_worker_analyzer, init_worker
+from app.services.replay_state import ReplayState, MELD_PENG
+
+logger = logging.getLogger(__name__)
+
+# 评估的玩家(玩家0为"我")
+TARGET_PLAYER = 0
+
+def _visible_remaining_counts(state: ReplayState, player_id: int) -> Dict[int, int]:
+    """按玩家视角计算每种牌的剩余数量(以牌编码为键)"""
+    used = list(state.hands[player_id])
+    for discards in state.discards:
+        for index in discards:
+            used[index] += 1
+    for melds in state.melds:
+        for kind, index in melds:
+            used[index] += 3 if kind == MELD_PENG else 4
+
+    return {canonical_card_id(index): max(0, 4 - used[index]) for index in range(27)}
+
+
+def evaluate_game(record_data: bytes) -> Dict[str, Any]:
+    """评估一局牌谱中目标玩家的全部弃牌决策(在工作进程中执行)"""
+    analyzer = get_worker_analyzer()
+    game_record = decode_compact_record(record_data)
+    state = ReplayState.initial(game_record)
+
+    decisions = 0
+    agreements = 0
+    total_score_loss = 0.0
+
+    for action in game_record.actions:
+        if (action.player_id == TARGET_PLAYER and action.action_type == ActionType.DISCARD
+                and action.card is not None):
+            hand = state.hands[TARGET_PLAYER]
+            tiles = [
+                Tile.from_code(canonical_card_id(index))
+                for index, count in enumerate(hand)
+                for _ in range(count)
+            ]
+            actual = card_index_name(action.card.to_index())
+
+            if tiles and actual in {str(tile) for tile in tiles}:
+                analysis = analyzer.analyze_hand(tiles, _visible_remaining_counts(state, TARGET_PLAYER))
+                recommended = analysis.recommended_discard
+                scores = analysis.discard_scores
+
+                decisions += 1
+                if recommended is not None and str(recommended) == actual:
+                    agreements += 1
+                # 分数越高越应该弃，损失为推荐弃牌与实际弃牌的分差
+                total_score_loss += max(scores.values()) - scores[actual]
+
+        state.apply(action)
+
+    return {
+        "game_id": game_record.game_id,
+        "start_time": game_record.start_time.isoformat(),
+        "decisions": decisions,
+        "agreements": agreements,
+        "agreement_rate": agreements / decisions if decisions else None,
+        "avg_score_loss": total_score_loss / decisions if decisions else None
+    }
+
+
+class ReplayBatchAnalyzer:
+    """批量分析已存储的牌谱"""
+
+    def __init__(self, replay_service, workers: Optional[int] = None, max_in_flight: Optional[int] = None):
+        self.replay_service = replay_service
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.workers * 4
+
+    async def run(self, query: ReplayExportFilter, output_path: str) -> Dict[str, Any]:
+        """分析满足条件的牌谱，每局结果按行写入 output_path(失败的牌谱写入错误行)，返回汇总结果"""
+        loop = asyncio.get_running_loop()
+        aggregate = {
+            "games": 0,
+            "games_with_decisions": 0,
+            "decisions": 0,
+            "agreements": 0,
+            "failed_games": 0
+        }
+        total_score_loss = 0.0
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker) as pool, \
+                open(output_path, "w", encoding="utf-8") as output:
+            pending = set()
+            game_ids = {}
+
+            def collect(done_tasks):
+                nonlocal total_score_loss
+                for task in done_tasks:
+                    aggregate["games"] += 1
+                    game_id = game_ids.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        aggregate["failed_games"] += 1
+                        logger.warning("牌谱分析失败 %s: %r", game_id, e, exc_info=e)
+                        output.write(json.dumps({"game_id": game_id, "error": repr(e)}, ensure_ascii=False) + "\n")
+                        continue
+
+                    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    if result["decisions"]:
+                        aggregate["games_with_decisions"] += 1
+                        aggregate["decisions"] += result["decisions"]
+                        aggregate["agreements"] += result["agreements"]
+                        total_score_loss += result["avg_score_loss"] * result["decisions"]
+
+            async for game_record in self.replay_service.iter_game_records(query):
+                record_data = encode_compact_record(game_record)
+                task = loop.run_in_executor(pool, evaluate_game, record_data)
+                game_ids[task] = game_record.game_id
+                pending.add(task)
+
+                if len(pending) >= self.max_in_flight:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    collect(done)
+
+            if pending:
+                done, _ = await asyncio.wait(pending)
+                collect(done)
+
+        decisions = aggregate["decisions"]
+        aggregate["agreement_rate"] = aggregate["agreements"] / decisions if decisions else None
+        aggregate["avg_score_loss"] = total_score_loss / decisions if decisions else None
+        return aggregate
+
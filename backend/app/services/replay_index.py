@@ -0,0 +1,144 @@
+"""
+牌谱倒排索引
+
+每局结束时提取检索词写入倒排表，查询时对倒排表求交集，无需扫描牌谱内容。
+
+检索词:
+- action:{操作类型}            出现过该操作，如 action:gang
+- mode:{游戏模式}              如 mode:xuezhan
+- player:{昵称}                参与的玩家
+- win:{玩家ID}                 该座位玩家胡牌
+- hu_type:{胡牌类型}           如 hu_type:清一色
+- win:{玩家ID}:{胡牌类型}      如 win:0:清一色
+- {操作类型}:{牌}              牌与操作组合，如 discard:7条、peng:5万、hu:3筒
+- deal_in:{牌}                 点炮的牌，如 deal_in:7条
+
+存储结构:
+- replay_idx:term:{检索词}     集合，包含该检索词的游戏ID
+- replay_idx:count:{操作类型}  有序集合，score为该操作在一局中的次数
+- replay_idx:game:{game_id}    集合，该局写入过的索引键(用于删除)
+
+检索在Redis中完成: 操作次数条件先复制为临时有序集合并删掉低于下限的项，
+再与开始时间索引和各检索词集合求交集(ZINTERSTORE)，结果以开始时间为score，
+按页取出即可，不在应用中逐个查询开始时间。没有开始时间索引的牌谱不会出现在结果中。
+"""
+
+import uuid
+from typing import Any, Dict, Set, Tuple
+
+from app.models.game_record import ActionType, GameRecord, ReplayQuery
+from app.services.redis_service import RedisService
+from app.services.replay_keys import GAME_INDEX_KEY
+
+# 检索用临时键的过期时间(秒)，正常情况下检索结束即删除
+SEARCH_TEMP_TTL = 30
+
+# 记录牌与操作组合的操作类型
+_TILE_EVENT_ACTIONS = {ActionType.DISCARD, ActionType.PENG, ActionType.GANG, ActionType.HU}
+
+
+def extract_terms(game_record: GameRecord) -> Tuple[Set[str], Dict[str, int]]:
+    """提取一局牌谱的检索词和各操作次数"""
+    terms = {f"mode:{game_record.game_mode}"}
+    action_counts: Dict[str, int] = {}
+
+    for player in game_record.players:
+        terms.add(f"player:{player.player_name}")
+        if player.is_winner:
+            terms.add(f"win:{player.player_id}")
+            if player.hu_type:
+                terms.add(f"hu_type:{player.hu_type}")
+                terms.add(f"win:{player.player_id}:{player.hu_type}")
+
+    for action in game_record.actions:
+        action_type = action.action_type.value
+        terms.add(f"action:{action_type}")
+        action_counts[action_type] = action_counts.get(action_type, 0) + 1
+
+        if action.card is not None and action.action_type in _TILE_EVENT_ACTIONS:
+            terms.add(f"{action_type}:{action.card}")
+            if (action.action_type == ActionType.HU and action.target_player is not None
+                    and action.target_player != action.player_id):
+                terms.add(f"deal_in:{action.card}")
+
+    return terms, action_counts
+
+
+class ReplayIndexService:
+    """牌谱倒排索引服务"""
+
+    def __init__(self, redis_service: RedisService):
+        self.redis = redis_service
+
+    async def index_game(self, game_record: GameRecord):
+        """将一局牌谱写入倒排索引(重复写入同一局是幂等的)"""
+        terms, action_counts = extract_terms(game_record)
+        game_id = game_record.game_id
+        term_keys = [self._term_key(term) for term in terms]
+        count_keys = {self._count_key(action_type): count for action_type, count in action_counts.items()}
+
+        pipe = self.redis.client.pipeline(transaction=True)
+        for key in term_keys:
+            pipe.sadd(key, game_id)
+        for key, count in count_keys.items():
+            pipe.zadd(key, {game_id: count})
+        pipe.sadd(self._game_key(game_id), *term_keys, *count_keys)
+        await pipe.execute()
+
+    async def remove_game(self, game_id: str):
+        """从倒排索引中删除一局牌谱"""
+        game_key = self._game_key(game_id)
+        keys = await self.redis.client.smembers(game_key)
+
+        pipe = self.redis.client.pipeline(transaction=True)
+        for key in keys:
+            if key.startswith("replay_idx:count:"):
+                pipe.zrem(key, game_id)
+            else:
+                pipe.srem(key, game_id)
+        pipe.delete(game_key)
+        await pipe.execute()
+
+    async def search(self, query: ReplayQuery) -> Dict[str, Any]:
+        """对检索词和操作次数条件求交集，按开始时间倒序分页返回游戏ID"""
+        if not query.terms and not query.min_counts:
+            raise ValueError("至少需要一个检索条件")
+
+        prefix = f"replay_idx:tmp:{uuid.uuid4().hex}"
+        result_key = f"{prefix}:result"
+        temp_keys = [result_key]
+        # 开始时间索引提供score，其余集合权重为0只用于过滤
+        weights = {GAME_INDEX_KEY: 1}
+        for term in query.terms:
+            weights[self._term_key(term)] = 0
+
+        pipe = self.redis.client.pipeline(transaction=True)
+        for action_type, min_count in query.min_counts.items():
+            count_key = f"{prefix}:count:{action_type}"
+            temp_keys.append(count_key)
+            weights[count_key] = 0
+            pipe.zunionstore(count_key, [self._count_key(action_type)])
+            pipe.zremrangebyscore(count_key, "-inf", f"({min_count}")
+        pipe.zinterstore(result_key, weights)
+        for key in temp_keys:
+            pipe.expire(key, SEARCH_TEMP_TTL)
+        pipe.zcard(result_key)
+        pipe.zrevrange(result_key, query.offset, query.offset + query.limit - 1)
+        pipe.delete(*temp_keys)
+        results = await pipe.execute()
+
+        return {
+            "total": results[-3],
+            "offset": query.offset,
+            "limit": query.limit,
+            "game_ids": results[-2]
+        }
+
+    def _term_key(self, term: str) -> str:
+        return f"replay_idx:term:{term}"
+
+    def _count_key(self, action_type: str) -> str:
+        return f"replay_idx:count:{action_type}"
+
+    def _game_key(self, game_id: str) -> str:
+        return f"replay_idx:game:{game_id}"
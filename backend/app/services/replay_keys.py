@@ -0,0 +1,8 @@
+"""
+牌谱相关的共用Redis键
+
+牌谱服务和检索索引都要读写的键在此统一定义。
+"""
+
+# 按开始时间排序的牌谱索引(有序集合，score为开始时间戳)
+GAME_INDEX_KEY = "game_index:start_time"
@@ -1,22 +1,48 @@
+import asyncio
 import json
 import zipfile
-import io
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator
 from datetime import datetime, timedelta
 from pathlib import Path
 
 from app.models.game_record import (
     GameRecord, GameAction, PlayerGameRecord, 
-    GameReplay, ActionType, MahjongCard, GangType
+    GameReplay, ActionType, MahjongCard, GangType, ReplayExportFilter,
+    GameRecordSummary, GAME_RECORD_SUMMARIES, ReplayQuery, encode_compact_record
 )
 from app.services.redis_service import RedisService
+from app.services.replay_state import ReplayState, ReplayStateReconstructor
+from app.services.player_analytics import PlayerAnalyticsService
+from app.services.replay_archive import ReplayArchive
+from app.services.replay_index import ReplayIndexService
+from app.services.replay_keys import GAME_INDEX_KEY
+from app.core.config import settings
+
+# 流式导出时每次输出的数据块大小
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# 批量读取牌谱时每次流水线获取的数量
+FETCH_BATCH_SIZE = 100
+
+# 牌谱在Redis中的保存时间
+GAME_RECORD_TTL = 7 * 24 * 3600  # 7天过期
 
 class ReplayService:
     """牌谱服务类"""
     
     def __init__(self, redis_service: RedisService):
         self.redis = redis_service
+        self.analytics = PlayerAnalyticsService(redis_service)
+        self.index = ReplayIndexService(redis_service)
+        # 磁盘归档，Redis中的牌谱过期后仍可查询
+        self.archive = ReplayArchive(settings.REPLAY_ARCHIVE_DIR) if settings.REPLAY_ARCHIVE_ENABLED else None
         self.current_games: Dict[str, GameRecord] = {}
+        # 进行中游戏的实时回放状态，用于生成关键帧
+        self.live_states: Dict[str, ReplayState] = {}
+        # 进行中游戏的增量统计(操作分布和关键操作时间线)
+        self.live_stats: Dict[str, Dict[str, Any]] = {}
+        # 开始时间索引为空时是否已尝试重建(索引建立前保存的牌谱)
+        self._game_index_checked = False
     
     async def start_game_recording(
         self, 
@@ -41,12 +67,14 @@ class ReplayService:
             start_time=datetime.now(),
             player_count=len(players),
             game_mode=game_mode,
-            players=player_records
+            players=player_records,
+            keyframe_interval=settings.REPLAY_KEYFRAME_INTERVAL
         )
         
         # 保存到内存和Redis
         self.current_games[game_id] = game_record
         await self._save_game_record(game_record)
+        await self.redis.client.zadd(GAME_INDEX_KEY, {game_id: game_record.start_time.timestamp()})
         
         return game_record
     
@@ -89,10 +117,21 @@ class ReplayService:
         player_record = game_record.players[player_id]
         self._update_player_statistics(player_record, action)
         
+        # 点炮胡牌时记录点炮玩家
+        if (action.action_type == ActionType.HU and action.target_player is not None
+                and action.target_player != player_id):
+            game_record.players[action.target_player].deal_in_count += 1
+        
         # 保存关键状态快照
         if game_state_snapshot and self._is_key_moment(action):
             game_record.snapshots[action.sequence] = game_state_snapshot
         
+        # 更新实时回放状态，按间隔保存关键帧
+        self._update_keyframes(game_record, action)
+        
+        # 增量更新统计信息
+        self._update_game_statistics(game_record, action)
+        
         # 保存到Redis
         await self._save_game_record(game_record)
         
@@ -112,6 +151,10 @@ class ReplayService:
         player_record = game_record.players[player_id]
         player_record.initial_hand = initial_cards
         
+        # 起手牌变化后已有关键帧失效，已记录操作时立即重新生成
+        game_record.keyframes = ReplayStateReconstructor.build_keyframes(game_record) if game_record.actions else {}
+        self.live_states.pop(game_id, None)
+        
         await self._save_game_record(game_record)
     
     async def record_missing_suit(
@@ -167,10 +210,53 @@ class ReplayService:
         
         # 最终保存
         await self._save_game_record(game_record)
+        # 游戏已结束，不再需要实时回放状态
+        self.live_states.pop(game_id, None)
+        
+        # 物化统计信息，统计接口无需再加载操作序列
+        await self._save_game_statistics(self._build_game_statistics(game_record))
+        self.live_stats.pop(game_id, None)
+        
+        # 累计玩家生涯统计
+        await self.analytics.record_game(game_record)
+        
+        # 写入检索用的倒排索引
+        await self.index.index_game(game_record)
+        
+        # 归档到磁盘
+        if self.archive:
+            await asyncio.to_thread(self.archive.append, game_record)
         
         # 从内存中移除(可选)
         # del self.current_games[game_id]
     
+    async def delete_game(self, game_id: str):
+        """删除牌谱及其统计、索引和磁盘归档"""
+        self.current_games.pop(game_id, None)
+        self.live_states.pop(game_id, None)
+        self.live_stats.pop(game_id, None)
+        
+        pipe = self.redis.client.pipeline(transaction=True)
+        pipe.delete(f"game_record:{game_id}", f"game_stats:{game_id}")
+        pipe.zrem(GAME_INDEX_KEY, game_id)
+        await pipe.execute()
+        
+        # 从检索索引中移除
+        await self.index.remove_game(game_id)
+        
+        # 归档中写入删除标记，避免Redis删除后又从归档加载
+        if self.archive:
+            await asyncio.to_thread(self.archive.delete, game_id)
+    
+    async def search_replays(self, query: ReplayQuery) -> Dict[str, Any]:
+        """检索牌谱，结果中已不存在的牌谱从索引中清理后重新检索"""
+        while True:
+            result = await self.index.search(query)
+            missing_ids = await self._missing_game_ids(result["game_ids"])
+            if not missing_ids:
+                return result
+            await self._prune_game_ids(missing_ids)
+    
     async def get_game_replay(self, game_id: str) -> Optional[GameReplay]:
         """获取游戏牌谱"""
         # 先从内存查找
@@ -182,16 +268,41 @@ class ReplayService:
             if not game_record:
                 return None
         
-        replay_metadata = {
-            "generated_at": datetime.now().isoformat(),
-            "version": "1.0",
-            "format": "xuezhan_mahjong"
-        }
+        return self._build_replay(game_record)
+    
+    async def get_replay_state(self, game_id: str, sequence: int) -> Dict[str, Any]:
+        """获取指定操作序号时的回放状态"""
+        if game_id in self.current_games:
+            game_record = self.current_games[game_id]
+        else:
+            game_record = await self._load_game_record(game_id)
+            if not game_record:
+                raise ValueError(f"牌谱 {game_id} 不存在")
         
-        return GameReplay(
-            game_record=game_record,
-            replay_metadata=replay_metadata
-        )
+        state = ReplayStateReconstructor.reconstruct(game_record, sequence)
+        return state.to_view()
+    
+    async def get_game_statistics(self, game_id: str) -> Optional[Dict[str, Any]]:
+        """获取游戏统计信息
+        
+        进行中的游戏使用内存中的增量统计；已结束的游戏读取结束时物化的统计文档，
+        没有统计文档的旧牌谱才加载完整记录计算。
+        """
+        if game_id in self.current_games:
+            return self._build_game_statistics(self.current_games[game_id])
+        
+        data = await self.redis.client.get(f"game_stats:{game_id}")
+        if data:
+            return json.loads(data)
+        
+        game_record = await self._load_game_record(game_id)
+        if not game_record:
+            return None
+        
+        statistics = self._build_game_statistics(game_record)
+        if game_record.end_time:
+            await self._save_game_statistics(statistics)
+        return statistics
     
     async def export_replay_json(self, game_id: str) -> str:
         """导出JSON格式牌谱"""
@@ -199,8 +310,7 @@ class ReplayService:
         if not replay:
             raise ValueError(f"牌谱 {game_id} 不存在")
         
-        export_data = replay.to_export_format()
-        return json.dumps(export_data, ensure_ascii=False, indent=2)
+        return "".join(replay.iter_export_json())
     
     async def export_replay_file(self, game_id: str, format: str = "json") -> bytes:
         """导出牌谱文件"""
@@ -210,16 +320,179 @@ class ReplayService:
         
         if format.lower() == "json":
             # JSON格式导出
-            json_data = await self.export_replay_json(game_id)
-            return json_data.encode('utf-8')
+            return "".join(replay.iter_export_json()).encode('utf-8')
         
         elif format.lower() == "zip":
             # ZIP压缩包格式
-            return await self._export_replay_zip(replay)
+            return b"".join([chunk async for chunk in self.stream_replay_zip(replay)])
+        
+        elif format.lower() == "binary":
+            # 紧凑二进制格式，用于长期归档
+            return encode_compact_record(replay.game_record)
         
         else:
             raise ValueError(f"不支持的导出格式: {format}")
     
+    async def stream_replay_json(self, replay: GameReplay) -> AsyncIterator[bytes]:
+        """流式导出JSON格式牌谱"""
+        pending = []
+        pending_size = 0
+        for piece in replay.iter_export_json():
+            data = piece.encode('utf-8')
+            pending.append(data)
+            pending_size += len(data)
+            if pending_size >= EXPORT_CHUNK_SIZE:
+                yield b"".join(pending)
+                pending = []
+                pending_size = 0
+        
+        if pending:
+            yield b"".join(pending)
+    
+    async def stream_replay_zip(self, replay: GameReplay) -> AsyncIterator[bytes]:
+        """流式导出单局ZIP格式牌谱"""
+        async def single():
+            yield replay
+        
+        async for chunk in self._stream_zip(single(), multi_game=False):
+            yield chunk
+    
+    async def stream_replays_zip(self, game_ids: List[str]) -> AsyncIterator[bytes]:
+        """流式导出多局牌谱到同一个ZIP压缩包，不存在的牌谱记录在README中"""
+        missing_ids = []
+        
+        async def replays():
+            for game_id in game_ids:
+                replay = await self.get_game_replay(game_id)
+                if replay:
+                    yield replay
+                else:
+                    missing_ids.append(game_id)
+        
+        async for chunk in self._stream_zip(replays(), multi_game=True, missing_ids=missing_ids):
+            yield chunk
+    
+    async def iter_game_records(
+        self,
+        query: ReplayExportFilter,
+        batch_size: int = FETCH_BATCH_SIZE
+    ) -> AsyncIterator[GameRecord]:
+        """按开始时间顺序逐批读取满足条件的牌谱
+        
+        通过开始时间索引定位牌谱，每批使用一次流水线获取，已过期的索引项会被清理。
+        """
+        min_score = query.start_time.timestamp() if query.start_time else "-inf"
+        max_score = query.end_time.timestamp() if query.end_time else "+inf"
+        offset = 0
+        yielded = 0
+        
+        while True:
+            game_ids = await self.redis.client.zrangebyscore(
+                GAME_INDEX_KEY, min_score, max_score, start=offset, num=batch_size
+            )
+            if not game_ids:
+                break
+            
+            pipe = self.redis.client.pipeline(transaction=False)
+            for game_id in game_ids:
+                pipe.get(f"game_record:{game_id}")
+            results = await pipe.execute()
+            
+            expired_ids = []
+            for game_id, data in zip(game_ids, results):
+                if not data:
+                    expired_ids.append(game_id)
+                    continue
+                try:
+                    game_record = GameRecord.model_validate_json(data)
+                except Exception:
+                    continue
+                
+                if not query.matches(game_record):
+                    continue
+                
+                yield game_record
+                yielded += 1
+                if query.limit and yielded >= query.limit:
+                    return
+            
+            if expired_ids:
+                await self.redis.client.zrem(GAME_INDEX_KEY, *expired_ids)
+            offset += len(game_ids) - len(expired_ids)
+    
+    async def stream_bulk_export(self, query: ReplayExportFilter) -> AsyncIterator[bytes]:
+        """按筛选条件流式导出多局牌谱(zip 或 ndjson)"""
+        if query.format == "ndjson":
+            async for chunk in self._stream_ndjson(self.iter_game_records(query)):
+                yield chunk
+            return
+        
+        async def replays():
+            async for game_record in self.iter_game_records(query):
+                yield self._build_replay(game_record)
+        
+        async for chunk in self._stream_zip(replays(), multi_game=True):
+            yield chunk
+    
+    async def rebuild_game_index(self) -> int:
+        """扫描全部牌谱重建开始时间索引，返回索引的牌谱数量"""
+        count = 0
+        async for key in self.redis.client.scan_iter(match="game_record:*", count=500):
+            data = await self.redis.client.get(key)
+            if not data:
+                continue
+            try:
+                game_record = GameRecord.model_validate_json(data)
+            except Exception:
+                continue
+            await self.redis.client.zadd(GAME_INDEX_KEY, {game_record.game_id: game_record.start_time.timestamp()})
+            count += 1
+        return count
+    
+    async def list_recent_summaries(self, limit: int = 20) -> List[GameRecordSummary]:
+        """按开始时间倒序获取最近牌谱的摘要
+        
+        从开始时间索引取出游戏ID后一次取回全部牌谱，拼成JSON数组一次解析为摘要，
+        只解析摘要字段；有损坏的牌谱时逐条解析并跳过损坏的牌谱。
+        索引中已不存在的牌谱会被清理；索引为空时先扫描已有牌谱重建一次索引
+        (兼容索引建立前保存的牌谱，也可以用 export_replays.py --rebuild-index 预先重建)。
+        """
+        if not self._game_index_checked:
+            self._game_index_checked = True
+            if not await self.redis.client.zcard(GAME_INDEX_KEY):
+                await self.rebuild_game_index()
+        
+        while True:
+            game_ids = await self.redis.client.zrevrange(GAME_INDEX_KEY, 0, limit - 1)
+            if not game_ids:
+                return []
+            
+            results = await self.redis.client.mget([f"game_record:{game_id}" for game_id in game_ids])
+            missing_ids = await self._missing_game_ids(
+                [game_id for game_id, data in zip(game_ids, results) if not data]
+            )
+            if not missing_ids:
+                break
+            # 清理后重新读取，补足被清理的条目
+            await self._prune_game_ids(missing_ids)
+        
+        records = [data for data in results if data]
+        if not records:
+            return []
+        
+        try:
+            summaries = GAME_RECORD_SUMMARIES.validate_json("[" + ",".join(records) + "]")
+        except Exception:
+            summaries = []
+            for data in records:
+                try:
+                    summaries.append(GameRecordSummary.model_validate_json(data))
+                except Exception:
+                    continue
+        
+        summaries.sort(key=lambda summary: summary.start_time, reverse=True)
+        return summaries
+    
     async def get_player_game_history(
         self, 
         player_name: str, 
@@ -234,7 +507,7 @@ class ReplayService:
             try:
                 game_data = await self.redis.client.get(key)
                 if game_data:
-                    game_record = GameRecord.parse_raw(game_data)
+                    game_record = GameRecord.model_validate_json(game_data)
                     # 检查是否包含该玩家
                     if any(p.player_name == player_name for p in game_record.players):
                         player_games.append(game_record)
@@ -256,6 +529,91 @@ class ReplayService:
         elif action.action_type == ActionType.GANG:
             player_record.gang_count += 1
     
+    def _update_keyframes(self, game_record: GameRecord, action: GameAction):
+        """应用操作到实时回放状态，到达关键帧间隔时保存关键帧"""
+        state = self.live_states.get(game_record.game_id)
+        if state is None or state.sequence != action.sequence - 1:
+            # 首次记录或状态失效，从最近的关键帧重建
+            state = ReplayStateReconstructor.reconstruct(game_record, action.sequence - 1)
+            self.live_states[game_record.game_id] = state
+        
+        state.apply(action)
+        if action.sequence % game_record.keyframe_interval == 0:
+            game_record.keyframes[action.sequence] = state.to_keyframe()
+    
+    def _update_game_statistics(self, game_record: GameRecord, action: GameAction):
+        """增量更新操作分布和关键操作时间线"""
+        stats = self.live_stats.get(game_record.game_id)
+        if stats is None or stats["sequence"] != action.sequence - 1:
+            stats = self._compute_action_statistics(game_record.actions[:action.sequence - 1])
+            self.live_stats[game_record.game_id] = stats
+        
+        self._accumulate_action(stats, action)
+    
+    def _compute_action_statistics(self, actions: List[GameAction]) -> Dict[str, Any]:
+        """从操作序列计算操作分布和时间线"""
+        stats = {"sequence": 0, "action_distribution": {}, "timeline": []}
+        for action in actions:
+            self._accumulate_action(stats, action)
+        return stats
+    
+    def _accumulate_action(self, stats: Dict[str, Any], action: GameAction):
+        """将一个操作计入统计"""
+        action_type = action.action_type.value
+        stats["action_distribution"][action_type] = stats["action_distribution"].get(action_type, 0) + 1
+        
+        # 时间线只包含关键操作
+        if self._is_key_moment(action):
+            stats["timeline"].append({
+                "sequence": action.sequence,
+                "timestamp": action.timestamp.isoformat(),
+                "player_id": action.player_id,
+                "action_type": action_type,
+                "description": f"玩家{action.player_id+1} {action_type}"
+            })
+        stats["sequence"] = action.sequence
+    
+    def _build_game_statistics(self, game_record: GameRecord) -> Dict[str, Any]:
+        """组装完整的游戏统计文档"""
+        stats = self.live_stats.get(game_record.game_id)
+        if stats is None or stats["sequence"] != len(game_record.actions):
+            stats = self._compute_action_statistics(game_record.actions)
+        
+        return {
+            "basic_info": {
+                "game_id": game_record.game_id,
+                "duration": game_record.duration,
+                "total_actions": game_record.total_actions,
+                "winner_count": game_record.winner_count
+            },
+            "player_stats": [
+                {
+                    "player_name": p.player_name,
+                    "position": p.position,
+                    "final_score": p.final_score,
+                    "is_winner": p.is_winner,
+                    "actions": {
+                        "draw": p.draw_count,
+                        "discard": p.discard_count,
+                        "peng": p.peng_count,
+                        "gang": p.gang_count
+                    }
+                }
+                for p in game_record.players
+            ],
+            "action_distribution": dict(stats["action_distribution"]),
+            "timeline": list(stats["timeline"])
+        }
+    
+    async def _save_game_statistics(self, statistics: Dict[str, Any]):
+        """保存物化的统计文档到Redis，与牌谱同时过期"""
+        key = f"game_stats:{statistics['basic_info']['game_id']}"
+        await self.redis.client.set(
+            key,
+            json.dumps(statistics, ensure_ascii=False),
+            ex=GAME_RECORD_TTL
+        )
+    
     def _is_key_moment(self, action: GameAction) -> bool:
         """判断是否为关键时刻，需要保存状态快照"""
         key_actions = {ActionType.PENG, ActionType.GANG, ActionType.HU, ActionType.MISSING_SUIT}
@@ -266,49 +624,134 @@ class ReplayService:
         key = f"game_record:{game_record.game_id}"
         await self.redis.client.set(
             key, 
-            game_record.json(ensure_ascii=False),
-            ex=7*24*3600  # 7天过期
+            game_record.model_dump_json(),
+            ex=GAME_RECORD_TTL
         )
     
+    async def _missing_game_ids(self, game_ids: List[str]) -> List[str]:
+        """Redis和磁盘归档中都已不存在的牌谱"""
+        if not game_ids:
+            return []
+        
+        pipe = self.redis.client.pipeline(transaction=False)
+        for game_id in game_ids:
+            pipe.exists(f"game_record:{game_id}")
+        results = await pipe.execute()
+        
+        missing_ids = []
+        for game_id, exists in zip(game_ids, results):
+            if exists or game_id in self.current_games:
+                continue
+            if self.archive and await asyncio.to_thread(self.archive.contains, game_id):
+                continue
+            missing_ids.append(game_id)
+        return missing_ids
+    
+    async def _prune_game_ids(self, game_ids: List[str]):
+        """从开始时间索引和检索索引中移除已不存在的牌谱"""
+        await self.redis.client.zrem(GAME_INDEX_KEY, *game_ids)
+        for game_id in game_ids:
+            await self.index.remove_game(game_id)
+    
     async def _load_game_record(self, game_id: str) -> Optional[GameRecord]:
-        """从Redis加载游戏记录"""
+        """从Redis加载游戏记录，Redis中不存在时从磁盘归档加载"""
         key = f"game_record:{game_id}"
         data = await self.redis.client.get(key)
+        game_record = None
         if data:
             try:
-                return GameRecord.parse_raw(data)
+                game_record = GameRecord.model_validate_json(data)
             except:
                 return None
-        return None
+        elif self.archive:
+            game_record = await asyncio.to_thread(self.archive.get, game_id)
+        
+        # 归档格式和关键帧功能之前保存的牌谱不含关键帧，加载时重新生成
+        if game_record and game_record.actions and not game_record.keyframes:
+            game_record.keyframes = ReplayStateReconstructor.build_keyframes(game_record)
+        return game_record
     
-    async def _export_replay_zip(self, replay: GameReplay) -> bytes:
-        """导出ZIP格式牌谱"""
-        buffer = io.BytesIO()
+    def _build_replay(self, game_record: GameRecord) -> GameReplay:
+        """为牌谱附加回放元数据"""
+        replay_metadata = {
+            "generated_at": datetime.now().isoformat(),
+            "version": "1.0",
+            "format": "xuezhan_mahjong"
+        }
         
-        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            # 主要牌谱文件
-            game_data = replay.to_export_format()
-            zf.writestr(
-                f"{replay.game_record.game_id}.json",
-                json.dumps(game_data, ensure_ascii=False, indent=2)
-            )
+        return GameReplay(
+            game_record=game_record,
+            replay_metadata=replay_metadata
+        )
+    
+    async def _stream_ndjson(self, game_records: AsyncIterator[GameRecord]) -> AsyncIterator[bytes]:
+        """每局牌谱输出为一行JSON"""
+        pending = []
+        pending_size = 0
+        async for game_record in game_records:
+            for piece in self._build_replay(game_record).iter_export_json():
+                data = piece.encode('utf-8')
+                pending.append(data)
+                pending_size += len(data)
+            pending.append(b"\n")
+            pending_size += 1
             
-            # 添加摘要信息
-            summary = {
-                "game_id": replay.game_record.game_id,
-                "start_time": replay.game_record.start_time.isoformat(),
-                "duration": replay.game_record.duration,
-                "players": [p.player_name for p in replay.game_record.players],
-                "winners": [p.player_name for p in replay.game_record.players if p.is_winner],
-                "total_actions": replay.game_record.total_actions
-            }
-            zf.writestr(
-                "summary.json",
-                json.dumps(summary, ensure_ascii=False, indent=2)
-            )
+            if pending_size >= EXPORT_CHUNK_SIZE:
+                yield b"".join(pending)
+                pending = []
+                pending_size = 0
+        
+        if pending:
+            yield b"".join(pending)
+    
+    async def _stream_zip(
+        self,
+        replays: AsyncIterator[GameReplay],
+        multi_game: bool,
+        missing_ids: Optional[List[str]] = None
+    ) -> AsyncIterator[bytes]:
+        """逐局写入ZIP条目并分块输出，内存占用与牌谱数量和长度无关
+        
+        单局导出保持原有结构: {game_id}.json、summary.json、README.md；
+        多局导出每局一个目录: {game_id}/replay.json、{game_id}/summary.json。
+        """
+        buffer = _ZipStreamBuffer()
+        exported_count = 0
+        
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            async for replay in replays:
+                game_id = replay.game_record.game_id
+                replay_name = f"{game_id}/replay.json" if multi_game else f"{game_id}.json"
+                summary_name = f"{game_id}/summary.json" if multi_game else "summary.json"
+                
+                # 主要牌谱文件，操作序列逐条写入
+                with zf.open(replay_name, 'w') as entry:
+                    for piece in replay.iter_export_json():
+                        entry.write(piece.encode('utf-8'))
+                        if len(buffer) >= EXPORT_CHUNK_SIZE:
+                            yield buffer.take()
+                
+                # 添加摘要信息
+                zf.writestr(
+                    summary_name,
+                    json.dumps(replay.to_summary(), ensure_ascii=False, separators=(",", ":"))
+                )
+                exported_count += 1
+                
+                if not multi_game:
+                    zf.writestr("README.md", self._zip_readme(replay))
+                
+                yield buffer.take()
             
-            # 添加说明文件
-            readme = f"""# 血战麻将牌谱
+            if multi_game:
+                zf.writestr("README.md", self._batch_zip_readme(exported_count, missing_ids or []))
+        
+        # 中央目录在关闭压缩包时写入
+        yield buffer.take()
+    
+    def _zip_readme(self, replay: GameReplay) -> str:
+        """单局ZIP牌谱说明文件"""
+        return f"""# 血战麻将牌谱
 
 游戏ID: {replay.game_record.game_id}
 开始时间: {replay.game_record.start_time}
@@ -324,7 +767,51 @@ class ReplayService:
 牌谱采用JSON格式存储，包含完整的游戏操作序列和玩家信息。
 可以使用支持的工具导入并回放游戏过程。
 """
-            zf.writestr("README.md", readme)
+    
+    def _batch_zip_readme(self, exported_count: int, missing_ids: List[str]) -> str:
+        """多局ZIP牌谱说明文件"""
+        missing_section = ""
+        if missing_ids:
+            missing_lines = "\n".join(f"- {game_id}" for game_id in missing_ids)
+            missing_section = f"\n## 未找到的牌谱\n{missing_lines}\n"
         
-        buffer.seek(0)
-        return buffer.read() 
\ No newline at end of file
+        return f"""# 血战麻将牌谱合集
+
+导出时间: {datetime.now().isoformat()}
+牌谱数量: {exported_count}
+
+## 文件说明
+- <game_id>/replay.json: 完整牌谱数据
+- <game_id>/summary.json: 游戏摘要信息
+- README.md: 说明文件
+{missing_section}
+## 牌谱格式说明
+牌谱采用JSON格式存储，包含完整的游戏操作序列和玩家信息。
+可以使用支持的工具导入并回放游戏过程。
+"""
+
+
+class _ZipStreamBuffer:
+    """供 zipfile 写入的只追加缓冲区
+    
+    不提供 tell/seek，zipfile 会按不可定位的流处理(使用数据描述符)，
+    写入的数据由 take() 分块取出后清空。
+    """
+    
+    def __init__(self):
+        self._data = bytearray()
+    
+    def write(self, data: bytes) -> int:
+        self._data += data
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def take(self) -> bytes:
+        data = bytes(self._data)
+        self._data.clear()
+        return data
+    
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,229 @@
+"""
+牌谱回放状态重建
+
+按操作序号重建任意时刻的牌局状态。牌谱中每隔 keyframe_interval 个操作保存一个
+紧凑关键帧，定位时从最近的关键帧恢复，最多再应用 keyframe_interval 个操作。
+"""
+
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+from app.models.game_record import (
+    GameRecord, GameAction, ActionType, GangType, card_index_name
+)
+
+# 面子类型编码(关键帧中使用)
+MELD_PENG = 0
+MELD_MING_GANG = 1
+MELD_AN_GANG = 2
+MELD_JIA_GANG = 3
+
+MELD_NAMES = {
+    MELD_PENG: "peng",
+    MELD_MING_GANG: "ming_gang",
+    MELD_AN_GANG: "an_gang",
+    MELD_JIA_GANG: "jia_gang",
+}
+
+_GANG_MELD_KINDS = {
+    GangType.MING_GANG: MELD_MING_GANG,
+    GangType.AN_GANG: MELD_AN_GANG,
+    GangType.JIA_GANG: MELD_JIA_GANG,
+}
+
+
+class ReplayState:
+    """某一操作序号下的牌局状态
+
+    手牌以27种牌的数量向量保存，面子为 [面子类型, 牌种索引]，弃牌为牌种索引列表。
+    """
+
+    def __init__(self, player_count: int):
+        self.sequence = 0
+        self.hands: List[List[int]] = [[0] * 27 for _ in range(player_count)]
+        self.melds: List[List[List[int]]] = [[] for _ in range(player_count)]
+        self.discards: List[List[int]] = [[] for _ in range(player_count)]
+        self.missing_suits: List[Optional[str]] = [None] * player_count
+        self.scores: List[int] = [0] * player_count
+        self.winners: List[int] = []
+
+    @classmethod
+    def initial(cls, game_record: GameRecord) -> "ReplayState":
+        """根据起手牌创建初始状态(序号0)"""
+        state = cls(len(game_record.players))
+        for player in game_record.players:
+            for card in player.initial_hand:
+                state.hands[player.player_id][card.to_index()] += 1
+        return state
+
+    @classmethod
+    def from_keyframe(cls, keyframe: Dict) -> "ReplayState":
+        """从紧凑关键帧恢复状态"""
+        state = cls(len(keyframe["hands"]))
+        state.sequence = keyframe["seq"]
+        state.hands = [list(hand) for hand in keyframe["hands"]]
+        state.melds = [[list(meld) for meld in melds] for melds in keyframe["melds"]]
+        state.discards = [list(discards) for discards in keyframe["discards"]]
+        state.missing_suits = list(keyframe["missing_suits"])
+        state.scores = list(keyframe["scores"])
+        state.winners = list(keyframe["winners"])
+        return state
+
+    def to_keyframe(self) -> Dict:
+        """导出紧凑关键帧"""
+        return {
+            "seq": self.sequence,
+            "hands": [list(hand) for hand in self.hands],
+            "melds": [[list(meld) for meld in melds] for melds in self.melds],
+            "discards": [list(discards) for discards in self.discards],
+            "missing_suits": list(self.missing_suits),
+            "scores": list(self.scores),
+            "winners": list(self.winners),
+        }
+
+    def apply(self, action: GameAction):
+        """应用一个操作"""
+        player_id = action.player_id
+        card_index = action.card.to_index() if action.card else None
+
+        if action.action_type == ActionType.DRAW:
+            if card_index is not None:
+                self.hands[player_id][card_index] += 1
+
+        elif action.action_type == ActionType.DISCARD:
+            if card_index is not None:
+                self._take_from_hand(player_id, card_index, 1)
+                self.discards[player_id].append(card_index)
+
+        elif action.action_type == ActionType.PENG:
+            if card_index is not None:
+                self._take_from_hand(player_id, card_index, 2)
+                self._take_from_discards(action.target_player, card_index)
+                self.melds[player_id].append([MELD_PENG, card_index])
+
+        elif action.action_type == ActionType.GANG:
+            if card_index is not None:
+                self._apply_gang(action, card_index)
+
+        elif action.action_type == ActionType.HU:
+            # 点炮时胡的牌来自目标玩家的弃牌，自摸时牌已在手中
+            if card_index is not None and action.target_player not in (None, player_id):
+                self._take_from_discards(action.target_player, card_index)
+                self.hands[player_id][card_index] += 1
+            if player_id not in self.winners:
+                self.winners.append(player_id)
+
+        elif action.action_type == ActionType.MISSING_SUIT:
+            self.missing_suits[player_id] = action.missing_suit
+
+        self.scores[player_id] += action.score_change
+        self.sequence = action.sequence
+
+    def to_view(self) -> Dict:
+        """转换为可读的状态数据"""
+        return {
+            "sequence": self.sequence,
+            "players": [
+                {
+                    "player_id": player_id,
+                    "hand": [
+                        card_index_name(index)
+                        for index, count in enumerate(self.hands[player_id])
+                        for _ in range(count)
+                    ],
+                    "melds": [
+                        {"type": MELD_NAMES[kind], "card": card_index_name(index)}
+                        for kind, index in self.melds[player_id]
+                    ],
+                    "discards": [card_index_name(index) for index in self.discards[player_id]],
+                    "missing_suit": self.missing_suits[player_id],
+                    "score": self.scores[player_id],
+                    "is_winner": player_id in self.winners,
+                }
+                for player_id in range(len(self.hands))
+            ],
+            "winners": list(self.winners),
+        }
+
+    def _apply_gang(self, action: GameAction, card_index: int):
+        """应用杠牌操作"""
+        player_id = action.player_id
+        kind = _GANG_MELD_KINDS.get(action.gang_type, MELD_MING_GANG)
+
+        if kind == MELD_AN_GANG:
+            self._take_from_hand(player_id, card_index, 4)
+        elif kind == MELD_JIA_GANG:
+            self._take_from_hand(player_id, card_index, 1)
+            for meld in self.melds[player_id]:
+                if meld == [MELD_PENG, card_index]:
+                    self.melds[player_id].remove(meld)
+                    break
+        else:
+            self._take_from_hand(player_id, card_index, 3)
+            self._take_from_discards(action.target_player, card_index)
+
+        self.melds[player_id].append([kind, card_index])
+
+    def _take_from_hand(self, player_id: int, card_index: int, count: int):
+        """从手牌移除指定数量的牌(数量不足时移除全部)"""
+        hand = self.hands[player_id]
+        hand[card_index] = max(0, hand[card_index] - count)
+
+    def _take_from_discards(self, player_id: Optional[int], card_index: int):
+        """从玩家弃牌中移除最近弃出的指定牌"""
+        if player_id is None or not 0 <= player_id < len(self.discards):
+            return
+        discards = self.discards[player_id]
+        for i in range(len(discards) - 1, -1, -1):
+            if discards[i] == card_index:
+                discards.pop(i)
+                return
+
+
+class ReplayStateReconstructor:
+    """基于关键帧的回放状态重建器"""
+
+    @staticmethod
+    def nearest_keyframe(game_record: GameRecord, sequence: int) -> Optional[Dict]:
+        """查找序号不大于 sequence 的最近关键帧"""
+        if not game_record.keyframes:
+            return None
+
+        # 关键帧按固定间隔生成，通常可直接命中
+        candidate = (sequence // game_record.keyframe_interval) * game_record.keyframe_interval
+        if candidate in game_record.keyframes:
+            return game_record.keyframes[candidate]
+
+        keys = sorted(game_record.keyframes)
+        position = bisect_right(keys, sequence)
+        if position == 0:
+            return None
+        return game_record.keyframes[keys[position - 1]]
+
+    @classmethod
+    def reconstruct(cls, game_record: GameRecord, sequence: int) -> ReplayState:
+        """重建执行完第 sequence 个操作后的状态(0 表示起手状态)"""
+        sequence = max(0, min(sequence, len(game_record.actions)))
+
+        keyframe = cls.nearest_keyframe(game_record, sequence)
+        if keyframe:
+            state = ReplayState.from_keyframe(keyframe)
+        else:
+            state = ReplayState.initial(game_record)
+
+        # 操作序号从1开始且连续，第 n 个操作位于 actions[n-1]
+        for action in game_record.actions[state.sequence:sequence]:
+            state.apply(action)
+
+        return state
+
+    @classmethod
+    def build_keyframes(cls, game_record: GameRecord) -> Dict[int, Dict]:
+        """从头重放整局，生成全部关键帧(用于没有关键帧的旧牌谱)"""
+        keyframes = {}
+        state = ReplayState.initial(game_record)
+        for action in game_record.actions:
+            state.apply(action)
+            if action.sequence % game_record.keyframe_interval == 0:
+                keyframes[action.sequence] = state.to_keyframe()
+        return keyframes
@@ -0,0 +1,178 @@
+"""
+牌谱分享
+
+分享令牌映射到游戏ID，过期时间记录在有序集合中，由后台任务定期清理。
+分享的牌谱预先渲染为导出JSON并缓存，查看分享只需一次脚本调用(校验令牌并计数)
+和一次缓存读取，热门牌谱不会在每次查看时重新序列化。
+
+存储结构:
+- share:tokens              哈希，令牌 -> 游戏ID
+- share:expires             有序集合，令牌 -> 过期时间戳
+- share:views               哈希，令牌 -> 查看次数
+- share:game:{game_id}      集合，该局的全部令牌
+- share:export:{game_id}    预渲染的导出JSON(仅缓存已结束的牌谱)
+"""
+
+import asyncio
+import logging
+import secrets
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+SHARE_TOKENS_KEY = "share:tokens"
+SHARE_EXPIRES_KEY = "share:expires"
+SHARE_VIEWS_KEY = "share:views"
+
+# 每轮清理最多处理的令牌数量
+SWEEP_BATCH_SIZE = 500
+
+# 查找令牌、检查过期、累计查看次数并返回游戏ID
+# 脚本只访问 KEYS 中声明的键，导出缓存键依赖游戏ID，由调用方随后读取
+# KEYS[1]: 令牌哈希  KEYS[2]: 过期有序集合  KEYS[3]: 查看次数哈希
+# ARGV[1]: 令牌  ARGV[2]: 当前时间戳
+_RESOLVE_SCRIPT = """
+local game_id = redis.call('HGET', KEYS[1], ARGV[1])
+if not game_id then
+    return nil
+end
+local expires = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if not expires or tonumber(expires) <= tonumber(ARGV[2]) then
+    return nil
+end
+redis.call('HINCRBY', KEYS[3], ARGV[1], 1)
+return game_id
+"""
+
+
+class ShareService:
+    """牌谱分享服务"""
+
+    def __init__(self, redis_service: RedisService, replay_service, ttl_seconds: int):
+        self.redis = redis_service
+        self.replay_service = replay_service
+        self.ttl_seconds = ttl_seconds
+        self._resolve_script = None
+
+    async def create_share(self, game_id: str) -> Dict[str, Any]:
+        """为牌谱创建分享令牌并缓存预渲染的导出内容"""
+        export = await self.redis.client.get(self._export_key(game_id))
+        finished = True
+        if export is None:
+            export, finished = await self._render_export(game_id)
+        if export is None:
+            raise ValueError(f"牌谱 {game_id} 不存在")
+
+        token = secrets.token_urlsafe(9)
+        expires_at = time.time() + self.ttl_seconds
+
+        pipe = self.redis.client.pipeline(transaction=True)
+        pipe.hset(SHARE_TOKENS_KEY, token, game_id)
+        pipe.zadd(SHARE_EXPIRES_KEY, {token: expires_at})
+        pipe.sadd(self._game_key(game_id), token)
+        if finished:
+            pipe.set(self._export_key(game_id), export, ex=self.ttl_seconds)
+        await pipe.execute()
+
+        return {
+            "token": token,
+            "game_id": game_id,
+            "expires_at": datetime.fromtimestamp(expires_at).isoformat()
+        }
+
+    async def resolve(self, token: str) -> Optional[str]:
+        """根据令牌获取预渲染的导出JSON，令牌不存在或已过期时返回None"""
+        if self._resolve_script is None:
+            self._resolve_script = self.redis.client.register_script(_RESOLVE_SCRIPT)
+
+        game_id = await self._resolve_script(
+            keys=[SHARE_TOKENS_KEY, SHARE_EXPIRES_KEY, SHARE_VIEWS_KEY],
+            args=[token, time.time()]
+        )
+        if not game_id:
+            return None
+
+        export = await self.redis.client.get(self._export_key(game_id))
+        if export:
+            return export
+
+        # 缓存被淘汰或游戏尚未结束时重新渲染
+        export, finished = await self._render_export(game_id)
+        if export is not None and finished:
+            await self.redis.client.set(self._export_key(game_id), export, ex=self.ttl_seconds)
+        return export
+
+    async def get_view_count(self, token: str) -> int:
+        """获取分享的查看次数"""
+        count = await self.redis.client.hget(SHARE_VIEWS_KEY, token)
+        return int(count or 0)
+
+    async def revoke_game(self, game_id: str) -> int:
+        """删除一局牌谱的全部分享令牌和缓存，返回删除的令牌数"""
+        game_key = self._game_key(game_id)
+        tokens = list(await self.redis.client.smembers(game_key))
+
+        pipe = self.redis.client.pipeline(transaction=True)
+        if tokens:
+            pipe.hdel(SHARE_TOKENS_KEY, *tokens)
+            pipe.zrem(SHARE_EXPIRES_KEY, *tokens)
+            pipe.hdel(SHARE_VIEWS_KEY, *tokens)
+        pipe.delete(game_key, self._export_key(game_id))
+        await pipe.execute()
+        return len(tokens)
+
+    async def sweep_expired(self, now: Optional[float] = None) -> int:
+        """清理已过期的令牌，每批最多处理 SWEEP_BATCH_SIZE 个，返回清理数量"""
+        now = now if now is not None else time.time()
+        removed = 0
+
+        while True:
+            tokens = await self.redis.client.zrangebyscore(
+                SHARE_EXPIRES_KEY, "-inf", now, start=0, num=SWEEP_BATCH_SIZE
+            )
+            if not tokens:
+                break
+
+            game_ids = await self.redis.client.hmget(SHARE_TOKENS_KEY, tokens)
+            pipe = self.redis.client.pipeline(transaction=True)
+            pipe.hdel(SHARE_TOKENS_KEY, *tokens)
+            pipe.zrem(SHARE_EXPIRES_KEY, *tokens)
+            pipe.hdel(SHARE_VIEWS_KEY, *tokens)
+            for token, game_id in zip(tokens, game_ids):
+                if game_id:
+                    pipe.srem(self._game_key(game_id), token)
+            await pipe.execute()
+
+            removed += len(tokens)
+            if len(tokens) < SWEEP_BATCH_SIZE:
+                break
+
+        return removed
+
+    async def run_sweeper(self, interval_seconds: int):
+        """后台定期清理过期令牌，直到任务被取消"""
+        while True:
+            try:
+                removed = await self.sweep_expired()
+                if removed:
+                    logger.info(f"清理过期分享令牌 {removed} 个")
+            except Exception as e:
+                logger.warning(f"清理分享令牌失败: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    async def _render_export(self, game_id: str) -> Tuple[Optional[str], bool]:
+        """渲染与导出接口一致的牌谱JSON，同时返回游戏是否已结束(只缓存已结束的牌谱)"""
+        replay = await self.replay_service.get_game_replay(game_id)
+        if replay is None:
+            return None, False
+        return "".join(replay.iter_export_json()), replay.game_record.end_time is not None
+
+    def _game_key(self, game_id: str) -> str:
+        return f"share:game:{game_id}"
+
+    def _export_key(self, game_id: str) -> str:
+        return f"share:export:{game_id}"
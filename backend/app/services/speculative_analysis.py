@@ -0,0 +1,134 @@
+"""
+推测式后台分析
+
+玩家0的手牌每次变为 3n+2 张(轮到出牌)时，状态保存后立即在后台线程分析新局面，
+/game-state 和 /analyze 请求直接返回已算好的推荐，不再现场计算。
+
+- 每个局面先做快速分析(不指定时间预算的 /analyze 使用)，再按后台时间预算做深入分析
+  (指定相同预算的 /analyze 和 /game-state 使用)
+- 只有一个后台线程，局面变化比分析快时只分析最新的局面，中间的局面被跳过
+- 结果按局面键(见 analysis_coalescer.analysis_key，含时间预算)保存在有限大小的缓存中，
+  同时记录最新的深入分析结果对应的状态版本
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from app.algorithms.mahjong_analyzer import MahjongAnalyzer
+from app.models.mahjong import AnalysisResult, GameState
+from app.services.analysis_coalescer import analysis_key
+
+
+class SpeculativeAnalyzer:
+    """状态变更后预先分析目标玩家的局面"""
+
+    def __init__(self, analyzer: MahjongAnalyzer, player_id: int = 0,
+                 deadline_ms: Optional[int] = None, cache_size: int = 32):
+        self.analyzer = analyzer
+        self.player_id = player_id
+        self.deadline_ms = deadline_ms
+        # 依次计算的时间预算: 快速分析，以及有后台预算时的深入分析
+        self.deadlines = [None, deadline_ms] if deadline_ms else [None]
+        self.cache_size = cache_size
+        self._results: "OrderedDict[Hashable, AnalysisResult]" = OrderedDict()
+        self._latest: Optional[Tuple[int, AnalysisResult]] = None
+        self._pending: Optional[Tuple[int, Dict[str, Any]]] = None
+        self._running = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculative-analysis")
+        self.scheduled = 0
+        self.computed = 0
+        self.superseded = 0
+        self.hits = 0
+        self.misses = 0
+
+    def on_state_change(self, version: int, snapshot: Dict[str, Any]):
+        """状态保存后调用(snapshot 为已提交的状态，不会再被修改)，轮到目标玩家出牌时安排分析"""
+        hand = snapshot.get("player_hands", {}).get(str(self.player_id)) or {}
+        tiles = hand.get("tiles") or []
+        if len(tiles) % 3 != 2:
+            return
+
+        with self._lock:
+            if self._pending is not None:
+                self.superseded += 1
+            self._pending = (version, snapshot)
+            self.scheduled += 1
+            if self._running:
+                return
+            self._running = True
+        self._executor.submit(self._drain)
+
+    def _drain(self):
+        """依次分析最新的待分析局面，直到没有新的局面"""
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, None
+                if pending is None:
+                    self._running = False
+                    return
+
+            version, snapshot = pending
+            try:
+                # 分析只用到手牌、副露和弃牌，其余字段(如内部格式的操作历史)不参与校验
+                game_state = GameState(
+                    game_id=snapshot.get("game_id", ""),
+                    player_hands=snapshot.get("player_hands", {}),
+                    discarded_tiles=snapshot.get("discarded_tiles", [])
+                )
+                for deadline_ms in self.deadlines:
+                    if deadline_ms is not None and self._pending is not None:
+                        # 已有更新的局面，跳过本局面的深入分析
+                        break
+                    key = analysis_key(game_state, self.player_id, deadline_ms)
+                    result = self._results.get(key)
+                    if result is None:
+                        result = self.analyzer.analyze_game_state(game_state, self.player_id, deadline_ms)
+                        self.computed += 1
+                    with self._lock:
+                        self._results[key] = result
+                        self._results.move_to_end(key)
+                        while len(self._results) > self.cache_size:
+                            self._results.popitem(last=False)
+                        if deadline_ms == self.deadlines[-1]:
+                            self._latest = (version, result)
+            except Exception as e:
+                print(f"后台分析失败: {e}")
+
+    def covers(self, deadline_ms: Optional[int]) -> bool:
+        """该时间预算的请求是否可能命中后台分析结果"""
+        return deadline_ms in self.deadlines
+
+    def lookup(self, key: Hashable) -> Optional[AnalysisResult]:
+        """按局面键(含时间预算)获取已算好的结果"""
+        with self._lock:
+            result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def result_for_version(self, version: int) -> Optional[AnalysisResult]:
+        """获取指定状态版本的(深入)分析结果，尚未算完或局面已变化时返回None"""
+        latest = self._latest
+        if latest is not None and latest[0] == version:
+            return latest[1]
+        return None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取后台分析统计"""
+        return {
+            "scheduled": self.scheduled,
+            "computed": self.computed,
+            "superseded": self.superseded,
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached": len(self._results)
+        }
+
+    def shutdown(self):
+        """停止后台线程"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,226 @@
+"""
+游戏状态版本与增量同步
+
+每次保存游戏状态时与上一次保存的快照比较，生成类似 JSON Patch 的增量操作，
+状态版本号加一并记入有限长度的变更日志。客户端断线重连时携带已知版本号，
+日志中仍有后续变更则只补发增量，否则重新下发完整快照。
+
+多个工作进程共享同一局时，新版本号由调用方统一分配(如Redis INCR)，
+保证两个不同的状态不会使用同一个版本号。分配到的版本号与本地版本不连续时
+(期间有其他进程的变更)，增量改为整体替换，从任何版本应用都能得到正确状态。
+
+增量操作格式:
+- {"op": "replace", "path": "/current_player", "value": 1}
+- {"op": "add", "path": "/actions_history/-", "value": {...}}   列表末尾追加
+- {"op": "add", "path": "/player_hands/0/tiles/3", "value": {...}}   插入到列表下标3处
+- {"op": "remove", "path": "/player_hands/0/missing_suit"}
+- {"op": "remove", "path": "/tile_pool/107"}                      删除列表元素(后面的元素前移)
+路径中的 "~" 和 "/" 按 JSON Pointer 规则转义为 "~0" 和 "~1"。
+"""
+
+import json
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# 变更日志保留的版本数量，超出后重连的客户端需要重新获取快照
+CHANGE_LOG_SIZE = 256
+
+PatchOps = List[Dict[str, Any]]
+
+
+def _escape(key: str) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _same(old: Any, new: Any) -> bool:
+    """按JSON语义比较: 值和类型都相同才算相等(Python 中 True == 1、1 == 1.0，JSON 中不相等)"""
+    if type(old) is not type(new) or old != new:
+        return False
+    if isinstance(old, dict):
+        return all(_same(value, new[key]) for key, value in old.items())
+    if isinstance(old, list):
+        return all(_same(a, b) for a, b in zip(old, new))
+    return True
+
+
+def compute_patch(old: Any, new: Any, path: str = "") -> PatchOps:
+    """计算从 old 到 new 的增量操作"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops: PatchOps = []
+        for key, old_value in old.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in new:
+                ops.append({"op": "remove", "path": child})
+            elif not _same(old_value, new[key]):
+                ops.extend(compute_patch(old_value, new[key], child))
+        for key, new_value in new.items():
+            if key not in old:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": new_value})
+        return ops
+
+    if isinstance(old, list) and isinstance(new, list):
+        ops = _compute_list_patch(old, new, path)
+        if ops is not None:
+            return ops
+
+    if _same(old, new):
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def _compute_list_patch(old: list, new: list, path: str) -> Optional[PatchOps]:
+    """列表的增量: 末尾追加或截断(摸牌)、删除或插入一个元素(打牌)、少数元素变化时按下标生成，
+    变化较多时返回None，由调用方替换整个列表"""
+    if _same(old, new):
+        return []
+    if len(new) > len(old) and _same(old, new[:len(old)]):
+        return [{"op": "add", "path": f"{path}/-", "value": value} for value in new[len(old):]]
+    if len(new) < len(old) and _same(old[:len(new)], new):
+        # 从末尾开始删除，前面元素的下标不受影响
+        return [{"op": "remove", "path": f"{path}/{index}"} for index in range(len(old) - 1, len(new) - 1, -1)]
+
+    if abs(len(new) - len(old)) == 1:
+        index = next((i for i, (a, b) in enumerate(zip(old, new)) if not _same(a, b)), min(len(old), len(new)))
+        if len(new) < len(old) and _same(old[index + 1:], new[index:]):
+            return [{"op": "remove", "path": f"{path}/{index}"}]
+        if len(new) > len(old) and _same(old[index:], new[index + 1:]):
+            return [{"op": "add", "path": f"{path}/{index}", "value": new[index]}]
+        return None
+
+    if len(new) == len(old):
+        changed = [i for i, (a, b) in enumerate(zip(old, new)) if not _same(a, b)]
+        if len(changed) * 2 <= len(old):
+            ops: PatchOps = []
+            for index in changed:
+                ops.extend(compute_patch(old[index], new[index], f"{path}/{index}"))
+            return ops
+    return None
+
+
+def apply_patch(state: Any, ops: PatchOps) -> Any:
+    """将增量操作应用到状态上(原地修改并返回，路径为空的替换返回新值)"""
+    for op in ops:
+        if op["path"] == "":
+            state = op["value"]
+            continue
+
+        parts = [part.replace("~1", "/").replace("~0", "~") for part in op["path"].split("/")[1:]]
+        target = state
+        for part in parts[:-1]:
+            target = target[int(part)] if isinstance(target, list) else target[part]
+        last = parts[-1]
+
+        if isinstance(target, list):
+            if op["op"] == "add" and last == "-":
+                target.append(op["value"])
+            elif op["op"] == "add":
+                target.insert(int(last), op["value"])
+            elif op["op"] == "remove":
+                del target[int(last)]
+            else:
+                target[int(last)] = op["value"]
+        elif op["op"] == "remove":
+            target.pop(last, None)
+        else:
+            target[last] = op["value"]
+    return state
+
+
+def patch_message(game_id: str, version: int, ops: PatchOps) -> Dict[str, Any]:
+    """构造推送给客户端的增量消息"""
+    return {
+        "type": "patch",
+        "game_id": game_id,
+        "base_version": version - 1,
+        "version": version,
+        "ops": ops
+    }
+
+
+def snapshot_message(version: int, state: Dict[str, Any]) -> Dict[str, Any]:
+    """构造推送给客户端的完整快照消息"""
+    return {
+        "type": "snapshot",
+        "game_id": state.get("game_id"),
+        "version": version,
+        "state": state
+    }
+
+
+class StateSync:
+    """跟踪游戏状态版本，生成增量并通知订阅者"""
+
+    def __init__(self, version: int = 0, log_size: int = CHANGE_LOG_SIZE):
+        self.version = version
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._log: Deque[Tuple[int, PatchOps]] = deque(maxlen=log_size)
+        self._listeners: List[Callable[[str, int, PatchOps], None]] = []
+
+    def add_listener(self, listener: Callable[[str, int, PatchOps], None]):
+        """注册变更回调，参数为 (变更前的游戏ID, 新版本号, 增量操作)"""
+        self._listeners.append(listener)
+
+    @property
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """最近一次提交的状态(每次提交替换为新对象，调用方不应修改)"""
+        return self._snapshot
+
+    def load(self, state_json: str):
+        """以已保存的状态作为比较基准(不产生新版本)"""
+        self._snapshot = json.loads(state_json)
+        self._log.clear()
+
+    def commit(
+        self,
+        state_json: str,
+        assign_version: Optional[Callable[[], Optional[int]]] = None
+    ) -> Optional[Tuple[int, PatchOps]]:
+        """提交新保存的状态，有变化时分配新版本号并返回 (版本号, 增量操作)
+
+        assign_version 只在状态有变化时调用，返回共享的新版本号；
+        未指定或返回None(如Redis不可用)时使用本地版本号加一。
+        """
+        new_snapshot = json.loads(state_json)
+        old_snapshot = self._snapshot
+        ops = compute_patch(old_snapshot, new_snapshot) if old_snapshot is not None else [
+            {"op": "replace", "path": "", "value": new_snapshot}
+        ]
+        self._snapshot = new_snapshot
+        if not ops:
+            return None
+
+        version = assign_version() if assign_version is not None else None
+        if version is None:
+            version = self.version + 1
+        elif version != self.version + 1:
+            # 期间有其他进程的变更，增量不能从 version - 1 应用
+            ops = [{"op": "replace", "path": "", "value": new_snapshot}]
+        self.version = version
+        self._log.append((self.version, ops))
+
+        game_id = (old_snapshot or new_snapshot).get("game_id", "")
+        for listener in self._listeners:
+            try:
+                listener(game_id, self.version, ops)
+            except Exception as e:
+                print(f"状态变更通知失败: {e}")
+        return self.version, ops
+
+    def apply_remote(self, version: int, ops: PatchOps, state_json: str):
+        """记录其他工作进程产生的变更(不通知订阅者)"""
+        self._snapshot = json.loads(state_json)
+        self.version = version
+        self._log.append((version, ops))
+
+    def reset(self, version: int, state_json: str):
+        """以指定版本的完整状态重新作为基准，清空变更日志"""
+        self.version = version
+        self.load(state_json)
+
+    def changes_since(self, version: int) -> Optional[List[Tuple[int, PatchOps]]]:
+        """获取指定版本之后的全部增量，日志已不完整时返回None"""
+        if version == self.version:
+            return []
+        if version > self.version or not self._log or self._log[0][0] > version + 1:
+            return None
+        return [(v, ops) for v, ops in self._log if v > version]
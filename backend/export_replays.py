@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+牌谱批量导出脚本
+按时间范围、玩家、模式直接从Redis批量导出牌谱到单个 zip 或 ndjson 文件，
+适合作为每日归档任务运行，无需逐局调用HTTP接口。
+
+示例:
+    python export_replays.py --start 2025-06-11 --end 2025-06-12 --format ndjson
+    python export_replays.py --player 小明 --output xiaoming.zip
+    python export_replays.py --rebuild-index
+"""
+
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from app.models.game_record import ReplayExportFilter
+from app.services.redis_service import RedisService
+from app.services.replay_service import ReplayService
+
+
+def parse_time(value: str) -> datetime:
+    """解析命令行时间参数(支持日期或ISO时间)"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的时间格式: {value}")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="血战麻将牌谱批量导出工具")
+    parser.add_argument("--start", type=parse_time, help="开始时间下限，如 2025-06-11 或 2025-06-11T08:00:00")
+    parser.add_argument("--end", type=parse_time, help="开始时间上限")
+    parser.add_argument("--yesterday", action="store_true", help="导出昨天的全部牌谱(每日归档)")
+    parser.add_argument("--player", help="只导出包含该玩家的牌谱")
+    parser.add_argument("--mode", help="只导出该游戏模式的牌谱")
+    parser.add_argument("--format", choices=["zip", "ndjson"], default="zip", help="导出格式")
+    parser.add_argument("--limit", type=int, help="最多导出的牌谱数量")
+    parser.add_argument("--output", help="输出文件路径")
+    parser.add_argument("--rebuild-index", action="store_true", help="扫描全部牌谱重建时间索引后退出")
+    return parser.parse_args()
+
+
+async def run_export(args) -> int:
+    """执行导出，返回输出的字节数"""
+    replay_service = ReplayService(RedisService())
+
+    if args.rebuild_index:
+        count = await replay_service.rebuild_game_index()
+        print(f"✅ 时间索引重建完成，共 {count} 局牌谱")
+        return 0
+
+    start_time, end_time = args.start, args.end
+    if args.yesterday:
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        start_time = today - timedelta(days=1)
+        end_time = today - timedelta(microseconds=1)
+
+    query = ReplayExportFilter(
+        start_time=start_time,
+        end_time=end_time,
+        player_name=args.player,
+        game_mode=args.mode,
+        format=args.format,
+        limit=args.limit
+    )
+
+    output = args.output or f"replays_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{args.format}"
+    print(f"📦 正在导出牌谱到: {output}")
+
+    total_bytes = 0
+    with open(output, "wb") as f:
+        async for chunk in replay_service.stream_bulk_export(query):
+            f.write(chunk)
+            total_bytes += len(chunk)
+
+    print(f"✅ 导出完成，共 {total_bytes} 字节")
+    return total_bytes
+
+
+def main():
+    """主函数"""
+    print("🀄 血战麻将牌谱批量导出工具 🀄")
+    print("=" * 50)
+
+    args = parse_args()
+    try:
+        asyncio.run(run_export(args))
+    except KeyboardInterrupt:
+        print("\n👋 用户取消操作")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ 导出失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
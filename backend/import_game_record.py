@@ -55,6 +55,7 @@ def import_game_record(filename):
         print(f"\n📡 正在导入牌谱到服务器...")
         response = requests.post(
             f"{BASE_URL}/import-game-record",
+            params={"state": "none"},
             json={'game_record': game_record}
         )
         
@@ -15,6 +15,8 @@ from typing import List, Tuple, Dict, Optional, Any
 
 # API基础URL
 BASE_URL = "http://localhost:8000/api/mahjong"
+# 变更接口只返回版本号，不回传完整游戏状态
+STATE_NONE = {"state": "none"}
 
 class DecisionAnalyzer:
     """决策分析器"""
@@ -317,7 +319,7 @@ class RealGameSimulator:
     def reset_game(self):
         """重置游戏状态"""
         try:
-            response = requests.post(f"{BASE_URL}/reset")
+            response = requests.post(f"{BASE_URL}/reset", params=STATE_NONE)
             if response.status_code == 200:
                 self.log("✅ 游戏状态已重置")
                 self.current_round = 0
@@ -345,7 +347,7 @@ class RealGameSimulator:
                 "player_id": player_id,
                 "missing_suit": missing_suit
             }
-            response = requests.post(f"{BASE_URL}/set-missing-suit", params=params)
+            response = requests.post(f"{BASE_URL}/set-missing-suit", params={**params, **STATE_NONE})
             
             if response.status_code == 200:
                 result = response.json()
@@ -477,7 +479,7 @@ class RealGameSimulator:
                     "tile_type": tile_type,
                     "tile_value": tile_value
                 }
-                response = requests.post(f"{BASE_URL}/discard-tile", params=params)
+                response = requests.post(f"{BASE_URL}/discard-tile", params={**params, **STATE_NONE})
                 
                 if response.status_code == 200:
                     result = response.json()
@@ -525,7 +527,7 @@ class RealGameSimulator:
                         "tile_type": tile_type,
                         "tile_value": tile_value
                     }
-                    response = requests.post(f"{BASE_URL}/discard-tile", params=params)
+                    response = requests.post(f"{BASE_URL}/discard-tile", params={**params, **STATE_NONE})
                     
                     if response.status_code == 200:
                         result = response.json()
@@ -767,7 +769,7 @@ class RealGameSimulator:
                 params["win_tile_type"] = win_tile[0]
                 params["win_tile_value"] = win_tile[1]
                 
-            response = requests.post(f"{BASE_URL}/player-win", params=params)
+            response = requests.post(f"{BASE_URL}/player-win", params={**params, **STATE_NONE})
             
             if response.status_code == 200:
                 result = response.json()
@@ -811,7 +813,7 @@ class RealGameSimulator:
                 "dianpao_player_id": dianpao_player_id
             }
             
-            response = requests.post(f"{BASE_URL}/player-win", params=params)
+            response = requests.post(f"{BASE_URL}/player-win", params={**params, **STATE_NONE})
             
             if response.status_code == 200:
                 result = response.json()
@@ -847,7 +849,7 @@ class RealGameSimulator:
             self.log("\n🀫 牌局结束，显示所有玩家手牌...")
             
             # 调用API显示所有手牌
-            response = requests.post(f"{BASE_URL}/reveal-all-hands")
+            response = requests.post(f"{BASE_URL}/reveal-all-hands", params=STATE_NONE)
             
             if response.status_code == 200:
                 result = response.json()
@@ -880,7 +882,7 @@ class RealGameSimulator:
             params = {
                 "player_id": player_id
             }
-            response = requests.post(f"{BASE_URL}/set-current-player", params=params)
+            response = requests.post(f"{BASE_URL}/set-current-player", params={**params, **STATE_NONE})
             
             if response.status_code == 200:
                 result = response.json()
@@ -900,7 +902,7 @@ class RealGameSimulator:
     def next_player(self):
         """切换到下一个玩家"""
         try:
-            response = requests.post(f"{BASE_URL}/next-player")
+            response = requests.post(f"{BASE_URL}/next-player", params=STATE_NONE)
             
             if response.status_code == 200:
                 result = response.json()
@@ -919,6 +921,50 @@ class RealGameSimulator:
             self.log(f"❌ 切换玩家错误: {e}")
             return False
 
+    def deal_hands_batch(self, my_hand: List[Tuple[str, int]], other_counts: Dict[int, int]) -> bool:
+        """通过批量操作接口一次完成发牌(失败时服务端整批回滚)"""
+        for suit, value in my_hand:
+            if not self.use_specific_tile(suit, value):
+                self.log(f"❌ 无法为我添加{value}{self.suit_names[suit]}：牌库限制")
+                return False
+        
+        # 其他玩家只记录数量，牌面参数不会被使用
+        operations = [
+            {"player_id": self.my_player_id, "operation_type": "hand", "tile": {"type": suit, "value": value}}
+            for suit, value in my_hand
+        ]
+        for player_id, count in other_counts.items():
+            operations.extend(
+                {"player_id": player_id, "operation_type": "hand", "tile": {"type": "wan", "value": 1}}
+                for _ in range(count)
+            )
+        
+        try:
+            response = requests.post(
+                f"{BASE_URL}/operations/batch",
+                params=STATE_NONE,
+                json={"operations": operations, "atomic": True}
+            )
+            if response.status_code != 200:
+                self.log(f"❌ 批量发牌请求失败: {response.text}")
+                return False
+            
+            result = response.json()
+            if not result["success"]:
+                failed = next((item for item in result["results"] if not item["success"]), None)
+                self.log(f"❌ 批量发牌失败: {failed['message'] if failed else result['message']}")
+                return False
+        except Exception as e:
+            self.log(f"❌ 批量发牌错误: {e}")
+            return False
+        
+        self.my_hand.extend(my_hand)
+        self.player_hand_counts[self.my_player_id] += len(my_hand)
+        for player_id, count in other_counts.items():
+            self.player_hand_counts[player_id] += count
+        self.log(f"✅ 批量发牌完成，共{len(operations)}张 (1次请求)")
+        return True
+
     def load_real_game_scenario(self):
         """加载真实牌局场景"""
         self.log("🎯 开始加载真实血战到底牌局场景...")
@@ -951,20 +997,12 @@ class RealGameSimulator:
         self.log(f"🀫 给我分配真实手牌...")
         self.log(f"   我的手牌: {self.format_cards(my_hand)}")
         
-        for i, (suit, value) in enumerate(my_hand, 1):
-            if not self.add_hand_tile(self.my_player_id, suit, value, f"(发牌 {i}/{len(my_hand)})"):
-                return False
-            time.sleep(0.02)
-        
-        # 给其他玩家分配手牌数量（不需要具体牌）
+        # 给其他玩家分配手牌数量（不需要具体牌），与我的手牌一起一次请求完成发牌
         for player_id, count in other_players_counts.items():
-            player_name = self.player_names[player_id]
-            self.log(f"🀫 给{player_name}分配{count}张手牌...")
-            
-            for i in range(count):
-                if not self.add_hand_tile(player_id, "wan", 1, f"(发牌 {i+1}/{count})"):
-                    return False
-                time.sleep(0.01)  # 更快的发牌速度，因为不需要具体牌
+            self.log(f"🀫 给{self.player_names[player_id]}分配{count}张手牌...")
+        
+        if not self.deal_hands_batch(my_hand, other_players_counts):
+            return False
         
         self.log("✅ 真实牌局场景加载完成")
         self.log(f"📊 手牌分配情况:")
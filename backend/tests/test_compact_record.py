@@ -0,0 +1,202 @@
+"""紧凑二进制牌谱格式的编码与解码"""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.models.game_record import (
+    ActionType, GameAction, GameRecord, GangType, MahjongCard, PlayerGameRecord,
+    decode_compact_record, encode_compact_record
+)
+from app.services.replay_state import ReplayStateReconstructor
+
+
+def make_record(start_time: datetime, rounds: int = 30, seed: int = 0) -> GameRecord:
+    """生成一局包含各类操作的牌谱"""
+    rng = random.Random(seed)
+    wall = [index for index in range(27) for _ in range(4)]
+    rng.shuffle(wall)
+    hands = [[wall.pop() for _ in range(13)] for _ in range(4)]
+
+    players = [
+        PlayerGameRecord(
+            player_id=i,
+            player_name=name,
+            position=i,
+            initial_hand=[MahjongCard.from_index(index) for index in hands[i]],
+            missing_suit=["wan", "tiao", "tong", "tong"][i]
+        )
+        for i, name in enumerate(["玩家1", "Bob", "雀圣", "D"])
+    ]
+    record = GameRecord(game_id="game_compact", start_time=start_time, players=players, keyframe_interval=8)
+
+    def add(player_id, action_type, **fields):
+        sequence = len(record.actions) + 1
+        record.actions.append(GameAction(
+            sequence=sequence,
+            timestamp=start_time + timedelta(seconds=sequence, microseconds=sequence * 137),
+            player_id=player_id,
+            action_type=action_type,
+            **fields
+        ))
+
+    for i in range(4):
+        add(i, ActionType.MISSING_SUIT, missing_suit=players[i].missing_suit)
+    for round_index in range(rounds):
+        player_id = round_index % 4
+        drawn = wall.pop()
+        hands[player_id].append(drawn)
+        add(player_id, ActionType.DRAW, card=MahjongCard.from_index(drawn))
+        discarded = hands[player_id].pop(rng.randrange(len(hands[player_id])))
+        add(player_id, ActionType.DISCARD, card=MahjongCard.from_index(discarded))
+
+    add(1, ActionType.PENG, card=MahjongCard.from_index(discarded), target_player=player_id, is_success=False)
+    add(2, ActionType.GANG, card=MahjongCard.from_index(hands[2][0]), gang_type=GangType.AN_GANG, score_change=2)
+    add(3, ActionType.PASS)
+    add(1, ActionType.HU, card=MahjongCard.from_index(discarded), target_player=player_id, score_change=-8)
+
+    record.snapshots = {5: {"current_player": 1, "scores": [0, -1, 2, 3], "note": "快照"}}
+    record.end_time = start_time + timedelta(minutes=12, microseconds=5)
+    record.duration = 720
+    record.total_actions = len(record.actions)
+    record.winner_count = 1
+    players[1].is_winner = True
+    players[1].hu_type = "清一色"
+    players[1].hu_sequence = len(record.actions)
+    players[1].final_score = 8
+    players[0].final_score = -8
+    players[0].deal_in_count = 1
+    return record
+
+
+def roundtrip(record: GameRecord) -> GameRecord:
+    return decode_compact_record(encode_compact_record(record))
+
+
+def assert_same_record(decoded: GameRecord, record: GameRecord):
+    """关键帧不写入二进制格式，其余字段应完全一致"""
+    assert decoded.model_dump(exclude={"keyframes"}) == record.model_dump(exclude={"keyframes"})
+
+
+def test_roundtrip_naive_timestamps():
+    record = make_record(datetime(2025, 6, 11, 23, 18, 14, 123456))
+    decoded = roundtrip(record)
+
+    assert_same_record(decoded, record)
+    assert decoded.start_time.tzinfo is None
+    assert decoded.actions[0].timestamp.tzinfo is None
+
+
+@pytest.mark.parametrize("tz", [timezone.utc, timezone(timedelta(hours=8))])
+def test_roundtrip_aware_timestamps(tz):
+    record = make_record(datetime(2025, 6, 11, 23, 18, 14, 654321, tzinfo=tz))
+    decoded = roundtrip(record)
+
+    # 带时区的时间统一按UTC保存，表示的时刻不变
+    assert_same_record(decoded, record)
+    assert decoded.start_time.utcoffset() == timedelta(0)
+    assert decoded.end_time == record.end_time
+
+
+def test_roundtrip_custom_card_ids():
+    record = make_record(datetime(2025, 1, 1))
+    record.players[0].initial_hand[0] = MahjongCard(id=107, suit="tong", value=9)
+    record.players[2].initial_hand[3] = MahjongCard(id=0, suit="wan", value=1)
+    record.actions[5].card = MahjongCard(id=100000, suit="tiao", value=5)
+    decoded = roundtrip(record)
+
+    assert_same_record(decoded, record)
+    assert decoded.players[0].initial_hand[0].id == 107
+    assert decoded.actions[5].card.id == 100000
+
+
+def test_roundtrip_failed_actions_and_optional_fields():
+    record = make_record(datetime(2025, 1, 1))
+    decoded = roundtrip(record)
+
+    peng, gang, passed, hu = decoded.actions[-4:]
+    assert not peng.is_success and peng.target_player is not None
+    assert gang.gang_type == GangType.AN_GANG and gang.score_change == 2
+    assert passed.card is None and passed.target_player is None and passed.score_change == 0
+    assert hu.score_change == -8
+    assert all(action.is_success for action in decoded.actions[:-4])
+
+
+def test_roundtrip_custom_missing_suit():
+    record = make_record(datetime(2025, 1, 1))
+    record.players[3].missing_suit = "自定义"
+    record.actions[3].missing_suit = "自定义"
+
+    assert_same_record(roundtrip(record), record)
+
+
+def test_snapshots_preserved_and_keyframes_rebuilt():
+    record = make_record(datetime(2025, 1, 1))
+    record.keyframes = ReplayStateReconstructor.build_keyframes(record)
+    assert record.keyframes
+
+    decoded = roundtrip(record)
+    assert decoded.snapshots == record.snapshots
+    assert decoded.keyframes == {}
+    assert ReplayStateReconstructor.build_keyframes(decoded) == record.keyframes
+
+
+def test_roundtrip_empty_game():
+    record = GameRecord(
+        game_id="empty",
+        start_time=datetime(2025, 1, 1),
+        players=[PlayerGameRecord(player_id=0, player_name="独自一人", position=0)]
+    )
+    assert_same_record(roundtrip(record), record)
+
+    no_players = GameRecord(game_id="", start_time=datetime(2025, 1, 1), players=[])
+    assert_same_record(roundtrip(no_players), no_players)
+
+
+def test_smaller_than_json():
+    record = make_record(datetime(2025, 6, 11, 23, 18, 14), rounds=40)
+    compact = encode_compact_record(record)
+    json_size = len(record.model_dump_json(exclude={"keyframes"}).encode("utf-8"))
+
+    assert len(compact) * 5 < json_size
+
+
+@pytest.mark.parametrize("data", [b"", b"XZRP", b"NOPE\x01\x00", b"XZRP\x63\x00"])
+def test_decode_rejects_invalid_data(data):
+    with pytest.raises(ValueError):
+        decode_compact_record(data)
+
+
+def test_decode_rejects_truncated_data():
+    data = encode_compact_record(make_record(datetime(2025, 1, 1)))
+    with pytest.raises(ValueError):
+        decode_compact_record(data[:len(data) // 2])
+
+
+def test_roundtrip_out_of_order_sequences_and_negative_deltas():
+    record = make_record(datetime(2025, 1, 1, 12))
+    record.actions[3].sequence, record.actions[7].sequence = record.actions[7].sequence, record.actions[3].sequence
+    record.actions[10].sequence = -2
+    # 导入的牌谱结束时间早于开始时间
+    record.end_time = record.start_time - timedelta(minutes=5)
+    record.duration = -300
+
+    assert_same_record(roundtrip(record), record)
+
+
+def test_decode_version_1_data():
+    # v1: 结束时间差、时长、序号差值为无符号变长整数
+    data = bytes.fromhex(
+        "585a5250" "01" "00"          # 魔数、版本1、标志
+        "0167" "0178"                  # game_id "g"、game_mode "x"
+        "00" "0b" "0b" "00" "00" "00" "10"  # 开始时间0、结束时间差10、时长10、人数/操作数/胡牌人数0、关键帧间隔16
+        "00"                           # 玩家数
+        "02" "03" "00" "00" "01" "00"  # 2个操作: 序号差3、时间差0、玩家0、摸牌、无可选字段
+        "02" "02" "00" "01" "00"       #          序号差2、时间差+1
+        "00"                           # 快照数
+    )
+    record = decode_compact_record(data)
+    assert record.end_time - record.start_time == timedelta(microseconds=10)
+    assert record.duration == 10
+    assert [action.sequence for action in record.actions] == [3, 5]
@@ -0,0 +1,42 @@
+"""实时通道消息帧编码"""
+
+import pytest
+
+from app.services.frame_codec import FRAME_JSON, FRAME_MSGPACK, compact_tiles, decode_frame, encode_frame
+
+
+def test_compact_tiles_plain_tile():
+    assert compact_tiles({"type": "tiao", "value": 5}) == 15
+
+
+def test_compact_tiles_tile_with_null_id():
+    # Tile 模型序列化后 id 为 null
+    state = {"tiles": [{"type": "wan", "value": 1, "id": None}, {"type": "tong", "value": 9, "id": None}]}
+    assert compact_tiles(state) == {"tiles": [1, 29]}
+
+
+def test_compact_tiles_keeps_tile_with_id():
+    tile = {"type": "wan", "value": 3, "id": "wan-3-2"}
+    assert compact_tiles({"tile": tile}) == {"tile": tile}
+
+
+def test_compact_tiles_keeps_other_dicts():
+    meld = {"type": "peng", "tiles": [{"type": "wan", "value": 2, "id": None}], "exposed": True}
+    assert compact_tiles(meld) == {"type": "peng", "tiles": [2], "exposed": True}
+    extra = {"type": "wan", "value": 4, "id": None, "source": 1}
+    assert compact_tiles(extra) == extra
+
+
+def test_json_frame_roundtrip():
+    message = {"type": "patch", "version": 3, "ops": [{"op": "add", "path": "/x", "value": {"type": "wan", "value": 1}}]}
+    assert decode_frame(encode_frame(message, FRAME_JSON)) == message
+
+
+def test_msgpack_frame_compacts_tiles():
+    pytest.importorskip("msgpack")
+    message = {"type": "patch", "version": 3, "ops": [
+        {"op": "add", "path": "/player_hands/0/tiles/-", "value": {"type": "tiao", "value": 7, "id": None}}
+    ]}
+    decoded = decode_frame(encode_frame(message, FRAME_MSGPACK))
+    assert decoded["type"] == "patch"
+    assert decoded["ops"][0]["value"] == 17
@@ -0,0 +1,70 @@
+"""批量牌操作的保存与回滚"""
+
+import pytest
+
+from app.models.mahjong import Tile, TileOperationRequest
+from app.services.mahjong_game_service import MahjongGameService
+
+
+class UnavailableRedis:
+    """测试中不连接Redis，保存失败时仍使用本地版本号"""
+
+    def get(self, key):
+        return None
+
+    def pipeline(self, *args, **kwargs):
+        raise ConnectionError("测试中不使用Redis")
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr("app.services.mahjong_game_service.redis.Redis", lambda **kwargs: UnavailableRedis())
+    service = MahjongGameService()
+    service.reset_game()
+    return service
+
+
+def hand(code: int) -> TileOperationRequest:
+    return TileOperationRequest(player_id=0, operation_type="hand", tile=Tile.from_code(code))
+
+
+def invalid() -> TileOperationRequest:
+    return TileOperationRequest(player_id=0, operation_type="unknown", tile=Tile.from_code(1))
+
+
+def hand_codes(service: MahjongGameService):
+    return sorted(Tile(**tile).to_code() for tile in service.get_game_state()["player_hands"]["0"]["tiles"])
+
+
+def test_atomic_batch_rolls_back(service):
+    version = service.get_state_version()
+    success, results = service.process_operations([hand(1), invalid(), hand(2)])
+
+    assert not success
+    assert [ok for ok, _ in results] == [True, False, False]
+    assert hand_codes(service) == []
+    assert service.get_state_version() == version
+    assert service.analysis_context.tile_count == 0
+
+
+def test_rollback_inside_outer_batch_keeps_outer_changes(service):
+    version = service.get_state_version()
+    with service.batch():
+        assert service.process_operation(hand(5))[0]
+        success, _ = service.process_operations([hand(6), invalid()])
+        assert not success
+        # 回滚后分析状态与恢复的状态一致
+        assert service.analysis_context.tile_count == 1
+
+    assert hand_codes(service) == [5]
+    assert service.get_state_version() == version + 1
+    assert service.sync.snapshot == service.get_game_state()
+
+
+def test_non_atomic_batch_saves_successful_operations(service):
+    version = service.get_state_version()
+    success, _ = service.process_operations([hand(1), invalid(), hand(2)], atomic=False)
+
+    assert not success
+    assert hand_codes(service) == [1, 2]
+    assert service.get_state_version() == version + 1
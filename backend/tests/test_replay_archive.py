@@ -0,0 +1,142 @@
+"""牌谱磁盘归档"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.game_record import ActionType, GameAction, GameRecord, MahjongCard, PlayerGameRecord
+from app.services.replay_archive import ReplayArchive
+
+
+def make_record(game_id: str, actions: int = 20) -> GameRecord:
+    start_time = datetime(2025, 6, 11, 23, 18, 14)
+    players = [
+        PlayerGameRecord(
+            player_id=i,
+            player_name=f"玩家{i + 1}",
+            position=i,
+            initial_hand=[MahjongCard.from_index((i * 13 + k) % 27) for k in range(13)]
+        )
+        for i in range(4)
+    ]
+    record = GameRecord(game_id=game_id, start_time=start_time, players=players)
+    for sequence in range(1, actions + 1):
+        record.actions.append(GameAction(
+            sequence=sequence,
+            timestamp=start_time + timedelta(seconds=sequence),
+            player_id=sequence % 4,
+            action_type=ActionType.DRAW if sequence % 2 else ActionType.DISCARD,
+            card=MahjongCard.from_index(sequence % 27)
+        ))
+    record.total_actions = actions
+    return record
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = ReplayArchive(str(tmp_path), compact_threshold=1000)
+    yield archive
+    archive.close()
+
+
+def test_append_and_get(archive):
+    record = make_record("g1")
+    archive.append(record)
+
+    loaded = archive.get("g1")
+    assert loaded.model_dump(exclude={"keyframes"}) == record.model_dump(exclude={"keyframes"})
+    assert archive.contains("g1")
+    assert archive.get("missing") is None
+    assert not archive.contains("missing")
+
+
+def test_append_again_replaces_record(archive):
+    archive.append(make_record("g1", actions=10))
+    archive.append(make_record("g1", actions=30))
+
+    assert len(archive.get("g1").actions) == 30
+
+
+def test_delete(archive):
+    archive.append(make_record("g1"))
+    archive.append(make_record("g2"))
+    archive.delete("g1")
+
+    assert archive.get("g1") is None
+    assert not archive.contains("g1")
+    assert archive.get("g2") is not None
+
+    # 删除后重新归档
+    archive.append(make_record("g1", actions=5))
+    assert len(archive.get("g1").actions) == 5
+
+
+def test_compact_keeps_records_and_drops_deleted(tmp_path, archive):
+    for i in range(10):
+        archive.append(make_record(f"g{i}"))
+    archive.delete("g3")
+    archive.compact()
+
+    assert (tmp_path / "index.journal").stat().st_size == 0
+    reopened = ReplayArchive(str(tmp_path))
+    assert reopened.get("g3") is None
+    assert [reopened.get(f"g{i}") is not None for i in range(10)] == [i != 3 for i in range(10)]
+    reopened.close()
+
+
+def test_automatic_compaction_and_segment_rollover(tmp_path):
+    archive = ReplayArchive(str(tmp_path), segment_max_bytes=2000, compact_threshold=4)
+    for i in range(12):
+        archive.append(make_record(f"g{i}"))
+
+    assert len(list(tmp_path.glob("segment_*.xzr"))) > 1
+    assert all(archive.get(f"g{i}").game_id == f"g{i}" for i in range(12))
+    archive.close()
+
+
+def test_delete_marker_seen_by_other_instance(tmp_path):
+    writer = ReplayArchive(str(tmp_path))
+    reader = ReplayArchive(str(tmp_path))
+    writer.append(make_record("g1"))
+
+    # 另一个实例查找时重新加载，并缓存该索引项
+    assert reader.get("g1") is not None
+    assert reader.contains("g1")
+
+    writer.delete("g1")
+    assert reader.get("g1") is None
+    assert not reader.contains("g1")
+
+    # 合并索引后仍然生效
+    writer.append(make_record("g2"))
+    writer.compact()
+    assert reader.get("g1") is None
+    assert reader.get("g2") is not None
+    writer.close()
+    reader.close()
+
+
+def test_compaction_keeps_entries_from_other_instance(tmp_path):
+    first = ReplayArchive(str(tmp_path))
+    second = ReplayArchive(str(tmp_path))
+    first.append(make_record("a"))
+    second.append(make_record("b"))
+    first.append(make_record("c"))
+
+    # first 合并前重新读取日志，second 写入的索引项不会丢失
+    first.compact()
+    reopened = ReplayArchive(str(tmp_path))
+    assert [reopened.get(game_id) is not None for game_id in ("a", "b", "c")] == [True, True, True]
+    assert second.get("b") is not None
+    for archive in (first, second, reopened):
+        archive.close()
+
+
+def test_unreadable_record_returns_none(tmp_path, archive):
+    archive.append(make_record("g1"))
+    segment = next(tmp_path.glob("segment_*.xzr"))
+    data = bytearray(segment.read_bytes())
+    data[4:8] = b"\xff\xff\xff\xff"
+    segment.write_bytes(bytes(data))
+
+    assert archive.get("g1") is None
@@ -0,0 +1,127 @@
+"""回放状态重建: 从关键帧定位与从头重放一致"""
+
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.models.game_record import ActionType, GangType, MahjongCard
+from app.services.replay_service import ReplayService
+from app.services.replay_state import ReplayState, ReplayStateReconstructor
+
+KEYFRAME_INTERVAL = 4
+
+
+class FakeRedisClient:
+    async def zadd(self, key, mapping):
+        return len(mapping)
+
+
+class FakeRedisService:
+    def __init__(self):
+        self.client = FakeRedisClient()
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(settings, "REPLAY_KEYFRAME_INTERVAL", KEYFRAME_INTERVAL)
+    monkeypatch.setattr(settings, "REPLAY_ARCHIVE_ENABLED", False)
+
+    async def save_game_record(self, game_record):
+        pass
+
+    monkeypatch.setattr(ReplayService, "_save_game_record", save_game_record)
+    return ReplayService(FakeRedisService())
+
+
+def card(index: int) -> MahjongCard:
+    return MahjongCard.from_index(index)
+
+
+def initial_hand(player_id: int):
+    return [card((player_id * 7 + k) % 27) for k in range(13)]
+
+
+# (玩家, 操作, 牌, 目标玩家, 杠类型, 定缺, 分数变化)
+SCRIPT = [
+    (0, ActionType.MISSING_SUIT, None, None, None, "tiao", 0),
+    (1, ActionType.MISSING_SUIT, None, None, None, "tong", 0),
+    (2, ActionType.MISSING_SUIT, None, None, None, "wan", 0),
+    (3, ActionType.MISSING_SUIT, None, None, None, "tiao", 0),
+    (0, ActionType.DRAW, 5, None, None, None, 0),
+    (0, ActionType.DISCARD, 7, None, None, None, 0),
+    (1, ActionType.PENG, 7, 0, None, None, 0),
+    (1, ActionType.DISCARD, 9, None, None, None, 0),
+    (2, ActionType.DRAW, 14, None, None, None, 0),
+    (2, ActionType.DISCARD, 14, None, None, None, 0),
+    (3, ActionType.GANG, 14, 2, GangType.MING_GANG, None, 2),
+    (3, ActionType.DRAW, 20, None, None, None, 0),
+    (3, ActionType.DISCARD, 20, None, None, None, 0),
+    (0, ActionType.DRAW, 3, None, None, None, 0),
+    (0, ActionType.GANG, 3, None, GangType.AN_GANG, None, 6),
+    (0, ActionType.DRAW, 12, None, None, None, 0),
+    (0, ActionType.DISCARD, 12, None, None, None, 0),
+    (1, ActionType.DRAW, 7, None, None, None, 0),
+    (1, ActionType.GANG, 7, None, GangType.JIA_GANG, None, 3),
+    (1, ActionType.DRAW, 22, None, None, None, 0),
+    (1, ActionType.DISCARD, 22, None, None, None, 0),
+    (2, ActionType.HU, 22, 1, None, None, 8),
+    (3, ActionType.DRAW, 25, None, None, None, 0),
+    (3, ActionType.DISCARD, 25, None, None, None, 0),
+    (0, ActionType.DRAW, 26, None, None, None, 0),
+    (0, ActionType.HU, 26, None, None, None, 12),
+]
+
+
+async def record_actions(service: ReplayService, game_id: str, script):
+    for player_id, action_type, card_index, target, gang_type, missing_suit, score in script:
+        await service.record_action(
+            game_id,
+            player_id,
+            action_type,
+            card=card(card_index) if card_index is not None else None,
+            target_player=target,
+            gang_type=gang_type,
+            missing_suit=missing_suit,
+            score_change=score
+        )
+
+
+def assert_seek_matches_full_replay(game_record):
+    state = ReplayState.initial(game_record)
+    expected = [state.to_view()]
+    for action in game_record.actions:
+        state.apply(action)
+        expected.append(state.to_view())
+
+    assert game_record.keyframes
+    for sequence in range(len(game_record.actions) + 1):
+        assert ReplayStateReconstructor.reconstruct(game_record, sequence).to_view() == expected[sequence]
+
+
+def test_reconstruct_matches_full_replay(service):
+    async def scenario():
+        game_record = await service.start_game_recording("g1", [{"name": f"玩家{i}"} for i in range(4)])
+        for player_id in range(4):
+            await service.record_initial_hand("g1", player_id, initial_hand(player_id))
+        await record_actions(service, "g1", SCRIPT)
+        return game_record
+
+    game_record = asyncio.run(scenario())
+    assert_seek_matches_full_replay(game_record)
+
+
+def test_reconstruct_after_late_initial_hands(service):
+    async def scenario():
+        game_record = await service.start_game_recording("g2", [{"name": f"玩家{i}"} for i in range(4)])
+        # 起手牌在已记录若干操作(且已生成关键帧)之后才写入
+        await record_actions(service, "g2", SCRIPT[:10])
+        assert game_record.keyframes
+        for player_id in range(4):
+            await service.record_initial_hand("g2", player_id, initial_hand(player_id))
+        await record_actions(service, "g2", SCRIPT[10:])
+        return game_record
+
+    game_record = asyncio.run(scenario())
+    assert game_record.keyframes == ReplayStateReconstructor.build_keyframes(game_record)
+    assert_seek_matches_full_replay(game_record)
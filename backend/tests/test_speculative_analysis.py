@@ -0,0 +1,76 @@
+"""推测式后台分析"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.algorithms.mahjong_analyzer import MahjongAnalyzer
+from app.api import mahjong as mahjong_api
+from app.models.mahjong import GameRequest, GameState, Tile
+from app.services.analysis_coalescer import analysis_key
+from app.services.speculative_analysis import SpeculativeAnalyzer
+
+HAND = [1, 2, 3, 4, 5, 6, 11, 12, 14, 21, 22, 24, 27, 29]
+
+
+def make_snapshot(codes):
+    return {
+        "game_id": "speculative",
+        "player_hands": {"0": {"tiles": [Tile.from_code(code).model_dump(mode="json") for code in codes], "melds": []}},
+        "discarded_tiles": []
+    }
+
+
+def wait_for(analyzer: SpeculativeAnalyzer, version: int, timeout: float = 10.0):
+    end = time.monotonic() + timeout
+    while analyzer.result_for_version(version) is None:
+        assert time.monotonic() < end, "后台分析超时"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def speculative():
+    analyzer = SpeculativeAnalyzer(MahjongAnalyzer(), player_id=0, deadline_ms=50)
+    yield analyzer
+    analyzer.shutdown()
+
+
+def test_caches_quick_and_deadline_results(speculative):
+    snapshot = make_snapshot(HAND)
+    speculative.on_state_change(1, snapshot)
+    wait_for(speculative, 1)
+
+    game_state = GameState(**snapshot)
+    quick = speculative.lookup(analysis_key(game_state, 0))
+    deep = speculative.lookup(analysis_key(game_state, 0, 50))
+    assert quick is not None and quick.work is None
+    assert deep is not None and deep.work["deadline_ms"] == 50
+    assert speculative.result_for_version(1) is deep
+
+
+def test_skips_hands_not_waiting_to_discard(speculative):
+    speculative.on_state_change(1, make_snapshot(HAND[:13]))
+    assert speculative.get_metrics()["scheduled"] == 0
+
+
+def test_default_analyze_request_served_from_cache(speculative, monkeypatch):
+    snapshot = make_snapshot(HAND)
+    speculative.on_state_change(1, snapshot)
+    wait_for(speculative, 1)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("应直接返回后台分析结果")
+
+    monkeypatch.setattr(mahjong_api, "speculative_analyzer", speculative)
+    monkeypatch.setattr(mahjong_api.analyzer, "analyze_game_state", fail)
+
+    response = asyncio.run(mahjong_api.analyze_game(GameRequest(game_state=GameState(**snapshot))))
+    assert response.success
+    assert response.analysis == speculative.lookup(analysis_key(GameState(**snapshot), 0))
+    assert response.analysis.work is None
+    assert speculative.get_metrics()["hits"] >= 1
+
+    # 与后台预算不同的请求不使用缓存
+    with pytest.raises(Exception):
+        asyncio.run(mahjong_api.analyze_game(GameRequest(game_state=GameState(**snapshot), deadline_ms=80)))
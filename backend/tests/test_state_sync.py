@@ -0,0 +1,135 @@
+"""游戏状态增量的生成与应用"""
+
+import json
+import random
+from copy import deepcopy
+
+import pytest
+
+from app.services.state_sync import StateSync, apply_patch, compute_patch
+
+
+def tile(value, suit="wan", tile_id=None):
+    return {"type": suit, "value": value, "id": tile_id or f"{suit}-{value}"}
+
+
+def roundtrip(old, new):
+    ops = compute_patch(old, new)
+    assert apply_patch(deepcopy(old), deepcopy(ops)) == new
+    return ops
+
+
+def test_unchanged_state_has_no_ops():
+    state = {"tile_pool": [tile(1), tile(2)], "current_player": 0}
+    assert compute_patch(state, deepcopy(state)) == []
+
+
+def test_append_uses_dash_path():
+    ops = roundtrip({"discarded_tiles": [tile(1)]}, {"discarded_tiles": [tile(1), tile(2), tile(3)]})
+    assert [op["path"] for op in ops] == ["/discarded_tiles/-"] * 2
+
+
+def test_tail_pop_removes_single_index():
+    pool = [tile(value, suit, f"{suit}-{value}-{n}") for suit in ("wan", "tiao", "tong")
+            for value in range(1, 10) for n in range(4)]
+    old = {"tile_pool": pool}
+    new = {"tile_pool": pool[:-1]}
+
+    ops = roundtrip(old, new)
+    assert ops == [{"op": "remove", "path": f"/tile_pool/{len(pool) - 1}"}]
+    # 摸一张牌的增量远小于整个牌池
+    assert len(json.dumps(ops)) * 20 < len(json.dumps(pool))
+
+
+def test_tail_truncation_removes_from_the_end():
+    ops = roundtrip({"log": [1, 2, 3, 4, 5]}, {"log": [1, 2]})
+    assert [op["path"] for op in ops] == ["/log/4", "/log/3", "/log/2"]
+
+
+def test_middle_removal_and_insertion():
+    hand = [tile(value) for value in range(1, 10)]
+    discarded = hand[:4] + hand[5:]
+    ops = roundtrip({"tiles": hand}, {"tiles": discarded})
+    assert ops == [{"op": "remove", "path": "/tiles/4"}]
+
+    ops = roundtrip({"tiles": discarded}, {"tiles": hand})
+    assert ops == [{"op": "add", "path": "/tiles/4", "value": hand[4]}]
+
+
+def test_single_element_change_is_index_level():
+    hand = [tile(value) for value in range(1, 10)]
+    changed = deepcopy(hand)
+    changed[2]["id"] = "renamed"
+
+    ops = roundtrip({"tiles": hand}, {"tiles": changed})
+    assert ops == [{"op": "replace", "path": "/tiles/2/id", "value": "renamed"}]
+
+
+def test_large_rewrite_replaces_whole_list():
+    ops = roundtrip({"tiles": [1, 2, 3, 4]}, {"tiles": [5, 6, 7, 8]})
+    assert ops == [{"op": "replace", "path": "/tiles", "value": [5, 6, 7, 8]}]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_list_edits_roundtrip(seed):
+    rng = random.Random(seed)
+    old = [rng.randrange(6) for _ in range(rng.randrange(12))]
+    for _ in range(50):
+        new = list(old)
+        edit = rng.randrange(4)
+        if edit == 0 and new:
+            del new[rng.randrange(len(new))]
+        elif edit == 1:
+            new.insert(rng.randrange(len(new) + 1), rng.randrange(6))
+        elif edit == 2 and new:
+            new = new[:rng.randrange(len(new))]
+        elif new:
+            new[rng.randrange(len(new))] = rng.randrange(6)
+        roundtrip({"items": old}, {"items": new})
+        old = new
+
+
+def test_commit_uses_assigned_version():
+    sync = StateSync()
+    sync.load(json.dumps({"current_player": 0}))
+
+    version, ops = sync.commit(json.dumps({"current_player": 1}), lambda: 1)
+    assert version == 1
+    assert ops == [{"op": "replace", "path": "/current_player", "value": 1}]
+
+
+def test_commit_with_version_gap_sends_full_state():
+    sync = StateSync()
+    sync.load(json.dumps({"current_player": 0}))
+
+    # 其他进程已提交版本1，本进程分配到版本2
+    new_state = {"current_player": 2}
+    version, ops = sync.commit(json.dumps(new_state), lambda: 2)
+    assert version == 2
+    assert ops == [{"op": "replace", "path": "", "value": new_state}]
+    assert apply_patch({"current_player": 1}, ops) == new_state
+    assert sync.changes_since(1) == [(2, ops)]
+
+
+def test_commit_falls_back_to_local_version():
+    sync = StateSync(version=5)
+    sync.load(json.dumps({"current_player": 0}))
+
+    assert sync.commit(json.dumps({"current_player": 1}), lambda: None)[0] == 6
+    # 没有变化时不分配版本号
+    assert sync.commit(json.dumps({"current_player": 1}), lambda: pytest.fail("不应分配版本号")) is None
+
+
+@pytest.mark.parametrize("old_value, new_value", [(True, 1), (0, False), (1, 1.0), (0.0, 0)])
+def test_bool_int_float_changes_are_kept(old_value, new_value):
+    ops = roundtrip({"flag": old_value}, {"flag": new_value})
+    assert ops == [{"op": "replace", "path": "/flag", "value": new_value}]
+    assert type(apply_patch({"flag": old_value}, deepcopy(ops))["flag"]) is type(new_value)
+
+
+def test_list_ops_distinguish_bool_and_int():
+    old = {"items": [1, True, 0]}
+    for new in ({"items": [1, True, 0, False]}, {"items": [True, True, 0]}, {"items": [1, 1, 0]},
+                {"items": [1, True]}, {"items": [1, 0]}, {"items": [True, 1, True, 0]}):
+        result = apply_patch(deepcopy(old), deepcopy(compute_patch(old, new)))
+        assert json.dumps(result) == json.dumps(new)